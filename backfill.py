@@ -0,0 +1,77 @@
+"""回填历史数据，按日期范围并发处理，中断后重新运行同一命令即可续跑。
+
+    python backfill.py football_match 2019-06-01 2019-06-30 --workers 4
+
+create:   2026-10-18
+modified:
+"""
+
+import os
+import argparse
+import datetime
+
+from crash import backfill, log
+
+from football_match_schedule import FootballMatchScheduleSpider
+from football_bet import FootballBetSpider
+from football_match import FootballMatchSpider
+from football_live import FootballLiveSpider
+from betfair import BetfairSpider
+
+from config import *
+
+log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+log.logger.log_uncaught()
+
+# 请求参数中带日期的爬虫，日期对应足球竞彩的一天或必发的一期
+SPIDERS = {
+    'football_match_schedule': FootballMatchScheduleSpider,
+    'football_bet': FootballBetSpider,
+    'football_match': FootballMatchSpider,
+    'football_live': FootballLiveSpider,
+    'betfair': BetfairSpider,
+}
+
+
+def parse_date(s: str) -> datetime.date:
+    return datetime.datetime.strptime(s, '%Y-%m-%d').date()
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='回填历史数据')
+    parser.add_argument('spider', choices=SPIDERS)
+    parser.add_argument('start', type=parse_date, help='开始日期，如 2019-06-01')
+    parser.add_argument('end', type=parse_date, help='结束日期（包括），如 2019-06-30')
+    parser.add_argument('--workers', type=int, default=THREAD_NUM, help='同时处理的天数')
+    parser.add_argument('--checkpoint', help='检查点文件，默认 log/backfill_<spider>.json')
+    args = parser.parse_args()
+
+    if args.end < args.start:
+        parser.error('结束日期早于开始日期')
+
+    path = args.checkpoint or os.path.join('log', f'backfill_{args.spider}.json')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    checkpoint = backfill.Checkpoint(path)
+
+    dates = backfill.date_range(args.start, args.end)
+    log.logger.info(f'回填 {args.spider} {args.start} ~ {args.end}，共 {len(dates)} 天，'
+                    f'检查点 {path} 中已完成 {len(checkpoint)} 天')
+
+    try:
+        stats = backfill.run_backfill(
+            SPIDERS[args.spider], MYSQL_CONFIG, dates, args.workers, checkpoint
+        )
+    except KeyboardInterrupt:
+        log.logger.warning('已中断，重新运行同一命令可续跑')
+        exit(1)
+
+    log.logger.info(f'回填结束，完成 {stats["done"]} 天，失败 {stats["failed"]} 天，跳过 {stats["skipped"]} 天')
+    if stats['failed']:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
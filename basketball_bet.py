@@ -7,9 +7,7 @@ modified:
 import warnings
 import datetime
 
-from lxml import etree
-
-from crash import spider, log
+from crash import spider, log, htmlstream
 from crash.types import *
 from basketball_match_schedule import BasketballMatchScheduleSpider
 
@@ -20,6 +18,8 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
 
 
 class BasketballBetSpider(BasketballMatchScheduleSpider):
@@ -56,33 +56,48 @@ class BasketballBetSpider(BasketballMatchScheduleSpider):
     def run(self) -> None:
 
         today_format = datetime.date.today().strftime('%Y%m%d')
+        self.warm(today_format)
+
         url = self.url_temp
         r = self.session.get(url)
 
-        for item in self.parse(r.text, today_format):
-            item.pop('home_rank')
-            item.pop('visitor_rank')
+        # 直接解析响应的字节，不解码成 str
+        for item in self.timed('parse', self.parse(r.content, today_format, r.encoding)):
+            self.save(item)
+
+    def warm(self, date_format: str) -> None:
+        """读取当天已有数据，用于跳过没有变化的写入"""
+
+        self.warm_last_written(MYSQL_TABLE_BASKETBALL_BET, f"id LIKE '{date_format}%'")
+
+    def save(self, item: Dict) -> None:
+        item.pop('home_rank')
+        item.pop('visitor_rank')
 
-            if item['compete_time'] == '未赛':
-                update_field = self.UPDATE_FIELD
-            else:
-                update_field = self.AFTER_MATCH_START_UPDATE_FIELD
+        if item['compete_time'] == '未赛':
+            update_field = self.UPDATE_FIELD
+        else:
+            update_field = self.AFTER_MATCH_START_UPDATE_FIELD
 
-            log.logger.debug(item)
+        log.logger.debug(item)
 
-            self.insert_or_update(
-                MYSQL_TABLE_BASKETBALL_BET,
-                item,
-                update_field
-            )
+        self.insert_or_update(
+            MYSQL_TABLE_BASKETBALL_BET,
+            item,
+            update_field
+        )
 
     @classmethod
-    def parse(cls, html: str, date_format: str) -> Iterator[Dict]:
+    def parse(cls,
+              html: Union[bytes, str],
+              date_format: str,
+              encoding: Optional[str] = None) -> Iterator[Dict]:
+        """流式解析，页面上有几百个联赛的表格，每个解析完即释放，不建完整的 DOM"""
 
-        selector = etree.HTML(html)
-        table_all_element = selector.xpath('.//div[@class="table-all"]')[0]
+        # 不关注的联赛的表格在流式解析时就过滤掉、释放
+        tables = htmlstream.iter_elements(html, 'table', cls._is_league_table, encoding, discard=cls._is_table)
 
-        for item in cls._parse(table_all_element, date_format):
+        for item in cls._parse(tables, date_format):
             yield item
 
 
@@ -0,0 +1,47 @@
+"""篮球即时比分和竞彩，jsbf.html 只请求、解析一次，分别写入 basketball_match 和 basketball_bet
+
+create:   2026-10-18
+modified:
+"""
+
+import warnings
+
+from crash import spider, log
+from crash.types import *
+from basketball_bet import BasketballBetSpider
+from basketball_match import BasketballMatchSpider
+
+from config import *
+
+# 将警告提升为异常，若字段类型不合法，pymysql 只会发出警告
+# 提升为异常，可以过滤掉不符合字段类型的数据
+warnings.filterwarnings('error')
+
+log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+
+class BasketballLiveSpider(BasketballMatchSpider):
+
+    def warm(self, date_format: str) -> None:
+        BasketballBetSpider.warm(self, date_format)
+        BasketballMatchSpider.warm(self, date_format)
+
+    def save(self, item: Dict) -> None:
+        # 各表按自己的规则更新，basketball_bet 会删掉一些字段，传副本
+        BasketballBetSpider.save(self, dict(item))
+        BasketballMatchSpider.save(self, item)
+
+
+def main() -> None:
+
+    spider.run_spider(
+        1,
+        BasketballLiveSpider,
+        MYSQL_CONFIG
+    )
+
+
+if __name__ == '__main__':
+    main()
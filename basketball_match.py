@@ -5,7 +5,6 @@ modified:
 """
 
 import warnings
-import datetime
 
 from crash import spider, log
 from crash.types import *
@@ -18,6 +17,8 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
 
 
 class BasketballMatchSpider(BasketballBetSpider):
@@ -28,19 +29,16 @@ class BasketballMatchSpider(BasketballBetSpider):
 
         super().__init__(name, mysql_config)
 
-    def run(self) -> None:
+    def warm(self, date_format: str) -> None:
+        self.warm_last_written(MYSQL_TABLE_BASKETBALL_MATCH, f"id LIKE '{date_format}%'")
 
-        today_format = datetime.date.today().strftime('%Y%m%d')
-        url = self.url_temp
-        r = self.session.get(url)
-
-        for item in self.parse(r.text, today_format):
-            log.logger.debug(item)
-            self.insert_or_update(
-                MYSQL_TABLE_BASKETBALL_MATCH,
-                item,
-                self.UPDATE_FIELD
-            )
+    def save(self, item: Dict) -> None:
+        log.logger.debug(item)
+        self.insert_or_update(
+            MYSQL_TABLE_BASKETBALL_MATCH,
+            item,
+            self.UPDATE_FIELD
+        )
 
 
 def main() -> None:
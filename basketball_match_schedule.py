@@ -11,7 +11,7 @@ from urllib import parse
 
 from lxml import etree
 
-from crash import spider, log
+from crash import spider, log, ratelimit, sessions, metrics, feed, htmlstream
 from crash.types import *
 
 from helper import clear_float_zero
@@ -22,6 +22,14 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+ratelimit.set_rate_limit(RATE_LIMIT, RATE_LIMIT_DIR)
+sessions.set_recorder(HTTP_RECORD_PATH)
+sessions.set_base_url(HTTP_BASE_URL)
+metrics.set_export_path(METRICS_PATH)
+feed.set_feed_path(FEED_PATH, FEED_SEGMENT_BYTES, FEED_MAX_SEGMENTS)
 
 
 class BasketballMatchScheduleSpider(spider.MultiThreadSpider):
@@ -48,6 +56,12 @@ class BasketballMatchScheduleSpider(spider.MultiThreadSpider):
     # 球队排名字符串中可能还带联赛名，只提取排名
     RE_FIND_NUM = re.compile(r'\d+')
 
+    # 批量写入
+    BATCH_SIZE = MYSQL_BATCH_SIZE
+    BATCH_INTERVAL = MYSQL_BATCH_INTERVAL
+
+    RUN_DEADLINE = SPIDER_RUN_DEADLINE
+
     def __init__(self,
                  name: str,
                  mysql_config: MysqlConfig) -> None:
@@ -57,9 +71,13 @@ class BasketballMatchScheduleSpider(spider.MultiThreadSpider):
     def run(self) -> None:
 
         url = self.url_temp
-        r = self.session.get(url)
+        # 日程页面经常不变，没变化时不解析、不入库
+        r = self.session.get_if_changed(url)
+        if r is None:
+            return
 
-        for item in self.parse(r.text):
+        # 直接解析响应的字节，不解码成 str
+        for item in self.timed('parse', self.parse(r.content, r.encoding)):
             log.logger.debug(item)
             self.insert_or_update(
                 MYSQL_TABLE_BASKETBALL_MATCH_SCHEDULE,
@@ -67,187 +85,256 @@ class BasketballMatchScheduleSpider(spider.MultiThreadSpider):
                 self.UPDATE_FIELD
             )
 
+        # 都写入后才记下本次的页面，中途失败的下次重新处理
+        self.flush()
+        self.session.commit_digest(url)
+
     @classmethod
-    def parse(cls, html: str) -> Iterator[Dict]:
+    def parse(cls, html: Union[bytes, str], encoding: Optional[str] = None) -> Iterator[Dict]:
+        """流式解析，与 `BasketballBetSpider.parse` 相同，不建完整的 DOM"""
 
-        selector = etree.HTML(html)
-        table_all_element = selector.xpath('.//div[@class="table-all"]')[0]
+        elements = htmlstream.iter_elements(
+            html, ('a', 'table'), cls._is_present_or_table, encoding, discard=cls._is_table
+        )
+
+        # 当前日期的链接不一定在比赛表格之前，之前的表格解析后先缓存，取到日期后再产出
+        date_format = None
+        pending: List[Dict] = []
+        i = 0
+        for element in elements:
+            if element.tag == 'a':
+                date_format = cls._present_date(element.get('href'))
+                for j, item in enumerate(pending, 1):
+                    yield cls._schedule_item(cls._dated(item, j, date_format))
+                pending = []
+                continue
+
+            for item in cls._parse_tables([element]):
+                i += 1
+                if date_format is None:
+                    pending.append(item)
+                else:
+                    yield cls._schedule_item(cls._dated(item, i, date_format))
+
+        if date_format is None:
+            raise ValueError('页面中没有当前日期的链接')
+
+    @staticmethod
+    def _present_date(url: str) -> str:
+        """从当前日期的链接中提取日期，如 20190616"""
 
-        # 从 url 中提取当前日期
-        url = table_all_element.xpath('//div[@class="ul_f"]/a[@class="present"]/@href')[0]
         date_format = parse.parse_qs(parse.urlparse(url).query)['dateStr'][0]
         # 做一些转换
         dt = datetime.datetime.strptime(date_format, '%Y-%m-%d')
-        date_format = dt.strftime('%Y%m%d')
-
-        for item in cls._parse(table_all_element, date_format):
-
-            yield {
-                'remote_id': item['remote_id'],
-                'id': item['id'],
-                'league': item['league'],
-                'start_time': item['start_time'],
-                'home_name': item['home_name'],
-                'visitor_name': item['visitor_name'],
-                'home_rank': item['home_rank'],
-                'visitor_rank': item['visitor_rank'],
-                'win_odds': item['win_odds'],
-                'lose_odds': item['lose_odds'],
-                'handicap': item['handicap'],
-                'home_handicap_odds': item['home_handicap_odds'],
-                'visitor_handicap_odds': item['visitor_handicap_odds'],
-                'handicap_total': item['handicap_total'],
-                'home_handicap_total_odds': item['home_handicap_total_odds'],
-                'visitor_handicap_total_odds': item['visitor_handicap_total_odds'],
-            }
+        return dt.strftime('%Y%m%d')
+
+    @staticmethod
+    def _schedule_item(item: Dict) -> Dict:
+        """日程表只要这些字段，顺序与入库的一致"""
+
+        return {
+            'remote_id': item['remote_id'],
+            'id': item['id'],
+            'league': item['league'],
+            'start_time': item['start_time'],
+            'home_name': item['home_name'],
+            'visitor_name': item['visitor_name'],
+            'home_rank': item['home_rank'],
+            'visitor_rank': item['visitor_rank'],
+            'win_odds': item['win_odds'],
+            'lose_odds': item['lose_odds'],
+            'handicap': item['handicap'],
+            'home_handicap_odds': item['home_handicap_odds'],
+            'visitor_handicap_odds': item['visitor_handicap_odds'],
+            'handicap_total': item['handicap_total'],
+            'home_handicap_total_odds': item['home_handicap_total_odds'],
+            'visitor_handicap_total_odds': item['visitor_handicap_total_odds'],
+        }
+
+    # 以下 XPath 预先编译，所有表格、所有子类共用，相对表格
+    XPATH_LEAGUE = etree.XPath('./thead/tr/th[1]/a/text()', smart_strings=False)
+    XPATH_LEAGUE_TEXT = etree.XPath('./thead/tr/th[1]/text()', smart_strings=False)
+    XPATH_REMOTE_ID = etree.XPath('./@id', smart_strings=False)
+    XPATH_START_TIME = etree.XPath('./tbody/tr[1]/td[1]/text()', smart_strings=False)
+    XPATH_COMPETE_TIME = etree.XPath('./thead/tr/th[2]/text()', smart_strings=False)
+
+    # 队名在 <a> 中，没有 <a> 时直接在 td 中，主客队相同
+    XPATH_HOME_NAME = etree.XPath('./tbody/tr[1]/td[2]/a/text()', smart_strings=False)
+    XPATH_VISITOR_NAME = etree.XPath('./tbody/tr[2]/td[1]/a/text()', smart_strings=False)
+    XPATH_HOME_NAME_TEXT = etree.XPath('./tbody/tr[1]/td[2]/text()', smart_strings=False)
+    XPATH_VISITOR_NAME_TEXT = etree.XPath('./tbody/tr[2]/td[1]/text()', smart_strings=False)
+
+    XPATH_HOME_RANK = etree.XPath('./tbody/tr[1]/td/span[contains(@class," show_rank")]/text()', smart_strings=False)
+    XPATH_VISITOR_RANK = etree.XPath('./tbody/tr[2]/td/span[contains(@class," show_rank")]/text()', smart_strings=False)
+
+    XPATH_WIN_ODDS = etree.XPath('./tbody/tr[1]/td[@tag="hEurOdds"]/a/text()', smart_strings=False)
+    XPATH_LOSE_ODDS = etree.XPath('./tbody/tr[2]/td[@tag="gEurOdds"]/a/text()', smart_strings=False)
+
+    XPATH_HANDICAP = etree.XPath('./tbody/tr[1]/td[starts-with(@tag, "rfOdds")]/span[1]/a/text()', smart_strings=False)
+    XPATH_HANDICAP2 = etree.XPath('./tbody/tr[2]/td[starts-with(@tag, "rfOdds")]/span[1]/a/text()', smart_strings=False)
+    XPATH_HOME_HANDICAP_ODDS = etree.XPath('./tbody/tr[1]/td[@tag="hRfOdds"]/span[1]/a/text()', smart_strings=False)
+    XPATH_VISITOR_HANDICAP_ODDS = etree.XPath('./tbody/tr[2]/td[@tag="gRfOdds"]/span[1]/a/text()', smart_strings=False)
+
+    XPATH_HANDICAP_TOTAL = etree.XPath('./tbody/tr[1]/td[@tag="dxfOdds"]/span[1]/a/text()', smart_strings=False)
+    XPATH_HOME_HANDICAP_TOTAL_ODDS = etree.XPath('./tbody/tr[1]/td[@tag="hDxfOdds"]/span[1]/a/text()', smart_strings=False)
+    XPATH_VISITOR_HANDICAP_TOTAL_ODDS = etree.XPath('./tbody/tr[2]/td[@tag="gDxfOdds"]/span[1]/a/text()', smart_strings=False)
+
+    # 各节及总比分，(字段, XPath)，顺序与入库的一致，'-' 表示还没有比分
+    SCORE_FIELDS = tuple(
+        (f'{side}_{field}', etree.XPath(f'./tbody/tr[{row}]/td[@tag="{prefix}{tag}"]/text()', smart_strings=False))
+        for tag, field in (
+            ('Score1', 'quarter_one'),
+            ('Score2', 'quarter_two'),
+            ('Score3', 'quarter_three'),
+            ('Score4', 'quarter_four'),
+            ('TotalScore', 'total_score'),
+        )
+        for row, side, prefix in ((1, 'home', 'h'), (2, 'visitor', 'g'))
+    )
+
+    # 是否关注的联赛的表格，联赛名在 <a> 中，没有 <a> 时直接在 th 中。
+    # 由 `LEAGUE_FILTER` 生成，各类第一次用时编译，见 `_league_table_xpath`
+    XPATH_LEAGUE_TABLE_TEMPLATE = (
+        'boolean(self::table[thead/tr/th[1][a/text()][contains("{leagues}", concat("|", normalize-space(a/text()), "|"))]'
+        ' or thead/tr/th[1][not(a/text())][contains("{leagues}", concat("|", normalize-space(text()), "|"))]])'
+    )
 
     @classmethod
-    def _parse(cls, selector, date_format: str) -> Iterator[Dict]:
+    def _league_table_xpath(cls) -> etree.XPath:
+        """子类改了 `LEAGUE_FILTER` 时各自编译一次"""
 
-        i = 0
-        for table in selector:
+        xpath = cls.__dict__.get('_xpath_league_table')
+        if xpath is None:
+            leagues = '|{}|'.format('|'.join(sorted(cls.LEAGUE_FILTER)))
+            xpath = etree.XPath(cls.XPATH_LEAGUE_TABLE_TEMPLATE.format(leagues=leagues))
+            cls._xpath_league_table = xpath
+        return xpath
+
+    @staticmethod
+    def _is_table(element) -> bool:
+        """流式解析时，table-all 下的每个表格是一场比赛"""
+
+        parent = element.getparent()
+        return parent is not None and parent.get('class') == 'table-all'
+
+    @classmethod
+    def _is_league_table(cls, element) -> bool:
+        """关注的联赛的比赛表格，页面上几百个表格大多在这里就过滤掉，不逐个解析联赛名"""
+
+        return cls._is_table(element) and cls._league_table_xpath()(element)
+
+    @classmethod
+    def _is_present_or_table(cls, element) -> bool:
+        """流式解析日程时，还要取 ul_f 中当前日期的链接"""
+
+        if element.tag == 'table':
+            return cls._is_league_table(element)
+
+        parent = element.getparent()
+        return element.get('class') == 'present' and parent is not None and parent.get('class') == 'ul_f'
+
+    @classmethod
+    def _parse(cls, tables: Iterable, date_format: str) -> Iterator[Dict]:
+        """`tables` 中不是 `LEAGUE_FILTER` 联赛的表格会被跳过"""
+
+        for i, item in enumerate(cls._parse_tables(tables), 1):
+            yield cls._dated(item, i, date_format)
+
+    @staticmethod
+    def _dated(item: Dict, i: int, date_format: str) -> Dict:
+        """`item` 是当天第 `i` 场关注的比赛，补上 id 和开始时间中的年份"""
+
+        item['id'] = f'{date_format}{i:0>3d}'  # 左填充 0
+        item['start_time'] = f'{date_format[:4]}-{item["start_time"]}'
+
+        return item
+
+    @classmethod
+    def _parse_tables(cls, tables: Iterable) -> Iterator[Dict]:
+        """解析表格，还不知道日期，id 待 `_dated` 补上"""
+
+        for table in tables:
             # 联赛名
-            xpath_str = './thead/tr/th[1]/a/text()'
-            league = table.xpath(xpath_str)
+            league = cls.XPATH_LEAGUE(table)
             if league:
                 league = league[0].strip()
             else:
-                xpath_str = './thead/tr/th[1]/text()'
-                league = table.xpath(xpath_str)[0].strip()
+                league = cls.XPATH_LEAGUE_TEXT(table)[0].strip()
 
-            if league in cls.LEAGUE_FILTER:
-                i += 1
+            if league not in cls.LEAGUE_FILTER:
+                continue
 
-                # 对方数据库中的比赛 id，可用于去重
-                remote_id = table.xpath('./@id')[0].lstrip('t_')
+            # 对方数据库中的比赛 id，可用于去重
+            remote_id = cls.XPATH_REMOTE_ID(table)[0].lstrip('t_')
 
-                # 比赛开始时间
-                time_str_list = table.xpath('./tbody/tr[1]/td[1]/text()')
-                start_time = ' '.join(s.strip() for s in time_str_list if s.strip())
+            # 比赛开始时间
+            time_str_list = cls.XPATH_START_TIME(table)
+            start_time = ' '.join(s.strip() for s in time_str_list if s.strip())
 
-                # 即时比赛时间
-                compete_time = table.xpath('./thead/tr/th[2]/text()')[0].strip()
+            # 即时比赛时间
+            compete_time = cls.XPATH_COMPETE_TIME(table)[0].strip()
 
-                # 主队名，客队名
-                xpath_str = './tbody/tr[{}]/td[{}]/a/text()'
-                home_name = table.xpath(xpath_str.format(1, 2))
-                if home_name:
-                    home_name = home_name[0].strip()
+            # 主队名，客队名
+            home_name = cls.XPATH_HOME_NAME(table)
+            if home_name:
+                home_name = home_name[0].strip()
+                visitor_name = ''.join(cls.XPATH_VISITOR_NAME(table)).strip()
+            else:
+                home_name = ''.join(cls.XPATH_HOME_NAME_TEXT(table)).strip()
+                visitor_name = ''.join(cls.XPATH_VISITOR_NAME_TEXT(table)).strip()
+
+            # 主客队排名
+            home_rank = cls.XPATH_HOME_RANK(table)[0].strip().strip('[]')
+            visitor_rank = cls.XPATH_VISITOR_RANK(table)[0].strip().strip('[]')
+
+            # 欧指
+            win_odds = cls.XPATH_WIN_ODDS(table)
+            win_odds = win_odds[0].strip() if win_odds else None
+            lose_odds = cls.XPATH_LOSE_ODDS(table)
+            lose_odds = lose_odds[0].strip() if lose_odds else None
+
+            # 亚盘盘口
+            handicap = cls.XPATH_HANDICAP(table)[0].strip()
+            handicap2 = cls.XPATH_HANDICAP2(table)[0].strip()
+            if not handicap:
+                if handicap2:
+                    handicap = '-' + handicap2
                 else:
-                    xpath_str = './tbody/tr[{}]/td[{}]/text()'
-                    home_name = ''.join(table.xpath(xpath_str.format(1, 2))).strip()
-
-                visitor_name = ''.join(table.xpath(xpath_str.format(2, 1))).strip()
-
-                # 主客队排名
-                xpath_str = './tbody/tr[{}]/td/span[contains(@class," show_rank")]/text()'
-                home_rank = table.xpath(xpath_str.format(1))[0].strip().strip('[]')
-                visitor_rank = table.xpath(xpath_str.format(2))[0].strip().strip('[]')
-
-                # 欧指
-                xpath_str = './tbody/tr[{}]/td[@tag="{}EurOdds"]/a/text()'
-                win_odds = table.xpath(xpath_str.format(1, 'h'))
-                win_odds = win_odds[0].strip() if win_odds else None
-                lose_odds = table.xpath(xpath_str.format(2, 'g'))
-                lose_odds = lose_odds[0].strip() if lose_odds else None
-
-                # 亚盘盘口
-                xpath_str = './tbody/tr[{}]/td[starts-with(@tag, "rfOdds")]/span[1]/a/text()'
-                handicap = table.xpath(xpath_str.format(1))[0].strip()
-                handicap2 = table.xpath(xpath_str.format(2))[0].strip()
-                if not handicap:
-                    if handicap2:
-                        handicap = '-' + handicap2
-                    else:
-                        handicap = ''
-                handicap = clear_float_zero(handicap)
-                if not handicap:
-                    handicap = None
-
+                    handicap = ''
+            handicap = clear_float_zero(handicap)
+            if not handicap:
+                handicap = None
+
+            item = {
+                'remote_id': remote_id,
+                'id': None,
+                'league': league,
+                'start_time': start_time,
+                'home_name': home_name,
+                'visitor_name': visitor_name,
+                'home_rank': home_rank,
+                'visitor_rank': visitor_rank,
+                'win_odds': win_odds,
+                'lose_odds': lose_odds,
+                'handicap': handicap,
                 # 亚盘赔率
-                xpath_str = './tbody/tr[{}]/td[@tag="{}RfOdds"]/span[1]/a/text()'
-                home_handicap_odds = table.xpath(xpath_str.format(1, 'h'))[0].strip()
-                home_handicap_odds = home_handicap_odds if home_handicap_odds else None
-                visitor_handicap_odds = table.xpath(xpath_str.format(2, 'g'))[0].strip()
-                visitor_handicap_odds = visitor_handicap_odds if visitor_handicap_odds else None
-
+                'home_handicap_odds': cls.XPATH_HOME_HANDICAP_ODDS(table)[0].strip() or None,
+                'visitor_handicap_odds': cls.XPATH_VISITOR_HANDICAP_ODDS(table)[0].strip() or None,
                 # 大小球盘口
-                xpath_str = './tbody/tr[{}]/td[@tag="dxfOdds"]/span[1]/a/text()'
-                handicap_total = table.xpath(xpath_str.format(1))[0].strip()
-                handicap_total = handicap_total if handicap_total else None
-
+                'handicap_total': cls.XPATH_HANDICAP_TOTAL(table)[0].strip() or None,
                 # 大小球赔率
-                xpath_str = './tbody/tr[{}]/td[@tag="{}DxfOdds"]/span[1]/a/text()'
-                home_handicap_total_odds = table.xpath(xpath_str.format(1, 'h'))[0].strip()
-                home_handicap_total_odds = home_handicap_total_odds if home_handicap_total_odds else None
-                visitor_handicap_total_odds = table.xpath(xpath_str.format(2, 'g'))[0].strip()
-                visitor_handicap_total_odds = visitor_handicap_total_odds if visitor_handicap_total_odds else None
-
-                # 第一节主客队比分
-                xpath_str = './tbody/tr[{}]/td[@tag="{}Score1"]/text()'
-                home_quarter_one = table.xpath(xpath_str.format(1, 'h'))[0].strip()
-                visitor_quarter_one = table.xpath(xpath_str.format(2, 'g'))[0].strip()
-                home_quarter_one = None if home_quarter_one == '-' else home_quarter_one
-                visitor_quarter_one = None if visitor_quarter_one == '-' else visitor_quarter_one
-
-                # 第二节主客队比分
-                xpath_str = './tbody/tr[{}]/td[@tag="{}Score2"]/text()'
-                home_quarter_two = table.xpath(xpath_str.format(1, 'h'))[0].strip()
-                visitor_quarter_two = table.xpath(xpath_str.format(2, 'g'))[0].strip()
-                home_quarter_two = None if home_quarter_two == '-' else home_quarter_two
-                visitor_quarter_two = None if visitor_quarter_two == '-' else visitor_quarter_two
-
-                # 第三节主客队比分
-                xpath_str = './tbody/tr[{}]/td[@tag="{}Score3"]/text()'
-                home_quarter_three = table.xpath(xpath_str.format(1, 'h'))[0].strip()
-                visitor_quarter_three = table.xpath(xpath_str.format(2, 'g'))[0].strip()
-                home_quarter_three = None if home_quarter_three == '-' else home_quarter_three
-                visitor_quarter_three = None if visitor_quarter_three == '-' else visitor_quarter_three
-
-                # 第四节主客队比分
-                xpath_str = './tbody/tr[{}]/td[@tag="{}Score4"]/text()'
-                home_quarter_four = table.xpath(xpath_str.format(1, 'h'))[0].strip()
-                visitor_quarter_four = table.xpath(xpath_str.format(2, 'g'))[0].strip()
-                home_quarter_four = None if home_quarter_four == '-' else home_quarter_four
-                visitor_quarter_four = None if visitor_quarter_four == '-' else visitor_quarter_four
-
-                # 主客队总比分
-                xpath_str = './tbody/tr[{}]/td[@tag="{}TotalScore"]/text()'
-                home_total_score = table.xpath(xpath_str.format(1, 'h'))[0].strip()
-                visitor_total_score = table.xpath(xpath_str.format(2, 'g'))[0].strip()
-                home_total_score = None if home_total_score == '-' else home_total_score
-                visitor_total_score = None if visitor_total_score == '-' else visitor_total_score
-
-                yield {
-                    'remote_id': remote_id,
-                    'id': f'{date_format}{i:0>3d}',  # 左填充 0
-                    'league': league,
-                    'start_time': f'{date_format[:4]}-{start_time}',
-                    'home_name': home_name,
-                    'visitor_name': visitor_name,
-                    'home_rank': home_rank,
-                    'visitor_rank': visitor_rank,
-                    'win_odds': win_odds,
-                    'lose_odds': lose_odds,
-                    'handicap': handicap,
-                    'home_handicap_odds': home_handicap_odds,
-                    'visitor_handicap_odds': visitor_handicap_odds,
-                    'handicap_total': handicap_total,
-                    'home_handicap_total_odds': home_handicap_total_odds,
-                    'visitor_handicap_total_odds': visitor_handicap_total_odds,
-
-                    'compete_time': compete_time,
-                    'home_quarter_one': home_quarter_one,
-                    'visitor_quarter_one': visitor_quarter_one,
-                    'home_quarter_two': home_quarter_two,
-                    'visitor_quarter_two': visitor_quarter_two,
-                    'home_quarter_three': home_quarter_three,
-                    'visitor_quarter_three': visitor_quarter_three,
-                    'home_quarter_four': home_quarter_four,
-                    'visitor_quarter_four': visitor_quarter_four,
-                    'home_total_score': home_total_score,
-                    'visitor_total_score': visitor_total_score,
-                }
+                'home_handicap_total_odds': cls.XPATH_HOME_HANDICAP_TOTAL_ODDS(table)[0].strip() or None,
+                'visitor_handicap_total_odds': cls.XPATH_VISITOR_HANDICAP_TOTAL_ODDS(table)[0].strip() or None,
+
+                'compete_time': compete_time,
+            }
+
+            # 各节及总比分
+            for field, xpath in cls.SCORE_FIELDS:
+                score = xpath(table)[0].strip()
+                item[field] = None if score == '-' else score
+
+            yield item
 
 
 def main() -> None:
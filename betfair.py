@@ -9,7 +9,7 @@ import datetime
 
 from lxml import etree
 
-from crash import spider, log
+from crash import spider, log, ratelimit, sessions, metrics, feed, htmlstream
 from crash.types import *
 
 from config import *
@@ -19,6 +19,14 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+ratelimit.set_rate_limit(RATE_LIMIT, RATE_LIMIT_DIR)
+sessions.set_recorder(HTTP_RECORD_PATH)
+sessions.set_base_url(HTTP_BASE_URL)
+metrics.set_export_path(METRICS_PATH)
+feed.set_feed_path(FEED_PATH, FEED_SEGMENT_BYTES, FEED_MAX_SEGMENTS)
 
 
 class BetfairSpider(spider.MultiThreadSpider):
@@ -47,6 +55,12 @@ class BetfairSpider(spider.MultiThreadSpider):
 
     RE_FIND_NUM = re.compile(r'\d+')
 
+    # 批量写入
+    BATCH_SIZE = MYSQL_BATCH_SIZE
+    BATCH_INTERVAL = MYSQL_BATCH_INTERVAL
+
+    RUN_DEADLINE = SPIDER_RUN_DEADLINE
+
     def __init__(self,
                  name: str,
                  mysql_config: MysqlConfig) -> None:
@@ -61,20 +75,38 @@ class BetfairSpider(spider.MultiThreadSpider):
         current_hour = today.hour
         if current_hour < 12:
             today -= datetime.timedelta(1)
-        date_format = today.strftime('%Y%m%d')
+
+        self.run_date(today)
+
+    def run_date(self, date: datetime.date) -> None:
+        """请求并入库一期的数据，回填历史数据时直接调用"""
+
+        date_format = date.strftime('%Y%m%d')
+        self.warm_last_written(MYSQL_TABLE_BETFAIR, f"id LIKE '{date_format}%'")
 
         url = self.url_temp.format(date_format)
         r = self.session.get(url)
-        jd = r.json()
+        with self.timer('parse'):
+            jd = r.json()
 
         if jd['status'] == 'success':
-            for item in self.parse(jd['result']['bf_page'], date_format):
+            bf_page = jd['result']['bf_page']
+            # 页面经常不变，没变化时不解析、不入库
+            if not self.session.changed(url, bf_page):
+                log.logger.info(f'bf_page 没有变化: {url}')
+                return
+
+            for item in self.timed('parse', self.parse(bf_page, date_format)):
                 log.logger.debug(item)
                 self.insert_or_update(
                     MYSQL_TABLE_BETFAIR,
                     item,
                     self.UPDATE_FIELD
                 )
+
+            # 都写入后才记下本次的页面，中途失败的下次重新处理
+            self.flush()
+            self.session.commit_digest(url)
         else:  # 访问失败，如请求未来日期，日期不合法
             log.logger.error(jd['msg'])
 
@@ -86,95 +118,80 @@ class BetfairSpider(spider.MultiThreadSpider):
         :param date_format: 用于创建入库 id，须在函数外创建，否则可能导致不一致性
         """
 
-        selector = etree.HTML(html)
+        # 流式解析，每场比赛的 md_data_box 解析完即释放
+        for md_data_box_element in htmlstream.iter_elements(html, 'div', cls._is_md_data_box):
+            yield cls._parse_md_data_box(md_data_box_element, date_format)
+
+    @staticmethod
+    def _is_md_data_box(element) -> bool:
+        return element.get('class') == 'md_data_box css_league'
+
+    # 以下 XPath 预先编译，每场比赛复用，不用每次都重新解析表达式。
+    # smart_strings=False 直接返回 str，不保留到元素的引用
+    XPATH_TITLE_BOX = etree.XPath('.//div[@class="md_tit_box"]')
+    XPATH_CONTENT_BOX = etree.XPath('.//div[@class="md_con_box"]')
+
+    # 相对 md_tit_box
+    XPATH_MATCH_INDEX = etree.XPath('./span[1]/span//text()', smart_strings=False)
+    XPATH_START_TIME = etree.XPath('./span[@class="md_ks_time"]/span[1]/text()', smart_strings=False)
+
+    # 相对 md_con_box
+    # match_bf_id，目标网站数据库中的比赛 id，请求 detail 时使用
+    XPATH_MATCH_BF_ID = etree.XPath('./div[2]/@value', smart_strings=False)
+    XPATH_DATA_TABLE = etree.XPath('./div[@class="data_table"]/table/tbody')
+    XPATH_PROPORTION = etree.XPath('./div[2]')
+    XPATH_LARGE_PROPORTION = etree.XPath('./div[3]')
+
+    # 相对数据表 tbody，(字段, XPath)，如主胜必发赔率 1.10，必发指数 52.93，百家欧赔 1.10
+    DATA_TABLE_FIELDS = tuple(
+        (f'{prefix}_{result}_{suffix}', etree.XPath(f'./tr[{row}]/td[{col}]/strong/text()', smart_strings=False))
+        for row, result in ((1, 'win'), (2, 'draw'), (3, 'lose'))
+        for col, prefix, suffix in ((2, 'betfair', 'odds'), (3, 'betfair', 'index'), (4, 'avg', 'odds'))
+    )
 
-        md_data_box_element_list = selector.xpath('.//div[@class="md_data_box css_league"]')
-        for md_data_box_element in md_data_box_element_list:
+    # 相对交易占比 div，成交总量，如 3000000
+    XPATH_TOTAL = etree.XPath('./div[1]/p[2]/strong/text()', smart_strings=False)
 
-            title_box_element = md_data_box_element.xpath('.//div[@class="md_tit_box"]')[0]
+    # 相对交易占比 div 和大额交易占比 div，(结果, XPath)，如主胜交易占比 74.99
+    PROPORTION_FIELDS = tuple(
+        (result, etree.XPath(f'./div[2]/p[{row}]/span[2]/text()', smart_strings=False))
+        for row, result in ((1, 'win'), (2, 'draw'), (3, 'lose'))
+    )
 
-            match_index = title_box_element.xpath('./span[1]/span//text()')[0].strip()
-            match_index = cls.RE_FIND_NUM.findall(match_index)[0]
-            # 入库 id
-            _id = f'{date_format}{match_index}'
+    @classmethod
+    def _parse_md_data_box(cls, md_data_box_element, date_format: str) -> Dict:
+        """解析一场比赛，字段及顺序与入库的一致"""
+
+        title_box_element = cls.XPATH_TITLE_BOX(md_data_box_element)[0]
+
+        match_index = cls.XPATH_MATCH_INDEX(title_box_element)[0].strip()
+        match_index = cls.RE_FIND_NUM.findall(match_index)[0]
 
-            # 联赛名，可能为空
-            league = title_box_element.xpath('./span[@class="c_dgreen"]/text()')
-            league = league[0].strip() if league else None
-            # 主队名
-            home_name = title_box_element.xpath('./span[@class="c_yellow"]/span[1]/text()')[0].strip()
-            # 客队名
-            visitor_name = title_box_element.xpath('./span[@class="c_yellow"]/span[last()]/text()')[0].strip()
+        # 联赛名、主队名、客队名不需要，不解析
+        item = {
+            'id': f'{date_format}{match_index}',  # football_match 的 id 和这里的 id 是完全对应的
             # 比赛开始时间
-            start_time = title_box_element.xpath('./span[@class="md_ks_time"]/span[1]/text()')[0].strip()
-
-            content_box_element = md_data_box_element.xpath('.//div[@class="md_con_box"]')[0]
-
-            # match_bf_id，目标网站数据库中的比赛 id，请求 detail 时使用
-            match_bf_id = content_box_element.xpath('./div[2]/@value')[0]
-
-            data_table_element = content_box_element.xpath('./div[@class="data_table"]/table/tbody')[0]
-            # 主胜必发赔率，如 1.10。
-            betfair_win_odds = data_table_element.xpath('./tr[1]/td[2]/strong/text()')[0].strip()
-            # 主胜必发指数，如52.93。
-            betfair_win_index = data_table_element.xpath('./tr[1]/td[3]/strong/text()')[0].strip()
-            # 主胜百家欧赔赔率，如1.10。
-            avg_win_odds = data_table_element.xpath('./tr[1]/td[4]/strong/text()')[0].strip()
-            # betfair_draw_odds
-            betfair_draw_odds = data_table_element.xpath('./tr[2]/td[2]/strong/text()')[0].strip()
-            # betfair_draw_index
-            betfair_draw_index = data_table_element.xpath('./tr[2]/td[3]/strong/text()')[0].strip()
-            # avg_draw_odds
-            avg_draw_odds = data_table_element.xpath('./tr[2]/td[4]/strong/text()')[0].strip()
-            # betfair_lose_odds
-            betfair_lose_odds = data_table_element.xpath('./tr[3]/td[2]/strong/text()')[0].strip()
-            # betfair_lose_index
-            betfair_lose_index = data_table_element.xpath('./tr[3]/td[3]/strong/text()')[0].strip()
-            # avg_lose_odds
-            avg_lose_odds = data_table_element.xpath('./tr[3]/td[4]/strong/text()')[0].strip()
-
-            proportion_element = content_box_element.xpath('./div[2]')[0]
-            # 成交总量，如3000000
-            total = proportion_element.xpath('./div[1]/p[2]/strong/text()')[0].strip()
-            # 主胜交易占比，如74.99。
-            betfair_win_proportion = proportion_element.xpath('./div[2]/p[1]/span[2]/text()')[0].strip().rstrip('%')
-            # betfair_draw_proportion
-            betfair_draw_proportion = proportion_element.xpath('./div[2]/p[2]/span[2]/text()')[0].strip().rstrip('%')
-            # betfair_lose_proportion
-            betfair_lose_proportion = proportion_element.xpath('./div[2]/p[3]/span[2]/text()')[0].strip().rstrip('%')
-
-            large_proportion_element = content_box_element.xpath('./div[3]')[0]
-            # 主胜大额交易占比，如76.89。
-            betfair_win_large_proportion = large_proportion_element.xpath('./div[2]/p[1]/span[2]/text()')[0].strip().rstrip('%')
-            # betfair_draw_large_proportion
-            betfair_draw_large_proportion = large_proportion_element.xpath('./div[2]/p[2]/span[2]/text()')[0].strip().rstrip('%')
-            # betfair_lose_large_proportion
-            betfair_lose_large_proportion = large_proportion_element.xpath('./div[2]/p[3]/span[2]/text()')[0].strip().rstrip('%')
-
-            yield {
-                'id': _id,  # football_match 的 id 和这里的 id 是完全对应的
-                # 'league': league,  # 这三个字段不需要
-                # 'home_name': home_name,
-                # 'visitor_name': visitor_name,
-                'start_time': start_time,
-                'match_bf_id': match_bf_id,
-                'betfair_win_odds': betfair_win_odds,
-                'betfair_win_index': betfair_win_index,
-                'avg_win_odds': avg_win_odds,
-                'betfair_draw_odds': betfair_draw_odds,
-                'betfair_draw_index': betfair_draw_index,
-                'avg_draw_odds': avg_draw_odds,
-                'betfair_lose_odds': betfair_lose_odds,
-                'betfair_lose_index': betfair_lose_index,
-                'avg_lose_odds': avg_lose_odds,
-                'total': total,
-                'betfair_win_proportion': betfair_win_proportion,
-                'betfair_draw_proportion': betfair_draw_proportion,
-                'betfair_lose_proportion': betfair_lose_proportion,
-                'betfair_win_large_proportion': betfair_win_large_proportion,
-                'betfair_draw_large_proportion': betfair_draw_large_proportion,
-                'betfair_lose_large_proportion': betfair_lose_large_proportion,
-            }
+            'start_time': cls.XPATH_START_TIME(title_box_element)[0].strip(),
+        }
+
+        content_box_element = cls.XPATH_CONTENT_BOX(md_data_box_element)[0]
+
+        item['match_bf_id'] = cls.XPATH_MATCH_BF_ID(content_box_element)[0]
+
+        data_table_element = cls.XPATH_DATA_TABLE(content_box_element)[0]
+        for field, xpath in cls.DATA_TABLE_FIELDS:
+            item[field] = xpath(data_table_element)[0].strip()
+
+        proportion_element = cls.XPATH_PROPORTION(content_box_element)[0]
+        item['total'] = cls.XPATH_TOTAL(proportion_element)[0].strip()
+        for result, xpath in cls.PROPORTION_FIELDS:
+            item[f'betfair_{result}_proportion'] = xpath(proportion_element)[0].strip().rstrip('%')
+
+        large_proportion_element = cls.XPATH_LARGE_PROPORTION(content_box_element)[0]
+        for result, xpath in cls.PROPORTION_FIELDS:
+            item[f'betfair_{result}_large_proportion'] = xpath(large_proportion_element)[0].strip().rstrip('%')
+
+        return item
 
 
 def main() -> None:
@@ -7,7 +7,10 @@ import queue
 import warnings
 import datetime
 
-from crash import spider, log
+import pymysql
+from pymysql.cursors import DictCursor
+
+from crash import spider, log, ratelimit, sessions, metrics, db, feed
 from crash.types import *
 
 from config import *
@@ -17,6 +20,14 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+ratelimit.set_rate_limit(RATE_LIMIT, RATE_LIMIT_DIR)
+sessions.set_recorder(HTTP_RECORD_PATH)
+sessions.set_base_url(HTTP_BASE_URL)
+metrics.set_export_path(METRICS_PATH)
+feed.set_feed_path(FEED_PATH, FEED_SEGMENT_BYTES, FEED_MAX_SEGMENTS)
 
 
 class BetfairDetailSpider(spider.MultiThreadSpider):
@@ -31,7 +42,29 @@ class BetfairDetailSpider(spider.MultiThreadSpider):
         '0': '客胜', '1': '平局', '3': '主胜'
     }
 
-    sql_delete_temp = 'DELETE FROM {} WHERE betfair_id={{}}'
+    # 一笔交易的自然键，同一场比赛中完全相同的交易可能有多笔
+    KEY_FIELDS = ('transaction_time', 'status', 'price', 'turnover')
+
+    sql_select = f'SELECT {", ".join(KEY_FIELDS)}, proportion ' \
+                 f'FROM {MYSQL_TABLE_BETFAIR_DETAIL} WHERE betfair_id = %(betfair_id)s'
+
+    sql_where = 'betfair_id = %(betfair_id)s AND ' + ' AND '.join(f'{k} = %({k})s' for k in KEY_FIELDS)
+
+    # 同一自然键可能有多行，只删除多出来的
+    sql_delete = f'DELETE FROM {MYSQL_TABLE_BETFAIR_DETAIL} WHERE {sql_where} LIMIT %(limit)s'
+
+    # 总交易额变化后，已有交易的占比随之变化
+    sql_update = f'UPDATE {MYSQL_TABLE_BETFAIR_DETAIL} SET proportion = %(proportion)s WHERE {sql_where}'
+
+    RUN_DEADLINE = SPIDER_RUN_DEADLINE
+
+    # 没有已存交易、新交易达到这么多笔时用 `LOAD DATA` 导入，None 表示不用
+    LOAD_DATA_MIN_ROWS = MYSQL_LOAD_DATA_MIN_ROWS
+
+    # 多个节点共同消费时的任务队列
+    REDIS_CONFIG = REDIS_CONFIG
+    TASK_VISIBILITY_TIMEOUT = REDIS_TASK_VISIBILITY_TIMEOUT
+    TASK_DONE_TTL = REDIS_TASK_DONE_TTL
 
     def __init__(self,
                  name: str,
@@ -41,7 +74,17 @@ class BetfairDetailSpider(spider.MultiThreadSpider):
         # 改成抓取 json 数据的头部
         self.session.headers.update(self.headers_json)
 
-        self.sql_delete: Optional[str] = None
+    def prepare(self) -> None:
+        today_format = datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+        # 只更新比赛开始时间大于当前时间的数据
+        mysql_sql = f'SELECT id, match_bf_id FROM {MYSQL_TABLE_BETFAIR} WHERE start_time > "{today_format}"'
+        log.logger.debug(mysql_sql)
+        self.create_task_list(self.mysql_config, mysql_sql)
+
+    @staticmethod
+    def task_key(row: Tuple) -> str:
+        # 同一场比赛只有一个任务
+        return str(row[1])
 
     def run(self) -> None:
 
@@ -51,24 +94,147 @@ class BetfairDetailSpider(spider.MultiThreadSpider):
             except queue.Empty:
                 break
 
-            year = datetime.date.today().year
-            url = self.url_temp.format(match_bf_id)
-            r = self.session.get(url)
+            # 出现异常也确认，与不用 Redis 时一样，由下次运行重新放入的任务重试
+            try:
+                self.crawl_match(_id, match_bf_id)
+            finally:
+                self.q.task_done()
+
+    def crawl_match(self, _id: str, match_bf_id: str) -> None:
+        year = datetime.date.today().year
+        url = self.url_temp.format(match_bf_id)
+        r = self.session.get(url)
+        if r is None:
+            log.logger.error(f'请求失败: {url}')
+            return
+
+        # 请求可能用掉了大部分超时时间，解析、入库前再延长
+        self.extend_task()
+
+        with self.timer('parse'):
             jd = r.json()
 
-            if jd['status'] == 'success':
-                # 删除原有记录
-                if not self.sql_delete:
-                    self.sql_delete = self.sql_delete_temp.format(MYSQL_TABLE_BETFAIR_DETAIL)
-                # 已经设置了 autocommit
-                self.cursor.execute(self.sql_delete.format(_id))
+        if jd['status'] == 'success':
+            items = []
+            for item in self.timed('parse', self.parse(jd, year)):
+                item['betfair_id'] = _id  # 外键
+                log.logger.debug(item)
+                items.append(item)
+
+            self.sync(_id, items)
+        else:
+            log.logger.error(jd['msg'])
+
+    def sync(self, betfair_id: str, items: List[Dict]) -> None:
+        """与数据库中这场比赛已有的交易比较，只插入新的、删除消失的、更新占比变化的，在一个事务中完成"""
+
+        with self.timer('db'), self.pool.cursor(DictCursor) as cursor:
+            cursor.execute(self.sql_select, {'betfair_id': betfair_id})
+            rows = cursor.fetchall()
+
+        inserts, updates, deletes = self.diff(rows, items)
+        if not (inserts or updates or deletes):
+            return
+
+        for args in (*updates, *deletes):
+            args['betfair_id'] = betfair_id
+
+        log.logger.info(
+            f'{betfair_id}: 新增 {len(inserts)}，更新占比 {len(updates)}，删除 {len(deletes)} 种交易'
+        )
+
+        if not rows and self.LOAD_DATA_MIN_ROWS is not None and len(inserts) >= self.LOAD_DATA_MIN_ROWS:
+            columns = {k: [item[k] for item in inserts] for k in inserts[0]}
+            try:
+                # 不能用 `LOAD DATA` 时改用多行 INSERT，仍失败则已回滚
+                with self.timer('db'):
+                    written = db.load_columns(self.mysql_config, MYSQL_TABLE_BETFAIR_DETAIL, columns)
+            except (pymysql.err.Warning, pymysql.err.DataError, pymysql.IntegrityError) as e:
+                self.count('spider_db_errors_total', MYSQL_TABLE_BETFAIR_DETAIL, error=type(e).__name__)
+                log.logger.error(f'导入失败，已回滚！ {betfair_id}')
+                return
+            self.count('spider_rows_written_total', MYSQL_TABLE_BETFAIR_DETAIL, written)
+            self.publish(betfair_id, inserts, [], [])
+            return
+
+        try:
+            # 出现异常时 `connection` 会回滚
+            with self.timer('db'), self.pool.connection() as conn:
+                conn.begin()
+                written = 0
+                with conn.cursor() as cursor:
+                    if deletes:
+                        written += cursor.executemany(self.sql_delete, deletes)
+                    if updates:
+                        written += cursor.executemany(self.sql_update, updates)
+                    if inserts:  # pymysql 把多行 INSERT 合并成一条语句
+                        written += cursor.executemany(
+                            db.build_insert_sql(MYSQL_TABLE_BETFAIR_DETAIL, inserts[0]), inserts
+                        )
+                conn.commit()
+            self.count('spider_rows_written_total', MYSQL_TABLE_BETFAIR_DETAIL, written)
+        except (pymysql.err.Warning, pymysql.err.DataError, pymysql.IntegrityError) as e:
+            self.count('spider_db_errors_total', MYSQL_TABLE_BETFAIR_DETAIL, error=type(e).__name__)
+            log.logger.error(f'同步失败，已回滚！ {betfair_id}')
+        else:
+            self.publish(betfair_id, inserts, updates, deletes)
+
+    @staticmethod
+    def publish(betfair_id: str, inserts: List[Dict], updates: List[Dict], deletes: List[Dict]) -> None:
+        """把同步的结果发到变更流，更新、删除以自然键标识交易"""
+
+        if not feed.enabled():
+            return
+
+        feed.publish([
+            {'table': MYSQL_TABLE_BETFAIR_DETAIL, 'op': op, 'id': betfair_id, 'changes': changes}
+            for op, rows in (('insert', inserts), ('update', updates), ('delete', deletes))
+            for changes in rows
+        ])
 
-                for item in self.parse(jd, year):
-                    item['betfair_id'] = _id  # 外键
-                    log.logger.debug(item)
-                    self.insert(MYSQL_TABLE_BETFAIR_DETAIL, item)
-            else:
-                log.logger.error(jd['msg'])
+    @staticmethod
+    def key(row: Dict) -> Tuple:
+        """自然键，数据库读出的行与解析出的 item 类型不同，统一后比较"""
+
+        transaction_time = row['transaction_time']
+        if isinstance(transaction_time, datetime.datetime):
+            transaction_time = transaction_time.strftime('%Y-%m-%d %H:%M')
+
+        return transaction_time, row['status'], round(float(row['price']), 2), int(row['turnover'])
+
+    @classmethod
+    def diff(cls, rows: List[Dict], items: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """比较已有的行与新解析的 item
+
+        :return: (要插入的 item，要更新占比的自然键及新占比，要删除的自然键及行数)
+        """
+
+        stored: Dict[Tuple, List[Dict]] = {}
+        for row in rows:
+            stored.setdefault(cls.key(row), []).append(row)
+
+        latest: Dict[Tuple, List[Dict]] = {}
+        for item in items:
+            latest.setdefault(cls.key(item), []).append(item)
+
+        inserts, updates, deletes = [], [], []
+
+        for key, new in latest.items():
+            old = stored.get(key, [])
+            # 相同的交易多出来几笔，就插入几笔
+            inserts.extend(new[len(old):])
+
+            proportion = new[0]['proportion']
+            if any(round(float(row['proportion']), 2) != proportion for row in old[:len(new)]):
+                # 条件用数据库中的原值，保证能匹配
+                updates.append({**{k: old[0][k] for k in cls.KEY_FIELDS}, 'proportion': proportion})
+
+        for key, old in stored.items():
+            extra = len(old) - len(latest.get(key, ()))
+            if extra > 0:
+                deletes.append({**{k: old[0][k] for k in cls.KEY_FIELDS}, 'limit': extra})
+
+        return inserts, updates, deletes
 
     @classmethod
     def parse(cls, jd: Dict, year: int) -> Iterator[Dict]:
@@ -78,45 +244,51 @@ class BetfairDetailSpider(spider.MultiThreadSpider):
         :param year: 用于在交易时间前插入年份，函数外传入，保持一致性
         """
 
+        columns = cls.parse_columns(jd, year)
+
+        for values in zip(*columns.values()):
+            yield dict(zip(columns, values))
+
+    @classmethod
+    def parse_columns(cls, jd: Dict, year: int) -> Dict[str, List]:
+        """把整个交易列表一次转成列，字段 -> 各笔交易的值，各列等长
+
+        :param year: 用于在交易时间前插入年份，函数外传入，保持一致性
+        """
+
         result = jd['result']
 
         big_list = result['bigTradeList']['bigList']
 
-        for record in big_list['all']:
-            # record 格式类似 '110342|2|1|500|05-29 04:35'
-            temp = record.split('|')
+        records = big_list['all']
+        if not records:
+            return {k: [] for k in ('turnover', 'status', 'price', 'transaction_time', 'proportion')}
+
+        # record 格式类似 '110342|2|1|500|05-29 04:35'，按列转置
+        amounts, trade_types, index_types, prices, times = zip(*(record.split('|') for record in records))
+
+        # 总交易额，所有交易共用
+        total_trade = int(result['bfMatch']['homeAmount'])\
+                      + int(result['bfMatch']['drawAmount'])\
+                      + int(result['bfMatch']['awayAmount'])
 
-            # 成交额
-            turnover = int(temp[0]) // 100
+        # 成交额
+        turnover = [int(amount) // 100 for amount in amounts]
+
+        return {
+            'turnover': turnover,
             # 属性，从数字映射成中文
-            status = cls.index_type[temp[2]] + cls.trade_type[temp[1]]
+            'status': [cls.index_type[i] + cls.trade_type[t] for i, t in zip(index_types, trade_types)],
             # 价位
-            price = round(float(temp[3]) / 100, 2)
+            'price': [round(float(price) / 100, 2) for price in prices],
             # 交易时间
-            transaction_time = f'{year}-{temp[4]}'
-            # 总交易额
-            total_trade = int(result['bfMatch']['homeAmount'])\
-                          + int(result['bfMatch']['drawAmount'])\
-                          + int(result['bfMatch']['awayAmount'])
+            'transaction_time': [f'{year}-{t}' for t in times],
             # 交易占比
-            proportion = round(turnover * 100 / total_trade * 100, 2)
-
-            yield {
-                'turnover': turnover,
-                'status': status,
-                'price': price,
-                'transaction_time': transaction_time,
-                'proportion': proportion
-            }
+            'proportion': [round(t * 100 / total_trade * 100, 2) for t in turnover],
+        }
 
 
 def main() -> None:
-    today_format = datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
-    # 只更新比赛开始时间大于当前时间的数据
-    mysql_sql = f'SELECT id, match_bf_id FROM {MYSQL_TABLE_BETFAIR} WHERE start_time > "{today_format}"'
-    log.logger.debug(mysql_sql)
-    BetfairDetailSpider.create_task_list(MYSQL_CONFIG, mysql_sql)
-
     spider.run_spider(
         1,
         BetfairDetailSpider,
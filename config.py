@@ -1,12 +1,63 @@
 """配置文件"""
 
+import os
+
 from crash.log import DEBUG, INFO, WARNING, ERROR
 
 # 日志级别
 LOG_LEVEL = DEBUG
+# 日志写到这个文件，超过 LOG_MAX_BYTES 字节时轮转，旧文件 gzip 压缩，保留 LOG_BACKUP_COUNT 个，
+# None 时写到标准错误
+LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log', 'spider.log')
+LOG_MAX_BYTES = 100 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+# 由后台线程格式化和写日志，爬虫线程只把记录放入队列
+LOG_QUEUE = True
+# 每条数据的 debug 日志，同一处每 LOG_DEBUG_SAMPLE 条保留 1 条，
+# 再限速为 (每秒条数, 突发条数)，None 表示不限速
+LOG_DEBUG_SAMPLE = 1
+LOG_DEBUG_RATE = (50, 200)
+
+# 足球爬虫的线程数量，一天的比赛分成多个任务，由多个线程并行请求赔率、入库，
+# 其他爬虫只用 1 个线程
+THREAD_NUM = 4
+
+# 一次运行中 HTTP 请求的截止秒数，超过后不再请求，
+# 防止源站故障时一次运行拖到下一分钟之后
+SPIDER_RUN_DEADLINE = 55
+
+# 各主机每秒请求数和突发请求数，同一进程中所有线程共享
+RATE_LIMIT = {
+    'live.13322.com': (5, 10),
+    'basket.13322.com': (5, 10),
+    'live.aicai.com': (5, 10),
+}
+# 设置后，多个进程通过这个目录下的文件共享限速，如 '/tmp/match_spider_ratelimit'
+RATE_LIMIT_DIR = None
+
+# 设置后，所有 HTTP 请求和响应录制到这个文件，如 'log/http_record.jsonl'
+HTTP_RECORD_PATH = None
+# 设置后，所有 HTTP 请求改发到这个地址，如 tools/stub_server.py 启动的 'http://127.0.0.1:8000'
+HTTP_BASE_URL = None
+
+# 设置后，每次运行结束把各阶段耗时、请求和写入统计导出到这个文件，
+# 以 .json 结尾时导出 json，否则为 Prometheus 文本格式，
+# 如 node exporter textfile 目录下的 '/var/lib/node_exporter/textfile/match_spider.prom'
+METRICS_PATH = None
 
-# 使用线程数量，不改
-THREAD_NUM = 1
+# 设置后，各爬虫写入的每一行变化的字段追加到这个目录下的变更流，如 'log/feed'，
+# 每段超过 FEED_SEGMENT_BYTES 字节后新开一段，保留最近 FEED_MAX_SEGMENTS 段，0 表示都保留
+FEED_PATH = None
+FEED_SEGMENT_BYTES = 64 * 1024 * 1024
+FEED_MAX_SEGMENTS = 20
+
+# 设置后，betfair_detail 的任务放在 Redis 中，多个节点上的进程共同消费，
+# 如 {'host': 'localhost', 'port': 6379, 'db': 0}，None 时每个进程各自从 MySQL 读取全部任务
+REDIS_CONFIG = None
+# 取出的任务这么多秒内未完成，重新入队由其他进程处理，发出请求前、入库前会再延长
+REDIS_TASK_VISIBILITY_TIMEOUT = 60
+# 完成的任务这么多秒内不再入队，避免各节点在同一分钟内重复放入
+REDIS_TASK_DONE_TTL = 50
 
 # MySQL 配置
 MYSQL_CONFIG = {
@@ -17,6 +68,33 @@ MYSQL_CONFIG = {
     'db': 'topicBet',
 }
 
+# 批量写入，缓冲行数或间隔秒数达到阈值时在一个事务中写入，行数为 0 时逐条写入
+MYSQL_BATCH_SIZE = 500
+MYSQL_BATCH_INTERVAL = 5
+# 一场比赛首次同步的必发大额交易达到这么多笔时，用 LOAD DATA LOCAL INFILE 导入，
+# 须服务端开启 local_infile，None 表示总是用多行 INSERT
+MYSQL_LOAD_DATA_MIN_ROWS = None
+
+# 足球实时赔率缓存，同一分钟内多个爬虫请求同一场比赛时只请求一次
+ODDS_CACHE_TTL = 50
+ODDS_CACHE_SIZE = 5000
+# 设置后，多个进程通过这个 sqlite 文件共享缓存，如 '/tmp/match_spider_odds.sqlite'，
+# 文件中同样最多保留 ODDS_CACHE_SIZE 条，过期的定期删除
+ODDS_CACHE_PATH = None
+
+# 足球即时比分、竞彩按比赛状态决定每场比赛的请求间隔，单位秒，
+# 0 表示每次运行都请求，None 表示不再请求，未到间隔的比赛不请求赔率也不写入
+FOOTBALL_POLL_INTERVAL = {
+    'new': 0,  # 库中没有，或状态刚变为完场、取消、推迟，还未入库
+    'live': 0,  # 进行中
+    'soon': 0,  # 距开赛不到 FOOTBALL_POLL_SOON 秒，或已过开赛时间还未开始
+    'upcoming': 600,  # 距开赛更久
+    'suspended': 600,  # 待定、腰斩、中断，可能恢复
+    'finished': None,  # 完场，已入库
+    'cancelled': None,  # 取消、推迟，已入库
+}
+FOOTBALL_POLL_SOON = 3600
+
 # 保存数据的表
 MYSQL_TABLE_BETFAIR = 'betfair'
 MYSQL_TABLE_BETFAIR_DETAIL = 'betfair_detail'
@@ -26,3 +104,13 @@ MYSQL_TABLE_FOOTBALL_BET = 'football_bet'
 MYSQL_TABLE_BASKETBALL_MATCH_SCHEDULE = 'basketball_match_schedule'
 MYSQL_TABLE_BASKETBALL_MATCH = 'basketball_match'
 MYSQL_TABLE_BASKETBALL_BET = 'basketball_bet'
+
+# 常驻进程 daemon.py 中各爬虫的运行间隔，单位秒
+SCHEDULE_INTERVAL = {
+    'football_match_schedule': 60,
+    'football_live': 60,
+    'basketball_match_schedule': 60,
+    'basketball_live': 60,
+    'betfair': 60,
+    'betfair_detail': 60,
+}
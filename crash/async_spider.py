@@ -0,0 +1,300 @@
+"""基于 asyncio 的爬虫类，HTTP 用 aiohttp，MySQL 用 aiomysql。
+
+与 `spider.MultiThreadSpider` 的 `insert`、`update`、`insert_or_update` 接口相同，
+但都是协程。单线程内可以用 `gather` 限流并发发出大量请求。
+重试用同一个 `sessions.RetryPolicy`，跳过重复写入与多线程爬虫共用 `MultiThreadSpider._last_written`，
+请求、写入统计同样计入 `metrics.registry`。
+
+create:   2026-10-18
+modified:
+"""
+
+import time
+import asyncio
+
+import aiohttp
+import aiomysql
+import pymysql
+from aiomysql import DictCursor
+
+from . import db, log, metrics
+from .sessions import RetryPolicy
+from .spider import MultiThreadSpider, LastWritten, normalize
+from .types import *
+
+# 并发请求数上限
+CONCURRENCY: int = 10
+
+
+class AsyncSpider:
+
+    headers_html: Dict[str, str] = MultiThreadSpider.headers_html
+
+    headers_json: Dict[str, str] = MultiThreadSpider.headers_json
+
+    # 等待响应，超时时间
+    timeout: int = 120
+
+    # 与多线程爬虫共用，同一进程中写过的行不再重复写
+    _last_written: LastWritten = MultiThreadSpider._last_written
+
+    def __init__(self,
+                 name: str,
+                 mysql_config: MysqlConfig,
+                 concurrency: int = CONCURRENCY,
+                 retry_policy: Optional[RetryPolicy] = None) -> None:
+
+        self.name = name
+        self.mysql_config = mysql_config
+        self.concurrency = concurrency
+        self.retry_policy = retry_policy or RetryPolicy()
+
+        self._running = True
+
+        # 请求统计，与 `sessions.Session.stats` 相同
+        self.stats: Dict[str, float] = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'bytes': 0,
+            'seconds': 0.0,
+        }
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.pool: Optional[aiomysql.Pool] = None
+
+    async def open(self) -> None:
+        self.session = aiohttp.ClientSession(
+            headers=self.headers_html,  # 默认 html 头部
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self.pool = await aiomysql.create_pool(
+            **self.mysql_config, autocommit=True, maxsize=self.concurrency
+        )
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+
+    async def run(self) -> None:
+        """抽象方法，由子类继承创建。"""
+
+        raise NotImplementedError
+
+    async def request(self, method: str, url: str, **kwargs) -> Optional[aiohttp.ClientResponse]:
+        """请求失败按 `retry_policy` 退避重试，返回已读完响应体的 response，可直接 `json()`、`text()`。
+
+        重试后仍失败，或超过截止时间，返回 None。
+        """
+
+        message = '%s: %s' % (method, url)
+        log.logger.info(message)
+        self.stats['requests'] += 1
+
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline
+
+        why = ''
+        for i in range(policy.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                why = 'Deadline'
+                break
+
+            start = time.monotonic()
+            try:
+                timeout = aiohttp.ClientTimeout(total=min(self.timeout, remaining))
+                async with self.session.request(method, url, timeout=timeout, **kwargs) as r:
+                    body = await r.read()
+                    self.stats['seconds'] += time.monotonic() - start
+                    self.stats['bytes'] += len(body)
+                    return r
+            except asyncio.TimeoutError:
+                why = 'Timeout'
+            except aiohttp.ClientConnectionError:
+                why = 'ConnectionError'
+            except aiohttp.ClientPayloadError:  # 读到的字节数与实际字节数不符
+                why = 'ChunkedEncodingError'
+            self.stats['seconds'] += time.monotonic() - start
+
+            if i != policy.max_retries:
+                delay = policy.backoff(i)
+                if time.monotonic() + delay >= deadline:
+                    break
+                self.stats['retries'] += 1
+                log.logger.warning('%s, retry %d after %.1fs >>> %s' % (why, i + 1, delay, message))
+                await asyncio.sleep(delay)
+
+        self.stats['failures'] += 1
+        log.logger.error('%s, %s' % (why, message))
+
+    async def get(self, url: str, **kwargs) -> Optional[aiohttp.ClientResponse]:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> Optional[aiohttp.ClientResponse]:
+        return await self.request('POST', url, **kwargs)
+
+    async def gather(self, aws: Iterable[Awaitable], limit: Optional[int] = None) -> List:
+        """并发运行 `aws`，同时运行的不超过 `limit` 个，结果顺序与输入一致。"""
+
+        semaphore = asyncio.Semaphore(limit or self.concurrency)
+
+        async def bounded(aw: Awaitable):
+            async with semaphore:
+                return await aw
+
+        return await asyncio.gather(*(bounded(aw) for aw in aws))
+
+    def count(self, name: str, table: str, value: float = 1, **labels: str) -> None:
+        """累加按表统计的指标"""
+
+        metrics.registry.inc(name, value, spider=type(self).__name__, table=table, **labels)
+
+    def record_metrics(self) -> None:
+        """把请求统计计入 `metrics.registry`，与多线程爬虫的指标名相同"""
+
+        spider = type(self).__name__
+        stats, self.stats = self.stats, dict.fromkeys(self.stats, 0)
+
+        metrics.registry.inc('spider_http_requests_total', stats['requests'], spider=spider)
+        metrics.registry.inc('spider_http_retries_total', stats['retries'], spider=spider)
+        metrics.registry.inc('spider_http_failures_total', stats['failures'], spider=spider)
+        metrics.registry.inc('spider_http_bytes_total', stats['bytes'], spider=spider)
+        metrics.registry.inc('spider_phase_seconds_total', stats['seconds'], spider=spider, phase='fetch')
+
+    async def execute(self, sql: str, args: Optional[Dict] = None) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, args)
+
+    async def executemany(self, sql: str, items: List[Dict]) -> None:
+        """在一个事务中写入多行，出现异常时回滚"""
+
+        async with self.pool.acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(sql, items)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+    async def insert(self, table: str, item: Dict) -> None:
+        sql = db.build_insert_sql(table, item)
+
+        try:
+            await self.execute(sql, item)
+            self.count('spider_rows_written_total', table)
+        except pymysql.IntegrityError:
+            self.count('spider_db_errors_total', table, error='IntegrityError')
+            log.logger.debug(f'存在重复字段！ {str(item)}')
+        except pymysql.err.Warning:  # 过滤不合法 mysql 类型
+            self.count('spider_db_errors_total', table, error='Warning')
+            log.logger.error(f'字段类型不合法！ {str(item)}')
+
+    async def update(self, table: str, where: str, item: Dict) -> None:
+        sql = db.build_update_sql(table, where, item)
+
+        try:
+            await self.execute(sql, item)
+            self.count('spider_rows_written_total', table)
+        except pymysql.err.Warning:
+            self.count('spider_db_errors_total', table, error='Warning')
+            log.logger.error(f'字段类型不合法！ {str(item)}')
+
+    async def insert_or_update(self, table: str, item: Dict, update_field: set) -> None:
+        """sql 插入已存在主键纪录时，更新指定字段，更新字段都没有变化时不写入
+
+        :param table: 表名
+        :param item: 数据
+        :param update_field: 需要更新的字段
+        """
+
+        if self._last_written.unchanged(table, item, update_field):
+            self.count('spider_rows_skipped_total', table)
+            return
+
+        sql = db.build_insert_or_update_sql(table, item, update_field)
+
+        try:
+            await self.execute(sql, item)
+            self.count('spider_rows_written_total', table)
+            self._last_written.remember(table, item, update_field)
+        except (pymysql.err.Warning, pymysql.err.DataError, pymysql.IntegrityError) as e:  # 过滤不合法的数据
+            self.count('spider_db_errors_total', table, error=type(e).__name__)
+            log.logger.error(f'字段类型不合法！ {str(item)}')
+
+    async def insert_or_update_many(self, table: str, items: List[Dict], update_field: set) -> None:
+        """与 `insert_or_update` 相同，但字段相同的数据在一个事务中用一条多行语句写入。
+
+        有不合法数据导致整批失败时，回滚后逐条写入，只过滤掉不合法的。
+        """
+
+        groups: Dict[Tuple[str, ...], List[Dict]] = {}
+        for item in items:
+            if self._last_written.unchanged(table, item, update_field):
+                self.count('spider_rows_skipped_total', table)
+                continue
+            groups.setdefault(tuple(item), []).append(item)
+
+        for columns, group in groups.items():
+            sql = db.build_insert_or_update_many_sql(table, columns, update_field)
+            try:
+                await self.executemany(sql, group)
+            except (pymysql.err.Warning, pymysql.err.DataError, pymysql.IntegrityError):
+                log.logger.warning('批量写入失败，改为逐条写入')
+                for item in group:
+                    await self.insert_or_update(table, item, update_field)
+                continue
+
+            self.count('spider_rows_written_total', table, len(group))
+            for item in group:
+                self._last_written.remember(table, item, update_field)
+
+    async def warm_last_written(self, table: str, where: str) -> None:
+        """从数据库读取已有数据，作为跳过重复写入的依据，同一条件只读一次。
+
+        :param where: 限定范围，如 `id LIKE '20190616%'`
+        """
+
+        if self._last_written.is_warmed(table, where):
+            return
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(DictCursor) as cursor:
+                await cursor.execute(f'SELECT * FROM {table} WHERE {where}')
+                rows = await cursor.fetchall()
+
+        for row in rows:
+            self._last_written.set(table, row['id'], {k: normalize(v) for k, v in row.items()})
+
+        self._last_written.mark_warmed(table, where)
+
+    def terminate(self) -> None:
+        self._running = False
+
+
+def run_spider(
+        spider_class: Type[AsyncSpider],
+        mysql_config: MysqlConfig,
+        concurrency: int = CONCURRENCY) -> None:
+
+    async def main() -> None:
+        s = spider_class('coroutine1', mysql_config, concurrency)
+        log.logger.info(f'{s.__class__.__name__} {s.name} 启动')
+        await s.open()
+        try:
+            await s.run()
+        finally:
+            await s.close()
+            s.record_metrics()
+            metrics.export()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        exit(1)
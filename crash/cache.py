@@ -0,0 +1,167 @@
+"""带过期时间和容量上限的缓存，可选用本地 sqlite 文件在多个进程间共享。
+
+create:   2026-10-18
+modified:
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .types import *
+
+
+class SqliteStore:
+    """磁盘上的键值存储，多个进程打开同一文件即可共享，值须能序列化成 json。
+
+    `expire` 时除删除过期数据外，超过 `maxsize` 行的删除最早写入的，None 表示不限。
+    """
+
+    def __init__(self, path: str, maxsize: Optional[int] = None) -> None:
+        self.path = path
+        self.maxsize = maxsize
+        # sqlite 连接不能跨线程使用，每个线程一个
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, ts REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS cache_ts ON cache (ts)')
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, ttl: float):
+        entry = self.get_entry(key, ttl)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str, ttl: float) -> Optional[Tuple[Any, float]]:
+        """未过期的值及其写入时间（`time.time()`），没有时返回 None"""
+
+        row = self._connect().execute(
+            'SELECT value, ts FROM cache WHERE key = ? AND ts > ?', (key, time.time() - ttl)
+        ).fetchone()
+
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def set(self, key: str, value) -> None:
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, ts) VALUES (?, ?, ?)',
+            (key, json.dumps(value, ensure_ascii=False), time.time())
+        )
+        conn.commit()
+
+    def expire(self, ttl: float) -> None:
+        """删除过期数据，以及超过 `maxsize` 的最早写入的数据"""
+
+        conn = self._connect()
+        conn.execute('DELETE FROM cache WHERE ts <= ?', (time.time() - ttl,))
+        if self.maxsize is not None:
+            conn.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache ORDER BY ts DESC LIMIT -1 OFFSET ?)',
+                (self.maxsize,)
+            )
+        conn.commit()
+
+    def __len__(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class TTLCache:
+    """线程安全的内存缓存，超过 `ttl` 秒过期，超过 `maxsize` 时淘汰最久未用的。
+
+    设置了 `store` 时，内存中没有的再去 `store` 中找，写入时两边都写，
+    创建时和之后每写入 `STORE_EXPIRE_EVERY` 次清理一次 `store`。
+    """
+
+    # 同一个 key 的 `get_or_set` 串行执行，用固定数量的锁，按 key 的哈希选取
+    LOCK_NUM = 64
+    STORE_EXPIRE_EVERY = 500
+
+    def __init__(self, ttl: float, maxsize: int, store: Optional[SqliteStore] = None) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.store = store
+
+        self._data: OrderedDict = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(self.LOCK_NUM)]
+        self._store_writes = 0
+
+        if self.store is not None:
+            self.store.expire(ttl)
+
+    def get(self, key):
+        """没有或已过期返回 None"""
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    return entry[1]
+                del self._data[key]
+
+        if self.store is not None:
+            entry = self.store.get_entry(str(key), self.ttl)
+            if entry is not None:
+                # 保留在 `store` 中的过期时间，不因读到内存而延长
+                value, ts = entry
+                self._set(key, value, ts + self.ttl - time.time())
+                return value
+
+        return None
+
+    def set(self, key, value) -> None:
+        self._set(key, value)
+        if self.store is not None:
+            self.store.set(str(key), value)
+            with self._lock:
+                self._store_writes += 1
+                expire = self._store_writes % self.STORE_EXPIRE_EVERY == 0
+            if expire:
+                self.store.expire(self.ttl)
+
+    def _set(self, key, value, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, func):
+        """缓存中没有时调用 `func()` 获取并缓存，多个线程同时请求同一个 key 时只调用一次。
+
+        `func` 抛出异常时不缓存，异常交给调用者。
+        """
+
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._key_locks[hash(key) % self.LOCK_NUM]:
+            value = self.get(key)  # 等锁期间可能已被其他线程获取
+            if value is None:
+                value = func()
+                self.set(key, value)
+
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
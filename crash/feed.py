@@ -0,0 +1,260 @@
+"""本地变更流，爬虫每写入一行就把变化的字段追加到分段的 json lines 文件中，下游按偏移量读取。
+
+MySQL 仍是数据的唯一来源，变更流只用来通知：下游不必反复扫描表，
+从上次处理到的偏移量继续读，重启后也能从保存的偏移量重放。
+
+目录下每个分段文件名是其中第一条的偏移量，如 `00000000000000001000.jsonl`，
+偏移量从 0 开始连续递增，跨分段、跨进程都不重复。每行一条：
+
+    {"offset": 1000, "time": 1560675600.0, "table": "football_match", "op": "upsert",
+     "id": "20190616001", "changes": {"home_score": 1}}
+
+`op` 为 upsert、insert、update、delete。写入时用文件锁互斥，多个进程可以写同一个目录。
+
+create:   2026-10-18
+modified:
+"""
+
+import os
+import json
+import time
+import fcntl
+import threading
+
+from .types import *
+
+SEGMENT_SUFFIX = '.jsonl'
+
+
+def segment_name(offset: int) -> str:
+    return f'{offset:020d}{SEGMENT_SUFFIX}'
+
+
+def list_segments(directory: str) -> List[int]:
+    """目录下各分段的起始偏移量，从小到大"""
+
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in names if name.endswith(SEGMENT_SUFFIX))
+
+
+class FeedWriter:
+    """追加写入变更，分段超过 `segment_bytes` 后新开一段，最多保留 `max_segments` 段。"""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, max_segments: int = 0) -> None:
+        """
+        :param max_segments: 0 表示不删除旧分段
+        """
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, '.lock')
+        self._lock = threading.Lock()
+
+        # (最后一段的起始偏移量, 文件大小, 下一个偏移量)，文件未被其他进程改动时不必重新读取
+        self._tail: Optional[Tuple[int, int, int]] = None
+
+    def append(self, entries: List[Dict]) -> int:
+        """追加多条变更，分配偏移量，返回第一条的偏移量"""
+
+        with self._lock:
+            fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                return self._append(entries)
+            finally:
+                os.close(fd)  # 关闭时释放锁
+
+    def _append(self, entries: List[Dict]) -> int:
+        start, size, next_offset = self._locate()
+
+        if size >= self.segment_bytes:
+            start, size = next_offset, 0
+
+        now = time.time()
+        lines = []
+        for i, entry in enumerate(entries):
+            lines.append(json.dumps(
+                {'offset': next_offset + i, 'time': now, **entry}, ensure_ascii=False, default=str
+            ))
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        path = os.path.join(self.directory, segment_name(start))
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+        self._tail = (start, size + len(data), next_offset + len(entries))
+        if size == 0:
+            self._remove_old()
+
+        return next_offset
+
+    def _locate(self) -> Tuple[int, int, int]:
+        """最后一段的起始偏移量、大小，以及下一个偏移量"""
+
+        segments = list_segments(self.directory)
+        if not segments:
+            return 0, 0, 0
+
+        start = segments[-1]
+        path = os.path.join(self.directory, segment_name(start))
+        size = os.path.getsize(path)
+        if self._tail is not None and self._tail[:2] == (start, size):
+            return self._tail
+
+        size = _truncate_partial(path, size)
+        line = _last_line(path, size)
+        next_offset = start if line is None else json.loads(line)['offset'] + 1
+
+        return start, size, next_offset
+
+    def _remove_old(self) -> None:
+        if self.max_segments <= 0:
+            return
+
+        for start in list_segments(self.directory)[:-self.max_segments]:
+            try:
+                os.remove(os.path.join(self.directory, segment_name(start)))
+            except FileNotFoundError:
+                pass
+
+
+def _truncate_partial(path: str, size: int) -> int:
+    """写到一半中断的进程会留下不完整的最后一行，截掉，返回截断后的大小"""
+
+    if size == 0:
+        return 0
+
+    with open(path, 'rb+') as f:
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return size
+
+        new_size = _last_newline(f, size) + 1
+        f.truncate(new_size)
+        return new_size
+
+
+def _last_newline(f, end: int) -> int:
+    """`end` 之前最后一个换行符的位置，没有时返回 -1"""
+
+    block = 64 * 1024
+    pos = end
+    while pos > 0:
+        read_start = max(0, pos - block)
+        f.seek(read_start)
+        i = f.read(pos - read_start).rfind(b'\n')
+        if i >= 0:
+            return read_start + i
+        pos = read_start
+
+    return -1
+
+
+def _last_line(path: str, size: int) -> Optional[bytes]:
+    if size == 0:
+        return None
+
+    with open(path, 'rb') as f:
+        start = _last_newline(f, size - 1) + 1
+        f.seek(start)
+        return f.read(size - start)
+
+
+class FeedReader:
+    """按偏移量读取变更流，自己保存处理到的偏移量，下次从 `offset + 1` 继续。"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def _segment_for(self, offset: int) -> Optional[int]:
+        """包含 `offset` 的分段，已被删除时从最早的一段开始"""
+
+        segments = list_segments(self.directory)
+        if not segments:
+            return None
+
+        candidates = [start for start in segments if start <= offset]
+        return candidates[-1] if candidates else segments[0]
+
+    def read(self, offset: int = 0) -> Iterator[Dict]:
+        """读取偏移量不小于 `offset` 的已有变更，读到末尾即结束"""
+
+        yield from self.tail(offset, interval=None)
+
+    def tail(self, offset: int = 0, interval: Optional[float] = 0.2) -> Iterator[Dict]:
+        """读取偏移量不小于 `offset` 的变更，读到末尾后每 `interval` 秒检查一次新写入，
+        `interval` 为 None 时读到末尾即结束。"""
+
+        start = self._segment_for(offset)
+        while start is None:
+            if interval is None:
+                return
+            time.sleep(interval)
+            start = self._segment_for(offset)
+
+        f = open(os.path.join(self.directory, segment_name(start)), 'rb')
+        # 已有更新的分段时，这一段不会再写，再读一遍确认读完后换到下一段
+        closed = False
+        try:
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if line.endswith(b'\n'):
+                    entry = json.loads(line)
+                    if entry['offset'] >= offset:
+                        yield entry
+                    continue
+
+                # 到了末尾，或最后一行还没写完
+                f.seek(pos)
+                if closed:
+                    start = min(s for s in list_segments(self.directory) if s > start)
+                    f.close()
+                    f = open(os.path.join(self.directory, segment_name(start)), 'rb')
+                    closed = False
+                    continue
+
+                if any(s > start for s in list_segments(self.directory)):
+                    closed = True
+                    continue
+
+                if interval is None:
+                    return
+                time.sleep(interval)
+        finally:
+            f.close()
+
+
+# 所有爬虫共用，None 表示不写变更流
+_writer: Optional[FeedWriter] = None
+
+
+def set_feed_path(directory: Optional[str], segment_bytes: int = 64 * 1024 * 1024, max_segments: int = 0) -> None:
+    """设置变更流目录，None 表示不写"""
+
+    global _writer
+    if directory is None:
+        _writer = None
+    elif _writer is None or _writer.directory != directory:
+        _writer = FeedWriter(directory, segment_bytes, max_segments)
+
+
+def enabled() -> bool:
+    return _writer is not None
+
+
+def publish(entries: List[Dict]) -> None:
+    """追加变更，每条含 table、op、id、changes"""
+
+    if _writer is not None and entries:
+        _writer.append(entries)
@@ -0,0 +1,68 @@
+"""流式解析 html，只保留需要的元素，用完即释放。
+
+`etree.HTML(r.text)` 要先把整个响应解码成 str，再建完整的 DOM，而爬虫只用到
+其中的一部分子树。这里用 `HTMLPullParser` 分块喂入响应的字节，每当需要的元素
+结束就产出，调用者处理完后清空它，并删掉已处理过的兄弟节点，内存中始终只有一小部分树。
+
+create:   2026-10-18
+modified:
+"""
+
+from lxml import etree
+
+from .types import *
+
+# 每次喂给解析器的字节数
+CHUNK_SIZE: int = 64 * 1024
+
+
+def iter_elements(data: Union[bytes, str],
+                  tag: Union[str, Tuple[str, ...]],
+                  match: Optional[Callable[[etree._Element], bool]] = None,
+                  encoding: Optional[str] = None,
+                  chunk_size: int = CHUNK_SIZE,
+                  discard: Optional[Callable[[etree._Element], bool]] = None) -> Iterator[etree._Element]:
+    """逐个产出 `data` 中满足 `match` 的 `tag` 元素。
+
+    产出的元素在调用者取下一个时被清空，不要在外面保留对它或其子元素的引用。
+    `match` 为 None 时所有 `tag` 元素都产出；不满足的元素不会被清空，
+    它们可能是之后要产出的元素的子元素，满足 `discard` 的除外，
+    如在 `match` 中就过滤掉的表格，不产出也不留在内存中。
+
+    :param data: 响应体，最好直接用 `r.content`，省去解码成 str
+    :param tag: 标签名，多个标签时按在文档中结束的先后产出
+    :param encoding: 通常传 `r.encoding`，None 时由 lxml 按 <meta> 判断
+    """
+
+    parser = etree.HTMLPullParser(events=('end',), tag=tag, encoding=encoding)
+
+    for start in range(0, len(data), chunk_size):
+        parser.feed(data[start:start + chunk_size])
+        yield from _drain(parser, match, discard)
+
+    parser.close()
+    yield from _drain(parser, match, discard)
+
+
+def _drain(parser: etree.HTMLPullParser,
+           match: Optional[Callable[[etree._Element], bool]],
+           discard: Optional[Callable[[etree._Element], bool]]) -> Iterator[etree._Element]:
+
+    for _, element in parser.read_events():
+        if match is not None and not match(element):
+            if discard is not None and discard(element):
+                _free(element)
+            continue
+
+        yield element
+        _free(element)
+
+
+def _free(element: etree._Element) -> None:
+    """释放已处理的元素及其之前的兄弟节点"""
+
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
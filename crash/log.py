@@ -1,10 +1,26 @@
 """日志模块。
 
+默认同步写到标准错误。`set_output` 可改为写到按大小轮转、旧文件 gzip 压缩的文件，
+并可经队列由后台线程格式化和写入，爬虫线程只把记录放入队列。
+`set_debug_limit` 对逐条数据的 debug 日志按打日志的位置抽样和限速。
+
 Create:   2018-9-29
-Modified: 2018-10-7
+Modified: 2026-10-18
 """
 
+import os
+import sys
+import gzip
+import queue
+import shutil
+import atexit
 import logging
+import threading
+import traceback
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from .ratelimit import TokenBucket
+from .types import *
 
 ERROR = logging.ERROR
 WARNING = logging.WARNING
@@ -23,27 +39,197 @@ class SingletonMeta(type):
         return cls._instance
 
 
+class GzipRotatingFileHandler(RotatingFileHandler):
+    """文件超过 `maxBytes` 时轮转，轮转出的旧文件压缩为 `.1.gz`、`.2.gz`……"""
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0, encoding: str = 'utf-8') -> None:
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding)
+
+    def rotation_filename(self, default_name: str) -> str:
+        return default_name + '.gz'
+
+    def rotate(self, source: str, dest: str) -> None:
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+class LazyQueueHandler(QueueHandler):
+    """不在调用线程中格式化，由 `QueueListener` 的线程格式化。
+
+    `QueueHandler.prepare` 为了能跨进程传递，会先把消息格式化成字符串，
+    同一进程内不需要，记录原样入队。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # item 入库时可能还会被修改，浅拷贝一份，日志记下的是打日志时的内容
+        if isinstance(record.msg, dict):
+            record.msg = dict(record.msg)
+        return record
+
+
+class DebugLimitFilter(logging.Filter):
+    """按打日志的位置（文件、行号）抽样和限速，只作用于带 `site` 属性的记录，即 `MyLog.debug`。
+
+    同一位置每 `sample` 条保留 1 条，保留的再按每秒 `rate` 条、最多突发 `burst` 条限速。
+    有记录被丢弃时，该位置下一条保留的记录末尾注明丢弃了多少条。
+    """
+
+    def __init__(self, rate: Optional[Tuple[float, int]] = None, sample: int = 1) -> None:
+        super().__init__()
+        self.rate = rate
+        self.sample = sample
+
+        # 位置 -> [计数, 令牌桶, 已丢弃条数]
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        site = getattr(record, 'site', None)
+        if site is None:
+            return True
+
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None:
+                bucket = TokenBucket(*self.rate) if self.rate is not None else None
+                state = self._sites[site] = [0, bucket, 0]
+
+            state[0] += 1
+            keep = (state[0] - 1) % self.sample == 0
+            if keep and state[1] is not None:
+                keep = state[1].try_acquire()
+
+            if not keep:
+                state[2] += 1
+                return False
+
+            dropped, state[2] = state[2], 0
+
+        if dropped:
+            record.msg = f'{record.getMessage()} （此处省略 {dropped} 条）'
+            record.args = None
+
+        return True
+
+
 class MyLog(metaclass=SingletonMeta):
-    __slots__ = ('_logger',)
+    __slots__ = ('_logger', '_formatter', '_listener', '_output', '_debug_limit')
 
     def __init__(self, level: int=INFO) -> None:
         self._logger = logging.getLogger('MyRequests')
+        self._listener: Optional[QueueListener] = None
+        self._output: Optional[tuple] = None
+        self._debug_limit: Optional[tuple] = None
 
         self._set_logger(level)
 
     def _set_logger(self, level: int) -> None:
         self._logger.setLevel(level)
-        formatter = logging.Formatter(
+        self._formatter = logging.Formatter(
             '[%(asctime)s] [%(levelname)s] %(message)s',
             # 还有 %A 代表星期
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         cmd_handler = logging.StreamHandler()
-        cmd_handler.setFormatter(formatter)
+        cmd_handler.setFormatter(self._formatter)
         self._logger.addHandler(cmd_handler)
 
+    def set_output(self,
+                   path: Optional[str] = None,
+                   max_bytes: int = 0,
+                   backup_count: int = 0,
+                   use_queue: bool = False) -> None:
+        """设置日志输出，参数与上次相同时什么也不做。
+
+        :param path: 日志文件，None 时写到标准错误
+        :param max_bytes: 文件超过这么多字节时轮转，0 表示不轮转
+        :param backup_count: 保留的压缩旧文件个数
+        :param use_queue: 经队列由后台线程格式化和写入
+        """
+
+        output = (path, max_bytes, backup_count, use_queue)
+        if output == self._output:
+            return
+
+        if path is None:
+            handler = logging.StreamHandler()
+        else:
+            dirname = os.path.dirname(path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            handler = GzipRotatingFileHandler(path, max_bytes, backup_count)
+        handler.setFormatter(self._formatter)
+
+        self._close()
+        if use_queue:
+            q = queue.SimpleQueue()
+            self._listener = QueueListener(q, handler)
+            self._listener.start()
+            handler = LazyQueueHandler(q)
+        self._logger.addHandler(handler)
+        self._output = output
+
+    def _close(self) -> None:
+        """停止后台线程，写完队列中剩余的记录，移除并关闭所有 handler"""
+
+        if self._listener is not None:
+            self._listener.stop()
+            for h in self._listener.handlers:
+                h.close()
+            self._listener = None
+
+        for h in list(self._logger.handlers):
+            self._logger.removeHandler(h)
+            h.close()
+
+    def stop_queue(self) -> None:
+        """停止后台线程，写完队列中剩余的记录，之后改为在调用线程中同步写入。进程退出时自动调用。"""
+
+        if self._listener is None:
+            return
+
+        self._listener.stop()
+        for h in list(self._logger.handlers):
+            if isinstance(h, LazyQueueHandler):
+                self._logger.removeHandler(h)
+        for h in self._listener.handlers:
+            self._logger.addHandler(h)
+        self._listener = None
+        self._output = None
+
+    def log_uncaught(self) -> None:
+        """未捕获的异常（包括线程中的）也写到日志，而不只是标准错误"""
+
+        def excepthook(exc_type, exc_value, exc_traceback) -> None:
+            self.error(''.join(traceback.format_exception(exc_type, exc_value, exc_traceback)).rstrip())
+
+        sys.excepthook = excepthook
+        threading.excepthook = lambda args: excepthook(args.exc_type, args.exc_value, args.exc_traceback)
+
+    def set_debug_limit(self, rate: Optional[Tuple[float, int]] = None, sample: int = 1) -> None:
+        """对 `debug` 日志按位置抽样和限速，见 `DebugLimitFilter`，参数与上次相同时什么也不做。
+
+        :param rate: (每秒条数, 突发条数)，None 表示不限速
+        :param sample: 每多少条保留 1 条
+        """
+
+        debug_limit = (rate, sample)
+        if debug_limit == self._debug_limit:
+            return
+
+        for f in list(self._logger.filters):
+            if isinstance(f, DebugLimitFilter):
+                self._logger.removeFilter(f)
+        if rate is not None or sample > 1:
+            self._logger.addFilter(DebugLimitFilter(rate, sample))
+        self._debug_limit = debug_limit
+
     def debug(self, message: str) -> None:
-        self._logger.debug(message)
+        # 级别不够时不取调用位置，保持原来的开销
+        if self._logger.isEnabledFor(DEBUG):
+            frame = sys._getframe(1)
+            self._logger.debug(message, extra={'site': (frame.f_code.co_filename, frame.f_lineno)})
 
     def info(self, message: str) -> None:
         self._logger.info(message)
@@ -60,6 +246,8 @@ class MyLog(metaclass=SingletonMeta):
 
 logger = MyLog()
 
+atexit.register(logger.stop_queue)
+
 
 def test() -> None:
     logger2 = MyLog()
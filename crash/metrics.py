@@ -0,0 +1,135 @@
+"""爬虫运行指标，进程内累计，每次运行结束后导出到文件，供 node exporter 的 textfile 采集器读取。
+
+导出路径以 `.json` 结尾时导出 json，否则导出 Prometheus 文本格式。
+
+create:   2026-10-18
+modified:
+"""
+
+import os
+import json
+import threading
+
+from .types import *
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# 指标名 -> (类型, 说明)
+METRICS: Dict[str, Tuple[str, str]] = {
+    'spider_runs_total': ('counter', '运行次数'),
+    'spider_run_seconds_total': ('counter', '运行总耗时'),
+    'spider_phase_seconds_total': ('counter', '各阶段耗时，fetch、parse、transform、db'),
+    'spider_last_run_seconds': ('gauge', '最近一次运行耗时'),
+    'spider_last_run_timestamp_seconds': ('gauge', '最近一次运行结束的时间'),
+    'spider_http_requests_total': ('counter', 'HTTP 请求数，不含重试'),
+    'spider_http_retries_total': ('counter', 'HTTP 重试次数'),
+    'spider_http_failures_total': ('counter', '重试后仍失败的 HTTP 请求数'),
+    'spider_http_bytes_total': ('counter', 'HTTP 响应体字节数'),
+    'spider_rows_written_total': ('counter', '写入的行数'),
+    'spider_rows_skipped_total': ('counter', '没有变化而跳过写入的行数'),
+    'spider_db_errors_total': ('counter', '写入出错的行数，按异常类型'),
+    'spider_polls_skipped_total': ('counter', '未到轮询间隔而跳过请求和写入的对象数，按状态'),
+}
+
+
+class Registry:
+    """线程安全的指标表，(指标名, 标签) -> 值。"""
+
+    def __init__(self) -> None:
+        self._values: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        if name not in METRICS:
+            raise KeyError(f'未定义的指标 {name}')
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(name, labels), 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def to_text(self) -> str:
+        """Prometheus 文本格式"""
+
+        with self._lock:
+            items = sorted(self._values.items())
+
+        lines = []
+        last_name = None
+        for (name, labels), value in items:
+            if name != last_name:
+                kind, help_text = METRICS[name]
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                last_name = name
+            if labels:
+                label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f'{name}{{{label_str}}} {_format(value)}')
+            else:
+                lines.append(f'{name} {_format(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self) -> List[Dict]:
+        with self._lock:
+            items = sorted(self._values.items())
+
+        return [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in items]
+
+    def export(self, path: str) -> None:
+        """先写临时文件再替换，采集器不会读到写了一半的文件"""
+
+        if path.endswith('.json'):
+            content = json.dumps(self.to_json(), ensure_ascii=False, indent=1)
+        else:
+            content = self.to_text()
+
+        # 多个线程可能同时导出，各用各的临时文件
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+
+def _format(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 同一进程中所有爬虫共用
+registry = Registry()
+
+# 导出路径，None 表示不导出
+_export_path: Optional[str] = None
+
+
+def set_export_path(path: Optional[str]) -> None:
+    """每次运行结束后把指标导出到 `path`，None 表示不导出"""
+
+    global _export_path
+    _export_path = path
+
+
+def export() -> None:
+    if _export_path is not None:
+        registry.export(_export_path)
@@ -0,0 +1,57 @@
+"""按间隔轮询，每个对象（如一场比赛）有自己的请求间隔，本次运行只处理到期的。
+
+同一进程中记住每个对象上次处理的时间，常驻进程按记录判断是否到期。
+进程中没有记录时（如 crontab 每分钟启动一次新进程），按时间槽判断：
+间隔为 n 个槽的对象，只在 `槽序号 % n == 对象哈希 % n` 的槽中到期，
+不需要保存状态，各对象也均匀分散在不同的槽中。
+
+create:   2026-10-18
+modified:
+"""
+
+import time
+import zlib
+import threading
+
+from .types import *
+
+
+class PollPlanner:
+    """记录各对象上次处理的时间，判断本次是否到期。"""
+
+    def __init__(self, slot: float = 60) -> None:
+        """
+        :param slot: 时间槽秒数，与运行间隔一致
+        """
+
+        self.slot = slot
+
+        # 对象 -> 上次处理的时间
+        self._last: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def due(self, key: str, interval: Optional[float], now: Optional[float] = None) -> bool:
+        """`key` 本次是否到期，到期时记为已处理。
+
+        :param interval: 间隔秒数，0 表示每次都到期，None 表示不再处理
+        """
+
+        if interval is None:
+            return False
+
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            last = self._last.get(key)
+            if last is None:
+                n = max(1, int(interval // self.slot))
+                is_due = int(now // self.slot) % n == zlib.crc32(key.encode()) % n
+            else:
+                # 运行时间有抖动，差半个槽也算到期
+                is_due = now - last >= interval - self.slot / 2
+
+            if is_due:
+                self._last[key] = now
+
+        return is_due
@@ -0,0 +1,142 @@
+"""按主机限速的令牌桶，同一进程中所有线程共享，可选用本地文件在多个进程间共享。
+
+create:   2026-10-18
+modified:
+"""
+
+import os
+import time
+import fcntl
+import threading
+
+from .types import *
+
+
+class TokenBucket:
+    """每秒补充 `rate` 个令牌，最多攒 `burst` 个，每个请求取一个。"""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """取一个令牌，成功返回 0，否则返回还需等待的秒数"""
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        """不等待，取得令牌返回 True，没有令牌返回 False"""
+
+        return self._take() <= 0
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[float]:
+        """阻塞直到取得令牌，返回等待的秒数。
+
+        :param timeout: 最多等待的秒数，预计等不到令牌时立即返回 None，None 表示一直等
+        """
+
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                return None
+            time.sleep(wait)
+            waited += wait
+
+
+class FileTokenBucket(TokenBucket):
+    """状态保存在文件中，用 `flock` 互斥，打开同一文件的进程共享一个桶。"""
+
+    def __init__(self, rate: float, burst: int, path: str) -> None:
+        super().__init__(rate, burst)
+        self.path = path
+
+    def _take(self) -> float:
+        # 进程内先串行，避免多个线程同时抢文件锁
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.read(fd, 64).split()
+                now = time.time()  # 跨进程只能用墙上时间
+                if len(data) == 2:
+                    tokens, last = float(data[0]), float(data[1])
+                    tokens = min(self.burst, tokens + max(0.0, now - last) * self.rate)
+                else:  # 新文件
+                    tokens = float(self.burst)
+
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / self.rate
+
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, f'{tokens} {now}'.encode())
+            finally:
+                os.close(fd)  # 关闭时释放锁
+
+        return wait
+
+
+class RateLimiter:
+    """主机 -> 令牌桶，没有配置的主机不限速。"""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, rate: float, burst: int, path: Optional[str] = None) -> None:
+        with self._lock:
+            if path is None:
+                self._buckets[host] = TokenBucket(rate, burst)
+            else:
+                self._buckets[host] = FileTokenBucket(rate, burst, path)
+
+    def acquire(self, host: str, timeout: Optional[float] = None) -> Optional[float]:
+        """取得 `host` 的一个令牌，返回等待的秒数，`timeout` 秒内等不到时返回 None"""
+
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            return 0.0
+
+        return bucket.acquire(timeout)
+
+    def try_acquire(self, host: str) -> bool:
+        """不等待，取得 `host` 的一个令牌返回 True，没有令牌返回 False"""
+
+        bucket = self._buckets.get(host)
+        return bucket is None or bucket.try_acquire()
+
+
+# 同一进程中所有会话共用
+limiter = RateLimiter()
+
+
+def set_rate_limit(rate_limit: Dict[str, Tuple[float, int]], lock_dir: Optional[str] = None) -> None:
+    """配置各主机的限速。
+
+    :param rate_limit: 主机 -> (每秒请求数, 突发数)
+    :param lock_dir: 设置后，令牌桶状态存放在这个目录下，多个进程共享
+    """
+
+    if lock_dir is not None:
+        os.makedirs(lock_dir, exist_ok=True)
+
+    for host, (rate, burst) in rate_limit.items():
+        path = None if lock_dir is None else os.path.join(lock_dir, f'{host}.bucket')
+        limiter.configure(host, rate, burst, path)
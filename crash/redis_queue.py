@@ -0,0 +1,228 @@
+"""基于 Redis 的任务队列，多个节点上的多个进程共同消费，接口与 `queue.Queue` 相同。
+
+每个任务有一个 id（如 match_bf_id），在队列中或处理中的 id 不会重复入队。
+取出的任务在 `visibility_timeout` 秒内须调用 `task_done` 确认，否则重新入队，
+由其他消费者处理，即处理进程崩溃、断网的任务不会丢失，但可能处理不止一次。
+
+键：
+    {name}:pending   待处理的任务 id，LPUSH 入队，RPOP 出队
+    {name}:tasks     任务 id -> 任务内容 json，确认后删除
+    {name}:inflight  处理中的任务 id，分数为超时的时间
+    {name}:done:{id} 设置了 `done_ttl` 时，确认后保留这么多秒，期间同一 id 不再入队
+    {name}:workers   消费者名
+    {name}:stats:{worker}  各消费者完成数、处理耗时、超时数
+
+create:   2026-10-18
+modified:
+"""
+
+import os
+import json
+import time
+import queue
+import socket
+import threading
+
+import redis
+
+from .types import *
+
+# 先把超时的任务放回队列，再出队一个，记为处理中，用 Redis 的时间，各节点不必对时
+_POP_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[3], id)
+    redis.call('RPUSH', KEYS[1], id)
+end
+if #expired > 0 then
+    redis.call('HINCRBY', KEYS[4], 'expired', #expired)
+end
+
+while true do
+    local id = redis.call('RPOP', KEYS[1])
+    if not id then
+        return nil
+    end
+    local task = redis.call('HGET', KEYS[2], id)
+    -- 超时后重新入队的任务，可能已被原来的消费者确认
+    if task then
+        redis.call('ZADD', KEYS[3], now + tonumber(ARGV[1]), id)
+        return {id, task}
+    end
+end
+"""
+
+# 不在队列中、处理中，也没有刚完成时入队
+_PUT_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+if redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[1])
+return 1
+"""
+
+_ACK_SCRIPT = """
+local removed = redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('SET', KEYS[3], 1, 'EX', ARGV[2])
+end
+return removed
+"""
+
+
+def default_worker_name() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class RedisTaskQueue:
+    """多个进程共享的任务队列。
+
+    `get_nowait` 取出的任务记在当前线程上，处理完后由同一线程调用 `task_done` 确认，
+    与 `queue.Queue` 用法一致，爬虫不必区分两种队列。
+    """
+
+    def __init__(self,
+                 redis_config: RedisConfig,
+                 name: str,
+                 key: Callable[[Any], str] = str,
+                 visibility_timeout: float = 60,
+                 done_ttl: int = 0,
+                 worker: Optional[str] = None) -> None:
+        """
+        :param name: 队列名，作为键的前缀
+        :param key: 任务 -> 任务 id，用于去重
+        :param visibility_timeout: 取出后这么多秒内未确认，重新入队
+        :param done_ttl: 确认后这么多秒内同一 id 不再入队，0 表示确认后即可再入队
+        :param worker: 消费者名，默认为主机名和进程号
+        """
+
+        self.name = name
+        self.key = key
+        self.visibility_timeout = visibility_timeout
+        self.done_ttl = done_ttl
+        self.worker = worker or default_worker_name()
+
+        self.redis = redis.Redis(**redis_config)
+        self._pop = self.redis.register_script(_POP_SCRIPT)
+        self._put = self.redis.register_script(_PUT_SCRIPT)
+        self._ack = self.redis.register_script(_ACK_SCRIPT)
+
+        self.pending_key = f'{name}:pending'
+        self.tasks_key = f'{name}:tasks'
+        self.inflight_key = f'{name}:inflight'
+        self.workers_key = f'{name}:workers'
+        self.counters_key = f'{name}:counters'
+
+        # 当前线程取出的 (任务 id, 取出的时间)
+        self._local = threading.local()
+
+    def _done_key(self, task_id: str) -> str:
+        return f'{self.name}:done:{task_id}'
+
+    def _stats_key(self, worker: str) -> str:
+        return f'{self.name}:stats:{worker}'
+
+    def put(self, task: Any) -> bool:
+        """入队，同一 id 已在队列中、处理中或刚完成时不入队，返回是否入队"""
+
+        task_id = self.key(task)
+        added = self._put(
+            keys=[self.pending_key, self.tasks_key, self._done_key(task_id)],
+            args=[task_id, json.dumps(task, ensure_ascii=False, default=str)],
+        )
+        return bool(added)
+
+    def get_nowait(self) -> Any:
+        """出队一个任务，队列为空时抛出 `queue.Empty`"""
+
+        result = self._pop(
+            keys=[self.pending_key, self.tasks_key, self.inflight_key, self.counters_key],
+            args=[self.visibility_timeout],
+        )
+        if result is None:
+            raise queue.Empty
+
+        task_id, task = result
+        self._local.current = (task_id.decode(), time.monotonic())
+
+        return json.loads(task)
+
+    def task_done(self) -> None:
+        """确认当前线程取出的任务已处理完，计入本消费者的统计"""
+
+        current = getattr(self._local, 'current', None)
+        if current is None:
+            return
+        self._local.current = None
+
+        task_id, start = current
+        acked = self._ack(
+            keys=[self.inflight_key, self.tasks_key, self._done_key(task_id)],
+            args=[task_id, self.done_ttl],
+        )
+
+        stats_key = self._stats_key(self.worker)
+        with self.redis.pipeline() as pipe:
+            pipe.sadd(self.workers_key, self.worker)
+            pipe.hincrby(stats_key, 'done', 1)
+            pipe.hincrbyfloat(stats_key, 'busy_seconds', time.monotonic() - start)
+            if not acked:  # 已超时，可能被其他消费者重复处理
+                pipe.hincrby(stats_key, 'late', 1)
+            pipe.hset(stats_key, 'last_done', time.time())
+            pipe.hsetnx(stats_key, 'first_done', time.time())
+            pipe.execute()
+
+    def extend(self, seconds: Optional[float] = None) -> None:
+        """处理较慢时延长当前线程任务的超时时间"""
+
+        current = getattr(self._local, 'current', None)
+        if current is None:
+            return
+
+        t = self.redis.time()
+        deadline = t[0] + t[1] / 1e6 + (seconds or self.visibility_timeout)
+        self.redis.zadd(self.inflight_key, {current[0]: deadline}, xx=True)
+
+    def qsize(self) -> int:
+        """待处理的任务数，不含处理中的"""
+
+        return self.redis.llen(self.pending_key)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def inflight(self) -> int:
+        return self.redis.zcard(self.inflight_key)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各消费者的完成数、处理耗时，以及完成速率 tasks/s（首次到最近一次完成）"""
+
+        result = {}
+        for worker in sorted(w.decode() for w in self.redis.smembers(self.workers_key)):
+            raw = self.redis.hgetall(self._stats_key(worker))
+            s = {k.decode(): float(v) for k, v in raw.items()}
+            span = s.get('last_done', 0) - s.get('first_done', 0)
+            s['tasks_per_s'] = s.get('done', 0) / span if span > 0 else 0.0
+            result[worker] = s
+
+        return result
+
+    def expired(self) -> int:
+        """超时后重新入队的次数"""
+
+        return int(self.redis.hget(self.counters_key, 'expired') or 0)
+
+    def clear(self) -> None:
+        """删除队列的所有键"""
+
+        keys = [self.pending_key, self.tasks_key, self.inflight_key, self.workers_key, self.counters_key]
+        keys.extend(self.redis.scan_iter(f'{self.name}:stats:*'))
+        keys.extend(self.redis.scan_iter(f'{self.name}:done:*'))
+        self.redis.delete(*keys)
@@ -0,0 +1,222 @@
+"""录制 HTTP 请求和响应，用本地桩服务器回放，离线运行和压测爬虫。
+
+录制：`sessions.set_recorder(path)` 后，`Session` 的每个响应都追加到 json lines 文件中。
+
+回放：`StubServer` 读取录制的文件，按请求方法、地址和请求体返回录制的响应，
+可设置延迟和按比例注入错误。`sessions.set_base_url(base_url)` 后，
+`https://live.aicai.com/a?b=1` 这样的请求发到 `{base_url}/live.aicai.com/a?b=1`。
+
+create:   2026-10-18
+modified:
+"""
+
+import json
+import time
+import base64
+import random
+import socket
+import threading
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from requests.models import Response
+
+from .log import logger
+from .types import *
+
+# 录制时保存的响应头，其他的如 Content-Length、Set-Cookie 不保存
+SAVED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+Key = Tuple[str, str, str]
+
+
+def to_stub_url(url: str, base_url: str) -> str:
+    """把原地址改写成桩服务器上的地址，主机名作为路径的第一段"""
+
+    parts = urlsplit(url)
+    stub_url = f'{base_url.rstrip("/")}/{parts.netloc}{parts.path}'
+    if parts.query:
+        stub_url += '?' + parts.query
+
+    return stub_url
+
+
+def request_key(method: str, url: str, body: Union[str, bytes, None]) -> Key:
+    """(方法, 不含协议的地址, 请求体)，`url` 可以是原地址，也可以是桩服务器收到的路径"""
+
+    parts = urlsplit(url)
+    if parts.netloc:
+        location = parts.netloc + parts.path
+    else:  # 桩服务器收到的 /{主机}/{路径}
+        location = parts.path.lstrip('/')
+    if parts.query:
+        location += '?' + parts.query
+
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+
+    return method.upper(), location, body or ''
+
+
+class Recorder:
+    """把请求和响应逐行追加到 json lines 文件中，所有会话、线程共用一个。"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, method: str, url: str, body: Union[str, bytes, None], r: Response) -> None:
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+
+        line = json.dumps({
+            'time': time.time(),
+            'method': method.upper(),
+            'url': url,
+            'body': body,
+            'status': r.status_code,
+            'headers': {k: r.headers[k] for k in SAVED_HEADERS if k in r.headers},
+            'content': base64.b64encode(r.content).decode(),
+        }, ensure_ascii=False)
+
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def load_archive(path: str) -> Dict[Key, List[Dict]]:
+    """读取录制的文件，同一请求的多个响应按录制顺序排列"""
+
+    archive: Dict[Key, List[Dict]] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            entry['content'] = base64.b64decode(entry['content'])
+            key = request_key(entry['method'], entry['url'], entry['body'])
+            archive.setdefault(key, []).append(entry)
+
+    return archive
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        self.server.reply(self)
+
+    def do_POST(self) -> None:
+        self.server.reply(self)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug('stub: ' + format % args)
+
+
+class StubServer(ThreadingHTTPServer):
+    """回放录制的响应。
+
+    同一请求录制了多个响应时依次返回，用完后一直返回最后一个，与页面随时间变化一致。
+    每个请求先等待 `latency` ± `jitter` 秒，再按 `reset_rate` 的比例直接断开连接，
+    按 `error_rate` 的比例返回 `error_status`，用于观察重试、熔断：
+    会话把断开连接和 5xx、429 都当作失败，重试并计入熔断。
+    """
+
+    daemon_threads = True
+
+    def __init__(self,
+                 archive: Dict[Key, List[Dict]],
+                 address: Tuple[str, int] = ('127.0.0.1', 8000),
+                 latency: float = 0,
+                 jitter: float = 0,
+                 error_rate: float = 0,
+                 reset_rate: float = 0,
+                 error_status: int = 503) -> None:
+
+        super().__init__(address, StubHandler)
+
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.error_status = error_status
+
+        # 请求 -> 已返回的次数
+        self._served: Dict[Key, int] = {}
+        self._lock = threading.Lock()
+        # 请求统计
+        self.stats: Dict[str, int] = {
+            'requests': 0,
+            'not_found': 0,
+            'not_modified': 0,
+            'errors': 0,  # 注入的错误状态码
+            'resets': 0,  # 注入的断开连接
+        }
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _next_entry(self, key: Key) -> Optional[Dict]:
+        entries = self.archive.get(key)
+        if not entries:
+            return None
+
+        with self._lock:
+            i = self._served.get(key, 0)
+            self._served[key] = i + 1
+
+        return entries[min(i, len(entries) - 1)]
+
+    def reply(self, handler: StubHandler) -> None:
+        self._count('requests')
+
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else None
+        key = request_key(handler.command, handler.path, body)
+
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < self.reset_rate:
+            self._count('resets')
+            handler.close_connection = True
+            # 不发响应直接关闭，客户端得到 ConnectionError
+            handler.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        if random.random() < self.error_rate:
+            self._count('errors')
+            handler.send_error(self.error_status)
+            return
+
+        entry = self._next_entry(key)
+        if entry is None:
+            self._count('not_found')
+            logger.warning(f'stub: 没有录制 {key}')
+            handler.send_error(404)
+            return
+
+        headers = entry['headers']
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if (etag and handler.headers.get('If-None-Match') == etag) or \
+                (last_modified and handler.headers.get('If-Modified-Since') == last_modified):
+            self._count('not_modified')
+            handler.send_response(304)
+            handler.end_headers()
+            return
+
+        content = entry['content']
+        handler.send_response(entry['status'])
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Length', str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
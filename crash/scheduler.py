@@ -0,0 +1,203 @@
+"""常驻调度器，在一个进程中按各自的间隔反复运行爬虫。
+
+爬虫实例只创建一次，HTTP 会话和 MySQL 连接在多次运行之间复用，
+省去每次启动解释器、导入模块、建立连接和 TLS 握手的开销。
+
+互不依赖的爬虫在线程池中并发运行，有依赖的（如 betfair_detail 读取
+betfair 写入的数据）等依赖运行结束后再开始。
+
+create:   2026-10-18
+modified:
+"""
+
+import time
+import threading
+import traceback
+from concurrent import futures
+
+from . import log
+from .spider import MultiThreadSpider
+from .types import *
+
+
+class Job:
+    """一个定时运行的爬虫，持有复用的爬虫实例。"""
+
+    __slots__ = ('spider_class', 'interval', 'after', 'spiders', 'next_run',
+                 'future', 'elapsed')
+
+    def __init__(self,
+                 spider_class: Type[MultiThreadSpider],
+                 interval: float,
+                 thread_num: int,
+                 mysql_config: MysqlConfig,
+                 after: Tuple['Job', ...] = ()) -> None:
+
+        self.spider_class = spider_class
+        self.interval = interval
+        # 依赖的任务，同一轮中须等它们运行结束
+        self.after = after
+        self.spiders: List[MultiThreadSpider] = [
+            spider_class(f'thread{i+1}', mysql_config) for i in range(thread_num)
+        ]
+        self.next_run = 0.0
+        self.future: Optional[futures.Future] = None
+        # 最近一次运行耗时
+        self.elapsed = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+    @property
+    def name(self) -> str:
+        return self.spider_class.__name__
+
+    def run(self) -> None:
+        # 先设置本次运行的截止时间、开始计时，`prepare` 中的请求也受限、计入本次运行
+        for s in self.spiders:
+            s.before_run()
+        self.spiders[0].prepare()
+
+        if len(self.spiders) == 1:
+            self.spiders[0].crawl()
+            return
+
+        thread_list = [
+            threading.Thread(target=s.crawl, name=f'{self.name}-{s.name}')
+            for s in self.spiders
+        ]
+        for t in thread_list:
+            t.start()
+        for t in thread_list:
+            t.join()
+
+    def terminate(self) -> None:
+        for s in self.spiders:
+            s.terminate()
+
+
+class Scheduler:
+
+    def __init__(self, mysql_config: MysqlConfig) -> None:
+        self.mysql_config = mysql_config
+        self.jobs: List[Job] = []
+        self._executor: Optional[futures.ThreadPoolExecutor] = None
+
+    def add(self,
+            spider_class: Type[MultiThreadSpider],
+            interval: float = 60,
+            thread_num: int = 1,
+            after: Tuple[Job, ...] = ()) -> Job:
+        """注册爬虫，每 `interval` 秒运行一次。
+
+        :param after: 依赖的任务，必须已经注册，保证提交顺序就是拓扑顺序
+        """
+
+        for dep in after:
+            if dep not in self.jobs:
+                raise ValueError(f'{dep.name} 须先于 {spider_class.__name__} 注册')
+
+        job = Job(spider_class, interval, thread_num, self.mysql_config, after)
+        self.jobs.append(job)
+        log.logger.info(f'{job.name} 已注册，间隔 {interval}s，线程数 {thread_num}')
+
+        return job
+
+    def run_job(self, job: Job, deps: List[Job]) -> float:
+        """等待依赖结束后运行一次任务，返回耗时。异常只记录日志，不影响其他任务。"""
+
+        for dep in deps:
+            if dep.future is not None:
+                futures.wait([dep.future])
+
+        start = time.monotonic()
+        try:
+            job.run()
+        except Exception:
+            log.logger.error(f'{job.name} 运行出错\n{traceback.format_exc()}')
+        job.elapsed = time.monotonic() - start
+        log.logger.info(f'{job.name} 运行结束，耗时 {job.elapsed:.2f}s')
+
+        return job.elapsed
+
+    def submit(self, jobs: List[Job]) -> List[futures.Future]:
+        """并发运行 `jobs`，其中的任务按注册顺序提交，依赖总是先于被依赖者开始。"""
+
+        if self._executor is None:
+            # 每个任务一个线程，等待依赖的任务不会占满线程池
+            self._executor = futures.ThreadPoolExecutor(
+                max_workers=len(self.jobs), thread_name_prefix='scheduler'
+            )
+
+        fs = []
+        for job in jobs:
+            # 只等待本轮一起提交的或仍在运行的依赖
+            deps = [dep for dep in job.after if dep in jobs or dep.running]
+            job.future = self._executor.submit(self.run_job, job, deps)
+            fs.append(job.future)
+
+        return fs
+
+    def run_pending(self) -> None:
+        """提交所有到期且不在运行中的任务，不等待其结束。"""
+
+        now = time.monotonic()
+        due = []
+        for job in self.jobs:
+            if job.next_run > now:
+                continue
+            # 按开始时间计算下次运行时间，运行超时则下一轮立即运行
+            job.next_run = now + job.interval
+            if job.running:
+                log.logger.warning(f'{job.name} 上次运行还未结束，跳过本轮')
+                continue
+            due.append(job)
+
+        if due:
+            self.submit(due)
+
+    def run_once(self) -> None:
+        """所有任务各运行一次，等待全部结束后输出耗时和关键路径。"""
+
+        start = time.monotonic()
+        futures.wait(self.submit(self.jobs))
+        elapsed = time.monotonic() - start
+
+        for job in sorted(self.jobs, key=lambda j: j.elapsed, reverse=True):
+            log.logger.info(f'{job.name:<32}{job.elapsed:>8.2f}s')
+
+        path, path_time = self.critical_path()
+        log.logger.info(
+            f'总耗时 {elapsed:.2f}s，关键路径 {" -> ".join(j.name for j in path)} '
+            f'({path_time:.2f}s)'
+        )
+
+    def critical_path(self) -> Tuple[List[Job], float]:
+        """按最近一次运行耗时，求依赖链上耗时之和最大的一条。"""
+
+        best: Dict[Job, Tuple[List[Job], float]] = {}
+        for job in self.jobs:  # 注册顺序即拓扑顺序
+            path, t = max(
+                (best[dep] for dep in job.after), key=lambda x: x[1], default=([], 0.0)
+            )
+            best[job] = (path + [job], t + job.elapsed)
+
+        return max(best.values(), key=lambda x: x[1], default=([], 0.0))
+
+    def shutdown(self) -> None:
+        for job in self.jobs:
+            job.terminate()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def run_forever(self) -> None:
+        try:
+            while True:
+                self.run_pending()
+                delay = min(job.next_run for job in self.jobs) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        except KeyboardInterrupt:
+            self.shutdown()
+            exit(1)
@@ -1,23 +1,288 @@
 """改进 requests `Session` 类的 `requests` 方法。
 
 Create:   2018-8-28
-Modified: 2018-10-7
+Modified: 2026-10-18
 """
 
 import time
+import email.utils
+import random
+import hashlib
+import threading
+from urllib.parse import urlparse
 
 from requests import Session as _Session
-from requests.models import Request
+from requests.models import Request, Response
 from requests.exceptions import Timeout, ConnectionError, ChunkedEncodingError
 
 from .log import logger
+from .ratelimit import limiter
+from .replay import Recorder, to_stub_url
+from .types import *
 
 # 请求失败后, 尝试次数
 PER_REQUEST_TRY_COUNT: int = 4
+# 重试前等待时间的基数和上限，第 i 次重试在 [0, min(上限, 基数 * 2^i)] 中随机
+BACKOFF_BASE: float = 1
+BACKOFF_MAX: float = 30
+# 单个请求包括重试在内的总耗时上限
+REQUEST_DEADLINE: float = 300
+# 同一主机连续失败这么多次后熔断，熔断期间请求直接失败
+BREAKER_THRESHOLD: int = 5
+# 熔断多少秒后放行一个试探请求
+BREAKER_RESET_TIMEOUT: float = 60
+
+
+def retryable_status(status: int) -> bool:
+    """5xx 和 429 是暂时的错误，重试，其他状态码（含 4xx）原样返回给调用者"""
+
+    return status >= 500 or status == 429
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 头的秒数，值为秒数或 HTTP 日期，没有或无法解析时返回 None"""
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        dt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, dt.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """重试策略，指数退避加随机抖动，单个请求总耗时不超过 `deadline` 秒。"""
+
+    __slots__ = ('max_retries', 'backoff_base', 'backoff_max', 'deadline')
+
+    def __init__(self,
+                 max_retries: int = PER_REQUEST_TRY_COUNT,
+                 backoff_base: float = BACKOFF_BASE,
+                 backoff_max: float = BACKOFF_MAX,
+                 deadline: float = REQUEST_DEADLINE) -> None:
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        """第 `attempt` 次（从 0 开始）重试前等待的秒数"""
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """一个主机的熔断器。
+
+    连续失败 `threshold` 次后打开，`reset_timeout` 秒内的请求直接失败；
+    之后放行一个试探请求，成功则关闭，失败则重新计时。
+    """
+
+    def __init__(self,
+                 threshold: int = BREAKER_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT) -> None:
+
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        # 打开的时间，None 表示关闭
+        self.opened_at: Optional[float] = None
+        # 半开状态下放行的试探请求所在的线程，None 表示还没有放行
+        self._probing: Optional[int] = None
+        # 累计熔断次数
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._probing is not None:
+                return False
+            self._probing = threading.get_ident()
+            return True
+
+    def release(self) -> None:
+        """放行的请求既没有成功也没有失败就结束时调用，如超过截止时间未发出、
+        出现与主机无关的异常。若它是试探请求，之后的请求可以重新试探。"""
+
+        with self._lock:
+            if self._probing == threading.get_ident():
+                self._probing = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = None
+
+    def record_failure(self) -> bool:
+        """记录一次失败，本次导致熔断时返回 True"""
+
+        with self._lock:
+            self.failures += 1
+            if self._probing is not None or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self._probing = None
+                self.trips += 1
+                return True
+            return False
+
+
+# 主机 -> 熔断器，同一进程中所有会话共用
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker()
+
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Union[int, bool]]]:
+    """各主机熔断器的状态"""
+
+    with _breakers_lock:
+        return {
+            host: {'open': b.is_open, 'failures': b.failures, 'trips': b.trips}
+            for host, b in _breakers.items()
+        }
+
+
+# 录制所有会话的请求和响应，None 表示不录制
+_recorder: Optional[Recorder] = None
+# 所有会话的请求改发到这个地址，如本地桩服务器，None 表示发到原地址
+_base_url: Optional[str] = None
+
+
+def set_recorder(path: Optional[str]) -> None:
+    """把请求和响应录制到 `path`，供 `replay.StubServer` 回放，None 表示不录制"""
+
+    global _recorder
+    _recorder = None if path is None else Recorder(path)
+
+
+def set_base_url(base_url: Optional[str]) -> None:
+    """请求改发到 `base_url`，如 'http://127.0.0.1:8000'，None 表示发到原地址。
+
+    限速和熔断仍按原主机计算。
+    """
+
+    global _base_url
+    _base_url = base_url
 
 
 class Session(_Session):
 
+    def __init__(self, retry_policy: Optional[RetryPolicy] = None) -> None:
+        super().__init__()
+
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 本次运行的截止时间（`time.monotonic()`），之后的请求直接失败
+        self.run_deadline: Optional[float] = None
+        # 每次发出请求（含重试）前调用，参数为本次请求剩余的截止秒数，如延长任务队列中当前任务的超时
+        self.before_attempt: Optional[Callable[[float], None]] = None
+        # 请求统计
+        self.stats: Dict[str, int] = {
+            'requests': 0,  # 请求次数，不含重试
+            'retries': 0,
+            'failures': 0,  # 重试后仍失败
+            'short_circuits': 0,  # 因熔断或超过截止时间未发出
+            'trips': 0,  # 本会话的失败导致熔断的次数
+            'throttled': 0,  # 因限速等待的次数
+            'bytes': 0,  # 响应体字节数
+            'seconds': 0.0,  # 发送请求、等待响应的耗时，含重试，不含退避和限速等待
+        }
+
+        # url -> 条件请求头，由上次响应的 ETag、Last-Modified 生成
+        self._validators: Dict[str, Dict[str, str]] = {}
+        # key -> 上次内容的哈希
+        self._digests: Dict[str, str] = {}
+        # key -> 本次收到、还未入库的 (条件请求头, 哈希)，`commit_digest` 后才生效
+        self._pending: Dict[str, Tuple[Optional[Dict[str, str]], str]] = {}
+
+    def set_run_deadline(self, seconds: Optional[float]) -> None:
+        """从现在起 `seconds` 秒后，本会话的请求不再发出，None 表示不限"""
+
+        self.run_deadline = None if seconds is None else time.monotonic() + seconds
+
+    def get_if_changed(self, url: str, **kwargs) -> Optional[Response]:
+        """带 If-None-Match、If-Modified-Since 的 GET。
+
+        服务端返回 304，或内容与上次请求该 url 时相同，返回 None，调用者可跳过解析和入库。
+        请求失败也返回 None。入库成功后须调用 `commit_digest(url)`，否则下次仍按有变化处理。
+        """
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(self._validators.get(url, {}))
+
+        r = self.get(url, headers=headers, **kwargs)
+        if r is None:
+            return None
+        if r.status_code == 304:
+            logger.info(f'页面未修改: {url}')
+            return None
+
+        validators = {}
+        if 'ETag' in r.headers:
+            validators['If-None-Match'] = r.headers['ETag']
+        if 'Last-Modified' in r.headers:
+            validators['If-Modified-Since'] = r.headers['Last-Modified']
+
+        if not self.changed(url, r.content):
+            logger.info(f'页面内容没有变化: {url}')
+            return None
+        self._pending[url] = (validators, self._pending[url][1])
+
+        return r
+
+    def changed(self, key: str, content: Union[str, bytes]) -> bool:
+        """`content` 与上次提交的同一个 `key` 的内容不同时返回 True。
+
+        本次的哈希在 `commit_digest(key)` 后才作为比较的依据，
+        调用者须在解析、入库都成功后再提交，失败的下次仍会重新处理。
+        """
+
+        if isinstance(content, str):
+            content = content.encode()
+        digest = hashlib.sha1(content).hexdigest()
+
+        if self._digests.get(key) == digest:
+            return False
+        self._pending[key] = (None, digest)
+
+        return True
+
+    def commit_digest(self, key: str) -> None:
+        """`key` 本次的内容已处理完，之后内容不变时 `changed` 返回 False，`get_if_changed` 带上条件请求头"""
+
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+
+        validators, digest = pending
+        self._digests[key] = digest
+        if validators is not None:
+            self._validators[key] = validators
+
     def request(self, method, url,
                 params=None,
                 data=None,
@@ -62,18 +327,95 @@ class Session(_Session):
 
         message = '%s: %s' % (method, prep.url)
         logger.info(message)
+        self.stats['requests'] += 1
+
+        host = urlparse(prep.url).hostname or ''
+        url = prep.url
+        if _base_url is not None:
+            prep.url = to_stub_url(url, _base_url)
+        breaker = get_breaker(host)
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline
+        if self.run_deadline is not None:
+            deadline = min(deadline, self.run_deadline)
+
         why = ''
-        for i in range(PER_REQUEST_TRY_COUNT + 1):
+        for i in range(policy.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                why = 'Deadline'
+                self.stats['short_circuits'] += 1
+                break
+            if not breaker.allow():
+                why = f'CircuitOpen({host})'
+                self.stats['short_circuits'] += 1
+                break
+
+            # 每个出口都须把结果告诉熔断器，否则半开时的试探请求一直占着，该主机不再放行
+            settled = False
             try:
-                r = self.send(prep, **send_kwargs)
-                return r
-            except Timeout:
-                why = 'Timeout'
-            except ConnectionError:
-                why = 'ConnectionError'
-            except ChunkedEncodingError:  # 读到的字节数与实际字节数不符
-                why = 'ChunkedEncodingError'
-            if i != PER_REQUEST_TRY_COUNT:
-                logger.warning('%s, retry %d >>> %s' % (why, i + 1, message))
-                time.sleep(3)
+                # 限速等待不超过剩余的截止时间
+                waited = limiter.acquire(host, remaining)
+                if waited is None:
+                    why = 'Deadline'
+                    self.stats['short_circuits'] += 1
+                    break
+                if waited > 0:
+                    self.stats['throttled'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        why = 'Deadline'
+                        self.stats['short_circuits'] += 1
+                        break
+
+                if isinstance(timeout, (int, float)):
+                    send_kwargs['timeout'] = min(timeout, remaining)
+                if self.before_attempt is not None:
+                    self.before_attempt(remaining)
+
+                start = time.monotonic()
+                retry_after = None
+                try:
+                    r = self.send(prep, **send_kwargs)
+                except Timeout:
+                    why = 'Timeout'
+                except ConnectionError:
+                    why = 'ConnectionError'
+                except ChunkedEncodingError:  # 读到的字节数与实际字节数不符
+                    why = 'ChunkedEncodingError'
+                else:
+                    self.stats['bytes'] += len(r.content)
+                    if not retryable_status(r.status_code):
+                        self.stats['seconds'] += time.monotonic() - start
+                        breaker.record_success()
+                        settled = True
+                        if _recorder is not None and r.status_code != 304:  # 304 没有内容，不录制
+                            _recorder.record(method, url, prep.body, r)
+                        return r
+
+                    # 服务端出错或要求降速，与连接失败一样重试、计入熔断
+                    why = f'HTTP {r.status_code}'
+                    retry_after = parse_retry_after(r.headers.get('Retry-After'))
+                    r.close()
+                self.stats['seconds'] += time.monotonic() - start
+
+                settled = True
+                if breaker.record_failure():
+                    self.stats['trips'] += 1
+                    logger.error(f'{host} 连续失败，熔断 {breaker.reset_timeout}s')
+            finally:
+                if not settled:
+                    breaker.release()
+
+            if i != policy.max_retries:
+                delay = policy.backoff(i)
+                if retry_after is not None:  # 服务端指定了等待时间，不早于它重试
+                    delay = max(delay, retry_after)
+                if time.monotonic() + delay >= deadline:
+                    break
+                self.stats['retries'] += 1
+                logger.warning('%s, retry %d after %.1fs >>> %s' % (why, i + 1, delay, message))
+                time.sleep(delay)
+
+        self.stats['failures'] += 1
         logger.error('%s, %s' % (why, message))
@@ -1,19 +1,106 @@
 """通用爬虫类，数据存储在 MySQL 中。
 
 create:   2018-12-12
-modified: 2019-05-28
+modified: 2026-10-18
 """
 
+import time
 import atexit
 import threading
 import queue
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import pymysql
+from pymysql.cursors import DictCursor
 
-from . import sessions, db, log
+from . import sessions, db, log, metrics, feed, redis_queue
 from .types import *
 
 
+# 跳过重复写入时，所有表合计最多记住的行数，以及最多记住的已预热条件数
+LAST_WRITTEN_MAXSIZE: int = 200000
+WARMED_MAXSIZE: int = 1000
+
+
+class LastWritten:
+    """各表最近一次写入的数据，(表名, id) -> {字段: 值}，值统一成字符串。
+
+    超过 `maxsize` 行时淘汰最久未用的，常驻进程中不会随天数无限增长。
+    被淘汰的行只是不再跳过，下次照常写入。
+    """
+
+    def __init__(self, maxsize: int = LAST_WRITTEN_MAXSIZE, warmed_maxsize: int = WARMED_MAXSIZE) -> None:
+        self.maxsize = maxsize
+        self.warmed_maxsize = warmed_maxsize
+
+        self._rows: OrderedDict = OrderedDict()
+        # 已从数据库读取过的 (表名, 条件)
+        self._warmed: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, table: str, _id: str) -> Optional[Dict[str, Optional[str]]]:
+        key = (table, str(_id))
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                self._rows.move_to_end(key)
+            return row
+
+    def set(self, table: str, _id: str, row: Dict[str, Optional[str]]) -> None:
+        key = (table, str(_id))
+        with self._lock:
+            self._rows[key] = row
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+
+    def is_warmed(self, table: str, where: str) -> bool:
+        with self._lock:
+            return (table, where) in self._warmed
+
+    def mark_warmed(self, table: str, where: str) -> None:
+        with self._lock:
+            self._warmed[(table, where)] = True
+            while len(self._warmed) > self.warmed_maxsize:
+                self._warmed.popitem(last=False)
+
+    def unchanged(self, table: str, item: Dict, update_field: set) -> bool:
+        """已存在的行，需要更新的字段值都没变，写入也不会改变数据"""
+
+        if 'id' not in item:
+            return False
+
+        last = self.get(table, item['id'])
+        if last is None:
+            return False
+
+        return all(
+            last.get(k) == normalize(v) for k, v in item.items() if k in update_field
+        )
+
+    def remember(self, table: str, item: Dict, update_field: set) -> None:
+        """`item` 已写入"""
+
+        if 'id' not in item:
+            return
+
+        last = self.get(table, item['id'])
+        if last is None:  # 新插入的行
+            self.set(table, item['id'], {k: normalize(v) for k, v in item.items()})
+        else:  # 已存在的行只会更新这些字段
+            last.update((k, normalize(v)) for k, v in item.items() if k in update_field)
+
+
+def normalize(value) -> Optional[str]:
+    """数据库读出的值与解析出的类型不同，统一成字符串比较"""
+
+    return None if value is None else str(value)
+
+
 class MultiThreadSpider(threading.Thread):
 
     # 如果请求 html，用这个头部
@@ -40,6 +127,26 @@ class MultiThreadSpider(threading.Thread):
     # 任务队列，分发任务
     q: Optional[Queue] = None
 
+    # 设置后，`create_task_list` 把任务放入 Redis 中的队列，多个节点上的进程共同消费，
+    # 取出后 `TASK_VISIBILITY_TIMEOUT` 秒内未调用 `q.task_done()` 的任务重新入队，
+    # 完成后 `TASK_DONE_TTL` 秒内同一任务不再入队
+    REDIS_CONFIG: Optional[RedisConfig] = None
+    TASK_VISIBILITY_TIMEOUT: float = 60
+    TASK_DONE_TTL: int = 0
+
+    # `insert_or_update` 批量写入，缓冲行数达到 `BATCH_SIZE`，
+    # 或距上次写入超过 `BATCH_INTERVAL` 秒时，在一个事务中写入。为 0 时逐条写入
+    BATCH_SIZE: int = 0
+    BATCH_INTERVAL: float = 5
+
+    # 各表最近一次写入的数据，更新字段都没有变化的数据不再写入。
+    # 同一进程中所有爬虫、线程共享，有容量上限
+    _last_written: LastWritten = LastWritten()
+    _warm_lock = threading.Lock()
+
+    # 一次运行中，HTTP 请求的截止秒数，超过后请求直接失败，None 表示不限
+    RUN_DEADLINE: Optional[float] = None
+
     def __init__(self,
                  name: str,
                  mysql_config: MysqlConfig,
@@ -50,43 +157,159 @@ class MultiThreadSpider(threading.Thread):
 
         atexit.register(self.close)  # 注册清理函数，线程结束时自动调用
 
-        self.mysql_conn = pymysql.connect(
-            **mysql_config, autocommit=True
-        )
-        self.cursor = self.mysql_conn.cursor()
+        self.mysql_config = mysql_config
+        # 同一进程中的爬虫共用连接池，用时借出连接
+        self.pool = db.get_pool(mysql_config)
 
         self.session = sessions.Session()
         self.session.headers.update(self.headers_html)  # 默认 html 头部
 
+        # 写缓冲，(表名, 字段, 更新字段) -> 数据列表
+        self._buffer: Dict[Tuple[str, Tuple[str, ...], FrozenSet[str]], List[Dict]] = {}
+        # 与写缓冲中的数据一一对应的变更，写入成功后发到变更流，不写变更流时为 None
+        self._buffer_changes: Dict[Tuple[str, Tuple[str, ...], FrozenSet[str]], List[Optional[Dict]]] = {}
+        self._buffer_size = 0
+        self._last_flush = time.monotonic()
+
+        # 本次运行开始时间和各阶段耗时，运行结束后计入 `metrics.registry`
+        self._run_start: Optional[float] = None
+        self._phase_seconds: Dict[str, float] = {}
+        # 已计入指标的会话统计，会话统计是累计的，每次只计入增量
+        self._session_stats_seen: Dict[str, float] = {}
+
     def run(self) -> None:
         """抽象方法，由子类继承创建。"""
 
         raise NotImplementedError
 
+    def prepare(self) -> None:
+        """多线程运行前，由第一个实例调用一次，如创建任务队列。"""
+
+        pass
+
+    def before_run(self) -> None:
+        """每次运行 `run` 前调用，在 `prepare` 前调用时，`prepare` 也计入本次运行"""
+
+        self._running = True
+        self.start_run()
+        self.session.set_run_deadline(self.RUN_DEADLINE)
+
+    def start_run(self) -> None:
+        """开始一次运行，运行结束时由 `record_metrics` 计入指标，不设 `RUN_DEADLINE`，
+        回填等不受截止时间限制的运行直接调用，不调用 `before_run`
+        """
+
+        self.session.set_run_deadline(None)
+        # 请求及其重试可能比任务的超时时间长，每次发出请求前延长
+        self.session.before_attempt = self.extend_task
+        if self._run_start is None:
+            self._run_start = time.monotonic()
+
+    def after_run(self) -> None:
+        """每次运行 `run` 后调用，出现异常也会调用"""
+
+        self.flush()
+        self.record_metrics()
+        metrics.export()
+
+    @contextmanager
+    def timer(self, phase: str) -> Iterator[None]:
+        """把代码块的耗时计入本次运行的 `phase` 阶段"""
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._phase_seconds[phase] = self._phase_seconds.get(phase, 0) + time.monotonic() - start
+
+    def timed(self, phase: str, iterable: Iterable) -> Iterator:
+        """迭代 `iterable`，只把取元素的耗时计入 `phase` 阶段，用于解析生成器等"""
+
+        it = iter(iterable)
+        while True:
+            with self.timer(phase):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, table: str, value: float = 1, **labels: str) -> None:
+        """累加按表统计的指标"""
+
+        metrics.registry.inc(name, value, spider=type(self).__name__, table=table, **labels)
+
+    def record_metrics(self) -> None:
+        """把本次运行的耗时、请求统计计入 `metrics.registry`。
+
+        fetch 为会话中发送请求的耗时，parse、db 由 `timer`、`timed` 计入，
+        transform 为运行总耗时中其余的部分，如字段转换、等待限速。
+        """
+
+        spider = type(self).__name__
+        registry = metrics.registry
+
+        stats = self.session.stats
+        delta = {k: v - self._session_stats_seen.get(k, 0) for k, v in stats.items()}
+        self._session_stats_seen = dict(stats)
+
+        registry.inc('spider_http_requests_total', delta['requests'], spider=spider)
+        registry.inc('spider_http_retries_total', delta['retries'], spider=spider)
+        registry.inc('spider_http_failures_total', delta['failures'], spider=spider)
+        registry.inc('spider_http_bytes_total', delta['bytes'], spider=spider)
+
+        phases, self._phase_seconds = self._phase_seconds, {}
+        phases['fetch'] = delta['seconds']
+
+        if self._run_start is not None:
+            elapsed = time.monotonic() - self._run_start
+            self._run_start = None
+            phases['transform'] = max(0.0, elapsed - sum(phases.values()))
+
+            registry.inc('spider_runs_total', spider=spider)
+            registry.inc('spider_run_seconds_total', elapsed, spider=spider)
+            registry.set('spider_last_run_seconds', elapsed, spider=spider)
+            registry.set('spider_last_run_timestamp_seconds', time.time(), spider=spider)
+
+        for phase, seconds in phases.items():
+            registry.inc('spider_phase_seconds_total', seconds, spider=spider, phase=phase)
+
+    def crawl(self) -> None:
+        """在调用者线程中运行一次 `run`，供常驻进程反复调用。"""
+
+        self.before_run()
+        try:
+            self.run()
+        finally:
+            self.after_run()
+
+    def execute(self, sql: str, args: Optional[Dict] = None) -> int:
+        """执行一条语句，返回影响的行数"""
+
+        with self.timer('db'), self.pool.cursor() as cursor:
+            return cursor.execute(sql, args)
+
     def insert(self, table: str, item: Dict) -> None:
-        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
-            table,
-            ', '.join(item),
-            ', '.join(f'%({k})s' for k in item)
-        )
+        sql = db.build_insert_sql(table, item)
 
         try:
-            self.cursor.execute(sql, item)
+            self.execute(sql, item)
+            self.count('spider_rows_written_total', table)
         except pymysql.IntegrityError:
+            self.count('spider_db_errors_total', table, error='IntegrityError')
             log.logger.debug(f'存在重复字段！ {str(item)}')
         except pymysql.err.Warning:  # 过滤不合法 mysql 类型
+            self.count('spider_db_errors_total', table, error='Warning')
             log.logger.error(f'字段类型不合法！ {str(item)}')
 
     def update(self, table: str, where: str, item: Dict) -> None:
-        sql = 'UPDATE {} SET {} WHERE {}'.format(
-            table,
-            ', '.join(f'{k} = %({k})s' for k in item),
-            where
-        )
+        sql = db.build_update_sql(table, where, item)
 
         try:
-            self.cursor.execute(sql, item)
+            self.execute(sql, item)
+            self.count('spider_rows_written_total', table)
         except pymysql.err.Warning:
+            self.count('spider_db_errors_total', table, error='Warning')
             log.logger.error(f'字段类型不合法！ {str(item)}')
 
     def insert_or_update(self, table: str, item: Dict, update_field: set) -> None:
@@ -97,25 +320,167 @@ class MultiThreadSpider(threading.Thread):
         :param update_field: 需要更新的字段
         """
 
-        sql = 'INSERT INTO {} ({}) VALUES ({}) ON DUPLICATE KEY UPDATE {}'.format(
-            table,
-            ', '.join(item),
-            ', '.join(f'%({k})s' for k in item),
-            ', '.join(f'{k} = %({k})s' for k in item if k in update_field)
-        )
+        if self._unchanged(table, item, update_field):
+            self.count('spider_rows_skipped_total', table)
+            return
+        change = self._change(table, item, update_field) if feed.enabled() else None
+
+        # 写入成功后才记下，写入失败的行下次仍会写
+        if self.BATCH_SIZE <= 0:
+            if self._insert_or_update(table, item, update_field):
+                self._remember(table, item, update_field)
+                if change is not None:
+                    feed.publish([change])
+            return
+
+        key = (table, tuple(item), frozenset(k for k in item if k in update_field))
+        self._buffer.setdefault(key, []).append(item)
+        self._buffer_changes.setdefault(key, []).append(change)
+        self._buffer_size += 1
+
+        if self._buffer_size >= self.BATCH_SIZE \
+                or time.monotonic() - self._last_flush >= self.BATCH_INTERVAL:
+            self.flush()
+
+    def warm_last_written(self, table: str, where: str) -> None:
+        """从数据库读取已有数据，作为跳过重复写入的依据，同一条件只读一次。
+
+        :param where: 限定范围，如 `id LIKE '20190616%'`
+        """
+
+        with self._warm_lock:
+            if self._last_written.is_warmed(table, where):
+                return
+
+            with self.timer('db'), self.pool.cursor(DictCursor) as cursor:
+                cursor.execute(f'SELECT * FROM {table} WHERE {where}')
+                rows = cursor.fetchall()
+
+            for row in rows:
+                self._last_written.set(table, row['id'], {k: self._normalize(v) for k, v in row.items()})
+
+            self._last_written.mark_warmed(table, where)
+
+    def last_written(self, table: str, _id: str) -> Optional[Dict[str, Optional[str]]]:
+        """已知的某行数据，值都是字符串，未知时返回 None"""
+
+        return self._last_written.get(table, _id)
+
+    @staticmethod
+    def _normalize(value) -> Optional[str]:
+        return normalize(value)
+
+    def _unchanged(self, table: str, item: Dict, update_field: set) -> bool:
+        """已存在的行，需要更新的字段值都没变，写入也不会改变数据"""
+
+        return self._last_written.unchanged(table, item, update_field)
+
+    def _change(self, table: str, item: Dict, update_field: set) -> Dict:
+        """与已知的行相比变化了的字段，作为变更流中的一条，未知的行为全部字段"""
+
+        last = self.last_written(table, item['id']) if 'id' in item else None
+        if last is None:
+            changes = dict(item)
+        else:
+            changes = {
+                k: v for k, v in item.items() if k in update_field and last.get(k) != self._normalize(v)
+            }
+
+        return {'table': table, 'op': 'upsert', 'id': item.get('id'), 'changes': changes}
+
+    def _remember(self, table: str, item: Dict, update_field: set) -> None:
+        self._last_written.remember(table, item, update_field)
+
+    def _insert_or_update(self, table: str, item: Dict, update_field: set) -> bool:
+        """写入一条，返回是否成功"""
+
+        sql = db.build_insert_or_update_sql(table, item, update_field)
 
         try:
-            self.cursor.execute(sql, item)
-        except pymysql.err.Warning:  # 过滤不合法 mysql 类型
+            self.execute(sql, item)
+            self.count('spider_rows_written_total', table)
+            return True
+        except (pymysql.err.Warning, pymysql.err.DataError, pymysql.IntegrityError) as e:
+            # 过滤不合法的数据，否则它会一直留在缓冲区中，之后的写入都会失败
+            self.count('spider_db_errors_total', table, error=type(e).__name__)
             log.logger.error(f'字段类型不合法！ {str(item)}')
+            return False
+
+    def flush(self) -> None:
+        """在一个事务中写入缓冲区，相同表、字段、更新字段的数据合并成一条多行语句。
+
+        有不合法数据（Warning、DataError、IntegrityError）导致整批失败时，回滚后逐条写入，只过滤掉不合法的。
+        其他错误（如连接断开、死锁、连接池超时）时数据放回缓冲区，异常抛给调用者，下次 `flush` 时重试。
+        """
+
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+
+        buffer, self._buffer, self._buffer_size = self._buffer, {}, 0
+        buffer_changes, self._buffer_changes = self._buffer_changes, {}
+        published = []
+
+        try:
+            # 出现异常时 `connection` 会回滚
+            with self.timer('db'), self.pool.connection() as conn:
+                conn.begin()
+                with conn.cursor() as cursor:
+                    for (table, columns, update_field), items in buffer.items():
+                        sql = db.build_insert_or_update_many_sql(table, columns, update_field)
+                        cursor.executemany(sql, items)
+                conn.commit()
+        except (pymysql.err.Warning, pymysql.err.DataError, pymysql.IntegrityError):
+            log.logger.warning('批量写入失败，改为逐条写入')
+            # 已处理过的从缓冲中去掉，逐条写入时出现其他错误，只把未处理的放回
+            for key in list(buffer):
+                table, _, update_field = key
+                items, changes = buffer[key], buffer_changes[key]
+                while items:
+                    try:
+                        written = self._insert_or_update(table, items[0], update_field)
+                    except Exception:
+                        feed.publish(published)
+                        self._restore(buffer, buffer_changes)
+                        log.logger.error(f'逐条写入失败，{self._buffer_size} 行放回缓冲区')
+                        raise
+                    item, change = items.pop(0), changes.pop(0)
+                    if written:
+                        self._remember(table, item, update_field)
+                        if change is not None:
+                            published.append(change)
+        except Exception:
+            self._restore(buffer, buffer_changes)
+            log.logger.error(f'批量写入失败，{self._buffer_size} 行放回缓冲区')
+            raise
+        else:
+            for key, items in buffer.items():
+                table, _, update_field = key
+                self.count('spider_rows_written_total', table, len(items))
+                for item in items:
+                    self._remember(table, item, update_field)
+                published.extend(change for change in buffer_changes[key] if change is not None)
+
+        feed.publish(published)
+
+    def _restore(self,
+                 buffer: Dict[Tuple[str, Tuple[str, ...], FrozenSet[str]], List[Dict]],
+                 buffer_changes: Dict[Tuple[str, Tuple[str, ...], FrozenSet[str]], List[Optional[Dict]]]) -> None:
+        """写入失败的数据放回缓冲区，排在之后缓冲的数据前面"""
+
+        for key, items in buffer.items():
+            if not items:
+                continue
+            self._buffer[key] = items + self._buffer.get(key, [])
+            self._buffer_changes[key] = buffer_changes[key] + self._buffer_changes.get(key, [])
+            self._buffer_size += len(items)
 
     def terminate(self) -> None:
         self._running = False
 
     def close(self) -> None:
+        self.flush()
         self.session.close()
-        self.cursor.close()
-        self.mysql_conn.close()
 
     @classmethod
     def create_task_list(cls, mysql_config: MysqlConfig, sql: str) -> None:
@@ -123,13 +488,38 @@ class MultiThreadSpider(threading.Thread):
         从 MySQL 中读取任务，
         放入一个全局变量 `q` 队列中，
         供多个线程使用。
+
+        设置了 `REDIS_CONFIG` 时放入 Redis 中的队列，已在队列中的任务不重复放入，
+        每个线程处理完一个任务后须调用 `q.task_done()`。
         """
 
-        cls.q = queue.Queue()
+        if cls.REDIS_CONFIG is not None:
+            cls.q = redis_queue.RedisTaskQueue(
+                cls.REDIS_CONFIG,
+                cls.__name__,
+                cls.task_key,
+                cls.TASK_VISIBILITY_TIMEOUT,
+                cls.TASK_DONE_TTL,
+            )
+        else:
+            cls.q = queue.Queue()
 
         for row in db.read_data(mysql_config, sql):
             cls.q.put(row)
 
+    def extend_task(self, seconds: Optional[float] = None) -> None:
+        """Redis 队列中当前线程的任务，从现在起至少 `seconds`、`TASK_VISIBILITY_TIMEOUT` 秒后才超时，
+        处理分几个阶段时在阶段之间调用。"""
+
+        if isinstance(self.q, redis_queue.RedisTaskQueue):
+            self.q.extend(max(seconds or 0, self.TASK_VISIBILITY_TIMEOUT))
+
+    @staticmethod
+    def task_key(row: Tuple) -> str:
+        """任务 id，Redis 队列中按 id 去重"""
+
+        return '|'.join(map(str, row))
+
 
 def run_spider(
         thread_num: int,
@@ -143,6 +533,12 @@ def run_spider(
         )
         thread_list.append(t)
 
+    # 先设置截止时间、开始计时，`prepare` 中的请求也受限、计入本次运行
+    for t in thread_list:
+        t.before_run()
+
+    thread_list[0].prepare()
+
     for t in thread_list:
         log.logger.info(f'{t.__class__.__name__} {t.name} 启动')
         t.start()
@@ -150,6 +546,8 @@ def run_spider(
     try:
         for t in thread_list:
             t.join()
+        for t in thread_list:  # 如写入各线程缓冲区中剩余的数据
+            t.after_run()
     except KeyboardInterrupt:  # 只有主线程能收到键盘中断
         for t in thread_list:  # 防止下面在保存完 `row` 后，线程又请求一个新 `row`
             t.terminate()
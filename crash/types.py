@@ -1,16 +1,17 @@
 """
 
 create:   2018-12-12
-modified:
+modified: 2026-10-18
 """
 
 from queue import Queue
-from typing import Tuple, Dict, FrozenSet, Optional, Union, Pattern, List, Iterator, Type
+from typing import Tuple, Dict, FrozenSet, Optional, Union, Pattern, List, Iterator, Type, \
+    Iterable, Awaitable, Set, Callable, Any
 
 __all__ = [
     'Queue',
-    'Tuple', 'List', 'Dict', 'FrozenSet', 'Type', 'Optional',
-    'Iterator', 'Union', 'Pattern',
+    'Tuple', 'List', 'Dict', 'Set', 'FrozenSet', 'Type', 'Optional',
+    'Iterator', 'Iterable', 'Awaitable', 'Callable', 'Union', 'Pattern', 'Any',
     'MysqlConfig', 'RedisConfig'
 ]
 
@@ -0,0 +1,74 @@
+"""常驻进程，代替 run.sh 每分钟启动各个爬虫脚本。
+
+爬虫按 `SCHEDULE_INTERVAL` 中的间隔反复运行，会话和数据库连接一直复用。
+加上 `--once` 参数时，所有爬虫并发运行一次后退出，供 run.sh 在 crontab 中调用。
+
+create:   2026-10-18
+modified:
+"""
+
+import argparse
+
+from crash import scheduler, log
+
+from football_match_schedule import FootballMatchScheduleSpider
+from football_live import FootballLiveSpider
+from basketball_match_schedule import BasketballMatchScheduleSpider
+from basketball_live import BasketballLiveSpider
+from betfair import BetfairSpider
+from betfair_detail import BetfairDetailSpider
+
+from config import *
+
+log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+log.logger.log_uncaught()
+
+# football_live、basketball_live 分别代替 football_match 和 football_bet、
+# basketball_match 和 basketball_bet，同一页面只请求一次
+SPIDERS = {
+    'football_match_schedule': FootballMatchScheduleSpider,
+    'football_live': FootballLiveSpider,
+    'basketball_match_schedule': BasketballMatchScheduleSpider,
+    'basketball_live': BasketballLiveSpider,
+    'betfair': BetfairSpider,
+    'betfair_detail': BetfairDetailSpider,
+}
+
+# 按任务队列分发的爬虫，用 THREAD_NUM 个线程，其余 1 个
+MULTI_THREAD = {
+    'football_match_schedule',
+    'football_live',
+}
+
+# 依赖关系，betfair_detail 读取 betfair 写入的 match_bf_id
+DEPENDS = {
+    'betfair_detail': ('betfair',),
+}
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--once', action='store_true', help='所有爬虫运行一次后退出')
+    args = parser.parse_args()
+
+    s = scheduler.Scheduler(MYSQL_CONFIG)
+    jobs = {}
+    for name, spider_class in SPIDERS.items():
+        jobs[name] = s.add(
+            spider_class,
+            SCHEDULE_INTERVAL[name],
+            THREAD_NUM if name in MULTI_THREAD else 1,
+            after=tuple(jobs[dep] for dep in DEPENDS.get(name, ()))
+        )
+
+    if args.once:
+        s.run_once()
+    else:
+        s.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ modified:
 import warnings
 import datetime
 
-from crash import spider, log
+from crash import spider, log, polling
 from crash.types import *
 from football_match_schedule import FootballMatchScheduleSpider
 
@@ -18,6 +18,8 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
 
 
 class FootballBetSpider(FootballMatchScheduleSpider):
@@ -37,13 +39,26 @@ class FootballBetSpider(FootballMatchScheduleSpider):
 
     MATCH_NOT_START_FLAG = {'取消', '待定', '腰斩', '中断', '推迟', '未'}
 
+    # 入库后不再变化的状态
+    MATCH_FINISHED_FLAG = {'完'}
+    MATCH_CANCELLED_FLAG = {'取消', '推迟'}
+    # 可能恢复的状态
+    MATCH_SUSPENDED_FLAG = {'待定', '腰斩', '中断'}
+
+    # 按比赛状态决定请求间隔，完场、取消的依据这张表中已入库的状态
+    POLL_TABLE = MYSQL_TABLE_FOOTBALL_BET
+    POLL_INTERVAL = FOOTBALL_POLL_INTERVAL
+    POLL_SOON = FOOTBALL_POLL_SOON
+    # 各比赛上次请求的时间，同一进程中所有足球爬虫共享，按表区分
+    planner = polling.PollPlanner(slot=60)
+
     def __init__(self,
                  name: str,
                  mysql_config: MysqlConfig) -> None:
 
         super().__init__(name, mysql_config)
 
-    def run(self) -> None:
+    def prepare(self) -> None:
         # 即时比分抓取今天的
         # 足球竞彩时间计算规则：
         # 在 url 中请求今天日期，返回的是
@@ -53,37 +68,80 @@ class FootballBetSpider(FootballMatchScheduleSpider):
         if current_hour < 12:
             today -= datetime.timedelta(1)
 
-        self.fetch(today)
+        date_list = [today]
 
         # 有的比赛会比过 12 点
         # 因为过 12 点，就算昨天的了，所以会导致不正确更新
         # 这里在一段时间内，再把昨天的数据抓下
         if 12 <= current_hour < 14:
-            self.fetch(today - datetime.timedelta(1))
+            date_list.append(today - datetime.timedelta(1))
+
+        self.create_match_task_list(date_list)
+
+    def warm(self, date_format: str) -> None:
+        self.warm_last_written(MYSQL_TABLE_FOOTBALL_BET, f"id LIKE '{date_format}%'")
+
+    def should_poll(self, item: Dict) -> bool:
+        last = self.last_written(self.POLL_TABLE, item['id'])
+        state = self.poll_state(item, last, datetime.datetime.now(), self.POLL_SOON)
+
+        if self.planner.due(f'{self.POLL_TABLE}:{item["id"]}', self.POLL_INTERVAL[state]):
+            return True
+
+        self.count('spider_polls_skipped_total', self.POLL_TABLE, state=state)
+        return False
+
+    @classmethod
+    def poll_state(cls,
+                   item: Dict,
+                   last: Optional[Dict[str, Optional[str]]],
+                   now: datetime.datetime,
+                   soon: float) -> str:
+        """比赛的轮询状态，见 `config.FOOTBALL_POLL_INTERVAL`
+
+        :param last: 库中已有的这一行，见 `last_written`
+        :param soon: 距开赛不到这么多秒时每次都请求
+        """
+
+        compete_time = item['compete_time']
+
+        if last is None:
+            return 'new'
 
-    def fetch(self, date: datetime.datetime) -> None:
+        if compete_time in cls.MATCH_FINISHED_FLAG or compete_time in cls.MATCH_CANCELLED_FLAG:
+            if last.get('compete_time') != compete_time:
+                return 'new'
+            return 'finished' if compete_time in cls.MATCH_FINISHED_FLAG else 'cancelled'
 
-        url = self.url_temp.format(date.strftime('%Y-%m-%d'))
-        r = self.session.get(url)
-        jd = r.json()
+        if compete_time in cls.MATCH_SUSPENDED_FLAG:
+            return 'suspended'
 
-        for item in self.parse(jd, date.strftime('%Y%m%d')):
-            # 不用这些字段
-            item.pop('home_rank')
-            item.pop('visitor_rank')
+        if compete_time in cls.MATCH_NOT_START_FLAG:
+            start_time = datetime.datetime.strptime(item['start_time'], '%Y-%m-%d %H:%M:%S')
+            if (start_time - now).total_seconds() < soon:
+                return 'soon'
+            return 'upcoming'
 
-            item.update(self.get_current_odds(item['remote_id']))
+        return 'live'
 
-            if item['compete_time'] in self.MATCH_NOT_START_FLAG:
-                update_field = self.UPDATE_FIELD
-            else:
-                update_field = self.AFTER_MATCH_START_UPDATE_FIELD
+    def save(self, item: Dict) -> None:
+        # 不用这些字段
+        item.pop('home_rank')
+        item.pop('visitor_rank')
 
-            log.logger.debug(item)
+        item.update(self.get_current_odds(item['remote_id']))
 
-            self.insert_or_update(MYSQL_TABLE_FOOTBALL_BET, item, update_field)
+        if item['compete_time'] in self.MATCH_NOT_START_FLAG:
+            update_field = self.UPDATE_FIELD
+        else:
+            update_field = self.AFTER_MATCH_START_UPDATE_FIELD
+
+        log.logger.debug(item)
 
-    def parse(self, jd: Dict, date_format: str) -> Iterator[Dict]:
+        self.insert_or_update(MYSQL_TABLE_FOOTBALL_BET, item, update_field)
+
+    @classmethod
+    def parse(cls, jd: Dict, date_format: str) -> Iterator[Dict]:
 
         matches = jd['matches']
 
@@ -94,11 +152,11 @@ class FootballBetSpider(FootballMatchScheduleSpider):
 
             # 比赛进行时间，原始数据需要进行一些转换
             match_min = match['min']
-            compete_time = self._compute_compete_time(status, match_min)
+            compete_time = cls._compute_compete_time(status, match_min)
 
             # 总比分
-            home_score = self._compute_kick_or_score(compete_time, match['hoScore'])
-            visitor_score = self._compute_kick_or_score(compete_time, match['guScore'])
+            home_score = cls._compute_kick_or_score(compete_time, match['hoScore'])
+            visitor_score = cls._compute_kick_or_score(compete_time, match['guScore'])
 
             # 原地
             item.update({
@@ -149,7 +207,7 @@ class FootballBetSpider(FootballMatchScheduleSpider):
 def main() -> None:
 
     spider.run_spider(
-        1,
+        THREAD_NUM,
         FootballBetSpider,
         MYSQL_CONFIG
     )
@@ -0,0 +1,51 @@
+"""足球即时比分和竞彩，同一份比赛列表只请求、解析一次，分别写入 football_match 和 football_bet
+
+create:   2026-10-18
+modified:
+"""
+
+import warnings
+
+from crash import spider, log
+from crash.types import *
+from football_bet import FootballBetSpider
+from football_match import FootballMatchSpider
+
+from config import *
+
+# 将警告提升为异常，若字段类型不合法，pymysql 只会发出警告
+# 提升为异常，可以过滤掉不符合字段类型的数据
+warnings.filterwarnings('error')
+
+log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+
+class FootballLiveSpider(FootballMatchSpider):
+
+    def warm(self, date_format: str) -> None:
+        FootballBetSpider.warm(self, date_format)
+        FootballMatchSpider.warm(self, date_format)
+
+    def save(self, item: Dict) -> None:
+        # football_bet 不需要的字段，各表按自己的规则更新，
+        # 实时赔率有缓存，两张表只请求一次
+        bet_item = {
+            k: v for k, v in item.items() if k not in self.EXTRA_FIELD and k != 'odds'
+        }
+        FootballBetSpider.save(self, bet_item)
+        FootballMatchSpider.save(self, item)
+
+
+def main() -> None:
+
+    spider.run_spider(
+        THREAD_NUM,
+        FootballLiveSpider,
+        MYSQL_CONFIG
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,6 @@ modified:
 """
 
 import warnings
-import datetime
 
 from crash import spider, log
 from crash.types import *
@@ -19,14 +18,14 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
 
 
 class FootballMatchSpider(FootballBetSpider):
 
-    # sql 插入已存在主键纪录时，更新如下字段
-    UPDATE_FIELD = {
-        *FootballBetSpider.UPDATE_FIELD,
-
+    # 相比 football_bet 多出的字段
+    EXTRA_FIELD = {
         'home_corner_kick',
         'visitor_corner_kick',
 
@@ -39,38 +38,44 @@ class FootballMatchSpider(FootballBetSpider):
         'visitor_red_card'
     }
 
+    # sql 插入已存在主键纪录时，更新如下字段
+    UPDATE_FIELD = {
+        *FootballBetSpider.UPDATE_FIELD,
+        *EXTRA_FIELD
+    }
+
+    POLL_TABLE = MYSQL_TABLE_FOOTBALL_MATCH
+
     def __init__(self,
                  name: str,
                  mysql_config: MysqlConfig) -> None:
 
         super().__init__(name, mysql_config)
 
-    def fetch(self, date: datetime.datetime) -> None:
-
-        url = self.url_temp.format(date.strftime('%Y-%m-%d'))
-        r = self.session.get(url)
-        jd = r.json()
+    def warm(self, date_format: str) -> None:
+        self.warm_last_written(MYSQL_TABLE_FOOTBALL_MATCH, f"id LIKE '{date_format}%'")
 
-        for item in self.parse(jd, date.strftime('%Y%m%d')):
+    def save(self, item: Dict) -> None:
 
-            odds = item.pop('odds')
+        odds = item.pop('odds')
 
-            # 如果比赛还未开始或已经结束，就用即时赔率
-            if item['compete_time'] in self.MATCH_NOT_START_FLAG\
-                    or item['compete_time'] == '完':
-                item.update(self.get_current_odds(item['remote_id']))
-            else:  # 一旦比赛开始，则用滚球赔率
-                item.update(self.get_roll_odds(odds))
+        # 如果比赛还未开始或已经结束，就用即时赔率
+        if item['compete_time'] in self.MATCH_NOT_START_FLAG\
+                or item['compete_time'] == '完':
+            item.update(self.get_current_odds(item['remote_id']))
+        else:  # 一旦比赛开始，则用滚球赔率
+            item.update(self.get_roll_odds(odds))
 
-            log.logger.debug(item)
+        log.logger.debug(item)
 
-            self.insert_or_update(
-                MYSQL_TABLE_FOOTBALL_MATCH,
-                item,
-                self.UPDATE_FIELD
-            )
+        self.insert_or_update(
+            MYSQL_TABLE_FOOTBALL_MATCH,
+            item,
+            self.UPDATE_FIELD
+        )
 
-    def parse(self, jd: Dict, date_format: str) -> Iterator[Dict]:
+    @classmethod
+    def parse(cls, jd: Dict, date_format: str) -> Iterator[Dict]:
 
         matches = jd['matches']
 
@@ -79,10 +84,10 @@ class FootballMatchSpider(FootballBetSpider):
             compete_time = item['compete_time']
 
             # 比分，角球
-            home_corner_kick = self._compute_kick_or_score(compete_time, match['hoCo'])
-            visitor_corner_kick = self._compute_kick_or_score(compete_time, match['guCo'])
-            home_half_score = self._compute_kick_or_score(compete_time, match['hoHalfScore'])
-            visitor_half_score = self._compute_kick_or_score(compete_time, match['guHalfScore'])
+            home_corner_kick = cls._compute_kick_or_score(compete_time, match['hoCo'])
+            visitor_corner_kick = cls._compute_kick_or_score(compete_time, match['guCo'])
+            home_half_score = cls._compute_kick_or_score(compete_time, match['hoHalfScore'])
+            visitor_half_score = cls._compute_kick_or_score(compete_time, match['guHalfScore'])
 
             # 红黄牌
             home_yellow_card = match['hoYellow']
@@ -140,7 +145,7 @@ class FootballMatchSpider(FootballBetSpider):
 def main() -> None:
 
     spider.run_spider(
-        1,
+        THREAD_NUM,
         FootballMatchSpider,
         MYSQL_CONFIG
     )
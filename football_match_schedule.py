@@ -5,10 +5,11 @@ modified:
 """
 
 import re
+import queue
 import warnings
 import datetime
 
-from crash import spider, log
+from crash import spider, log, cache, ratelimit, sessions, metrics, feed
 from crash.types import *
 
 from helper import clear_float_zero
@@ -19,6 +20,14 @@ from config import *
 warnings.filterwarnings('error')
 
 log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+ratelimit.set_rate_limit(RATE_LIMIT, RATE_LIMIT_DIR)
+sessions.set_recorder(HTTP_RECORD_PATH)
+sessions.set_base_url(HTTP_BASE_URL)
+metrics.set_export_path(METRICS_PATH)
+feed.set_feed_path(FEED_PATH, FEED_SEGMENT_BYTES, FEED_MAX_SEGMENTS)
 
 
 class FootballMatchScheduleSpider(spider.MultiThreadSpider):
@@ -27,6 +36,13 @@ class FootballMatchScheduleSpider(spider.MultiThreadSpider):
 
     url_current_odds_url = 'https://live.13322.com/common/ajaxOddsInfoByMatchId'
 
+    # 请求实时赔率时用 html 头部，值为 None 的会从 session 的头部中去掉
+    headers_current_odds = {
+        **spider.MultiThreadSpider.headers_html,
+        'Content-Type': None,
+        'x-requested-with': None,
+    }
+
     # sql 插入已存在主键纪录时，更新如下字段
     UPDATE_FIELD = {
         'handicap',
@@ -43,6 +59,19 @@ class FootballMatchScheduleSpider(spider.MultiThreadSpider):
     # 球队排名字符串中可能还带联赛名，只提取排名
     RE_FIND_NUM = re.compile(r'\d+')
 
+    # 批量写入
+    BATCH_SIZE = MYSQL_BATCH_SIZE
+    BATCH_INTERVAL = MYSQL_BATCH_INTERVAL
+
+    RUN_DEADLINE = SPIDER_RUN_DEADLINE
+
+    # 实时赔率缓存，按 remote_id 缓存，所有足球爬虫共享
+    odds_cache = cache.TTLCache(
+        ODDS_CACHE_TTL,
+        ODDS_CACHE_SIZE,
+        cache.SqliteStore(ODDS_CACHE_PATH, ODDS_CACHE_SIZE) if ODDS_CACHE_PATH else None
+    )
+
     def __init__(self,
                  name: str,
                  mysql_config: MysqlConfig) -> None:
@@ -51,7 +80,7 @@ class FootballMatchScheduleSpider(spider.MultiThreadSpider):
         # 改成抓取 json 数据的头部
         self.session.headers.update(self.headers_json)
 
-    def run(self) -> None:
+    def prepare(self) -> None:
 
         # 比赛日程安排是提取明天的
         tomorrow = datetime.datetime.today()
@@ -59,33 +88,80 @@ class FootballMatchScheduleSpider(spider.MultiThreadSpider):
         if current_hour >= 12:
             tomorrow += datetime.timedelta(1)
 
-        self.fetch(tomorrow)
+        self.create_match_task_list([tomorrow])
+
+    def create_match_task_list(self, date_list: List[datetime.datetime]) -> None:
+        """请求各天的比赛列表，每场比赛作为一个任务放入队列 `q`，供多个线程请求赔率、入库"""
+
+        type(self).q = queue.Queue()
+
+        for date in date_list:
+            for item in self.fetch(date):
+                if self.should_poll(item):
+                    self.q.put(item)
+
+    def should_poll(self, item: Dict) -> bool:
+        """本次运行是否请求赔率、写入这场比赛，子类按比赛状态决定"""
+
+        return True
+
+    def run(self) -> None:
+
+        while self._running:
+            try:
+                item = self.q.get_nowait()
+            except queue.Empty:
+                break
+
+            self.save(item)
+
+    def run_date(self, date: datetime.date) -> None:
+        """在当前线程中请求并入库一天的比赛，回填历史数据时直接调用"""
 
-    def fetch(self, date: datetime.datetime) -> None:
+        for item in self.fetch(date):
+            if not self._running:
+                break
+            self.save(item)
+
+    def fetch(self, date: datetime.date) -> Iterator[Dict]:
+        """请求并解析一天的比赛列表"""
+
+        date_format = date.strftime('%Y%m%d')
+        self.warm(date_format)
 
         url = self.url_temp.format(date.strftime('%Y-%m-%d'))
         r = self.session.get(url)
-        jd = r.json()
+        with self.timer('parse'):
+            jd = r.json()
+
+        yield from self.timed('parse', self.parse(jd, date_format))
 
-        for item in self.parse(jd, date.strftime('%Y%m%d')):
-            # 比赛安排用即时赔率
-            item.update(self.get_current_odds(item['remote_id']))
+    def warm(self, date_format: str) -> None:
+        """读取当天已有数据，用于跳过没有变化的写入"""
 
-            log.logger.debug(item)
+        self.warm_last_written(MYSQL_TABLE_FOOTBALL_MATCH_SCHEDULE, f"id LIKE '{date_format}%'")
 
-            self.insert_or_update(
-                MYSQL_TABLE_FOOTBALL_MATCH_SCHEDULE,
-                item,
-                self.UPDATE_FIELD
-            )
+    def save(self, item: Dict) -> None:
 
-    def parse(self, jd: Dict, date_format: str) -> Iterator[Dict]:
+        # 比赛安排用即时赔率
+        item.update(self.get_current_odds(item['remote_id']))
+
+        log.logger.debug(item)
+
+        self.insert_or_update(
+            MYSQL_TABLE_FOOTBALL_MATCH_SCHEDULE,
+            item,
+            self.UPDATE_FIELD
+        )
+
+    @classmethod
+    def parse(cls, jd: Dict, date_format: str) -> Iterator[Dict]:
 
         matches = jd['matches']
 
         for match in matches:
             # 提取比赛序号
-            ser_num = self.RE_FIND_NUM.findall(match['serNum'])[0]
+            ser_num = cls.RE_FIND_NUM.findall(match['serNum'])[0]
             host_rank = match['hoRank']
             guest_rank = match['guRank']
 
@@ -97,24 +173,38 @@ class FootballMatchScheduleSpider(spider.MultiThreadSpider):
                 'home_name': match['hoTeamSimpName'],
                 'visitor_name': match['guTeamSimpName'],
                 # 字符串中可能还带联赛名，只提取排名
-                'home_rank': self.RE_FIND_NUM.findall(host_rank)[0] if host_rank else None,
-                'visitor_rank': self.RE_FIND_NUM.findall(guest_rank)[0] if guest_rank else None,
+                'home_rank': cls.RE_FIND_NUM.findall(host_rank)[0] if host_rank else None,
+                'visitor_rank': cls.RE_FIND_NUM.findall(guest_rank)[0] if guest_rank else None,
             }
 
     def get_current_odds(self, remote_id: int) -> Dict:
-        """获取实时赔率"""
+        """获取实时赔率，优先从缓存中取"""
+
+        return dict(self.odds_cache.get_or_set(
+            remote_id, lambda: self._get_current_odds(remote_id)
+        ))
+
+    def _get_current_odds(self, remote_id: int) -> Dict:
+
+        # 这里 post 时要换个请求头，只对本次请求生效，不改 session 的头部
+        r = self.session.post(
+            self.url_current_odds_url,
+            data={'matchId': remote_id},
+            headers=self.headers_current_odds
+        )
+
+        with self.timer('parse'):
+            jd = r.json()
 
-        # 这里 post 时要换个请求头
-        temp = self.session.headers
-        self.session.headers = self.headers_html
-        r = self.session.post(self.url_current_odds_url, data={'matchId': remote_id})
-        self.session.headers = temp
+            # log.logger.debug(jd)
 
-        jd = r.json()
+            return self.parse_current_odds(jd)
 
-        # log.logger.debug(jd)
+    @classmethod
+    def parse_current_odds(cls, jd: List) -> Dict:
+        """把实时赔率接口返回的数据转换成入库字段"""
 
-        current_odds = self._compute_current_odds(jd)
+        current_odds = cls._compute_current_odds(jd)
 
         # 这里的都是初始赔率
         handicap = clear_float_zero(current_odds['let'].replace('-', '*'))
@@ -165,7 +255,7 @@ class FootballMatchScheduleSpider(spider.MultiThreadSpider):
 def main() -> None:
 
     spider.run_spider(
-        1,
+        THREAD_NUM,
         FootballMatchScheduleSpider,
         MYSQL_CONFIG
     )
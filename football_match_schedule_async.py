@@ -0,0 +1,97 @@
+"""足球比赛日程安排，asyncio 版本
+
+与 football_match_schedule 写入同一张表，
+每场比赛的实时赔率请求并发发出，而不是一个接一个。
+
+create:   2026-10-18
+modified:
+"""
+
+import warnings
+import datetime
+
+from crash import async_spider, log, metrics
+from crash.types import *
+from football_match_schedule import FootballMatchScheduleSpider
+
+from config import *
+
+# 将警告提升为异常，若字段类型不合法，pymysql 只会发出警告
+# 提升为异常，可以过滤掉不符合字段类型的数据
+warnings.filterwarnings('error')
+
+log.logger.set_log_level(LOG_LEVEL)
+log.logger.set_output(LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE)
+log.logger.set_debug_limit(LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+metrics.set_export_path(METRICS_PATH)
+
+
+class AsyncFootballMatchScheduleSpider(async_spider.AsyncSpider):
+
+    url_temp = FootballMatchScheduleSpider.url_temp
+
+    url_current_odds_url = FootballMatchScheduleSpider.url_current_odds_url
+
+    UPDATE_FIELD = FootballMatchScheduleSpider.UPDATE_FIELD
+
+    async def run(self) -> None:
+
+        # 比赛日程安排是提取明天的
+        tomorrow = datetime.datetime.today()
+        current_hour = tomorrow.hour
+        if current_hour >= 12:
+            tomorrow += datetime.timedelta(1)
+
+        await self.fetch(tomorrow)
+
+    async def fetch(self, date: datetime.datetime) -> None:
+
+        date_format = date.strftime('%Y%m%d')
+        url = self.url_temp.format(date.strftime('%Y-%m-%d'))
+        r = await self.get(url, headers=self.headers_json)
+        if r is None:
+            log.logger.error(f'比赛列表请求失败: {url}')
+            return
+        jd = await r.json(content_type=None)
+
+        item_list = list(FootballMatchScheduleSpider.parse(jd, date_format))
+
+        # 比赛安排用即时赔率，所有比赛的赔率请求同时发出
+        odds_list = await self.gather(
+            self.get_current_odds(item['remote_id']) for item in item_list
+        )
+
+        items = []
+        for item, odds in zip(item_list, odds_list):
+            if odds is None:  # 赔率请求失败的下次再写
+                continue
+            item.update(odds)
+            log.logger.debug(item)
+            items.append(item)
+
+        # 读取当天已有数据，用于跳过没有变化的写入
+        await self.warm_last_written(MYSQL_TABLE_FOOTBALL_MATCH_SCHEDULE, f"id LIKE '{date_format}%'")
+        await self.insert_or_update_many(MYSQL_TABLE_FOOTBALL_MATCH_SCHEDULE, items, self.UPDATE_FIELD)
+
+    async def get_current_odds(self, remote_id: int) -> Optional[Dict]:
+        """获取实时赔率，post 时用 html 头部，即 session 的默认头部，请求失败返回 None"""
+
+        r = await self.post(self.url_current_odds_url, data={'matchId': remote_id})
+        if r is None:
+            return None
+        jd = await r.json(content_type=None)
+
+        return FootballMatchScheduleSpider.parse_current_odds(jd)
+
+
+def main() -> None:
+
+    async_spider.run_spider(
+        AsyncFootballMatchScheduleSpider,
+        MYSQL_CONFIG
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,6 @@ if [ ! -d "${LOG_PATH}" ]; then
   mkdir "${LOG_PATH}"
 fi
 
-script_array=('football_match_schedule' 'football_match' 'football_bet' 'basketball_match_schedule' 'basketball_match' 'basketball_bet' 'betfair' 'betfair_detail')
-
-# script_array[@] 会获取所有数组成员
-for var in "${script_array[@]}"; do
-   ${PYTHON_PATH}/python "${CODE_PATH}/${var}.py" &>> "${LOG_PATH}/${var}.log"
-done
\ No newline at end of file
+# 所有爬虫并发运行一次，有依赖的按依赖顺序，见 daemon.py 中的 SPIDERS 和 DEPENDS，
+# 日志包括未捕获的异常都写到 config.LOG_PATH，按大小轮转，这里不再重定向
+${PYTHON_PATH}/python "${CODE_PATH}/daemon.py" --once > /dev/null
\ No newline at end of file
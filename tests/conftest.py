@@ -0,0 +1,67 @@
+import time
+import threading
+
+import pytest
+
+import config
+
+# 用例中导入的爬虫模块按 config 设置日志输出，测试时写到标准错误，不写 log/ 下的文件
+config.LOG_PATH = None
+
+
+@pytest.fixture
+def fake_spider():
+    """不连接数据库的爬虫类，只记录调用，每个用例一个新的类，记录不会互相影响"""
+
+    class FakeSpider:
+
+        lock = threading.Lock()
+        # 类名 -> `crawl` 的开始、结束时间
+        records = {}
+        cost = 0.1
+        # `run_date` 处理过的日期，`fail` 中的日期出错
+        dates = []
+        fail = set()
+        # 每次 `record_metrics` 时是否在一次运行中
+        runs = []
+
+        def __init__(self, name, mysql_config):
+            self.name = name
+            self._running = True
+            self._run_start = None
+            self.flushed = 0
+
+        def before_run(self):
+            pass
+
+        def prepare(self):
+            pass
+
+        def start_run(self):
+            if self._run_start is None:
+                self._run_start = time.monotonic()
+
+        def crawl(self):
+            start = time.monotonic()
+            time.sleep(self.cost)
+            with self.lock:
+                self.records[type(self).__name__] = (start, time.monotonic())
+
+        def run_date(self, date):
+            if date in self.fail:
+                raise ValueError(date)
+            with self.lock:
+                self.dates.append(date)
+
+        def flush(self):
+            self.flushed += 1
+
+        def record_metrics(self):
+            with self.lock:
+                self.runs.append(self._run_start is not None)
+            self._run_start = None
+
+        def terminate(self):
+            self._running = False
+
+    return FakeSpider
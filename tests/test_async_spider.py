@@ -0,0 +1,128 @@
+import os
+import json
+import asyncio
+import datetime
+from contextlib import asynccontextmanager
+
+import aiohttp
+import pymysql
+import pytest
+
+from crash import async_spider, sessions, spider
+from football_match_schedule_async import AsyncFootballMatchScheduleSpider
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+class FakeResponse:
+
+    def __init__(self, jd):
+        self.jd = jd
+
+    async def json(self, content_type='application/json'):
+        return self.jd
+
+
+@pytest.fixture
+def make_spider(monkeypatch):
+    # 不影响其他用例
+    monkeypatch.setattr(async_spider.AsyncSpider, '_last_written', spider.LastWritten())
+
+    def make(failed_odds=()):
+        s = AsyncFootballMatchScheduleSpider('test', {})
+        matches = load_fixture('football_matches.json')
+        odds = load_fixture('football_current_odds.json')
+        written = []
+
+        async def get(url, **kwargs):
+            return FakeResponse(matches)
+
+        async def post(url, data=None, **kwargs):
+            return None if data['matchId'] in failed_odds else FakeResponse(odds)
+
+        async def executemany(sql, items):
+            written.extend(item['id'] for item in items)
+
+        async def warm_last_written(table, where):
+            pass
+
+        s.get, s.post, s.executemany, s.warm_last_written = get, post, executemany, warm_last_written
+        return s, written
+
+    return make
+
+
+def test_fetch_skips_failed_requests(make_spider):
+
+    s, written = make_spider(failed_odds={1700001})
+    asyncio.run(s.fetch(datetime.datetime(2019, 6, 16)))
+
+    # 赔率请求失败的比赛不写，其余的一次写入
+    assert len(written) == 299 and '20190616001' not in written
+    assert s._last_written.get('football_match_schedule', '20190616002')['win_odds'] == '1.99'
+
+    # 再次运行时没有变化的不再写入，上次失败的这次写入
+    s, written = make_spider()
+    asyncio.run(s.fetch(datetime.datetime(2019, 6, 16)))
+    assert written == ['20190616001']
+
+
+def test_fetch_list_failed(make_spider):
+
+    s, written = make_spider()
+
+    async def get(url, **kwargs):
+        return None
+
+    s.get = get
+    asyncio.run(s.fetch(datetime.datetime(2019, 6, 16)))
+    assert written == []
+
+
+def test_request_retry_policy():
+
+    s = async_spider.AsyncSpider('test', {}, retry_policy=sessions.RetryPolicy(max_retries=2, backoff_base=0))
+    calls = []
+
+    class FakeSession:
+
+        @asynccontextmanager
+        async def request(self, method, url, **kwargs):
+            calls.append(kwargs['timeout'].total)
+            raise aiohttp.ClientConnectionError
+            yield
+
+    s.session = FakeSession()
+    assert asyncio.run(s.get('http://127.0.0.1:1/')) is None
+    assert len(calls) == 3
+    assert s.stats['retries'] == 2 and s.stats['failures'] == 1
+
+    # 超过截止时间后不再重试
+    s.retry_policy = sessions.RetryPolicy(deadline=0)
+    calls.clear()
+    assert asyncio.run(s.get('http://127.0.0.1:1/')) is None
+    assert calls == []
+
+
+def test_bad_row_is_dropped(make_spider):
+
+    s, written = make_spider()
+
+    async def executemany(sql, items):
+        raise pymysql.err.DataError(1406, 'Data too long')
+
+    async def execute(sql, item):
+        if item['id'] == '2':
+            raise pymysql.err.DataError(1406, 'Data too long')
+        written.append(item['id'])
+
+    s.executemany, s.execute = executemany, execute
+    items = [{'id': str(i), 'v': 1} for i in range(1, 4)]
+    asyncio.run(s.insert_or_update_many('t', items, {'v'}))
+
+    assert written == ['1', '3']
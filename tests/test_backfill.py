@@ -0,0 +1,28 @@
+import datetime
+
+from crash import backfill
+
+
+def test_backfill_resumes_from_checkpoint(tmp_path, fake_spider):
+
+    dates = backfill.date_range(datetime.date(2019, 6, 1), datetime.date(2019, 6, 10))
+    assert len(dates) == 10
+
+    path = str(tmp_path / 'checkpoint.json')
+    fake_spider.fail = {datetime.date(2019, 6, 5)}
+
+    stats = backfill.run_backfill(fake_spider, {}, dates, 3, backfill.Checkpoint(path))
+    assert stats == {'done': 9, 'failed': 1, 'skipped': 0}
+    assert sorted(fake_spider.dates) == [d for d in dates if d not in fake_spider.fail]
+    # 每一天都计入指标，出错的也算
+    assert fake_spider.runs == [True] * 10
+
+    # 重新运行只处理上次失败的
+    fake_spider.dates.clear()
+    fake_spider.fail = set()
+    checkpoint = backfill.Checkpoint(path)
+    assert len(checkpoint) == 9
+
+    stats = backfill.run_backfill(fake_spider, {}, dates, 3, checkpoint)
+    assert stats == {'done': 1, 'failed': 0, 'skipped': 9}
+    assert fake_spider.dates == [datetime.date(2019, 6, 5)]
@@ -0,0 +1,16 @@
+from tools import benchmark
+
+
+def test_cases_parse_fixtures():
+
+    # 每个用例的数据都能被解析出 item
+    for name, setup in benchmark.CASES.items():
+        assert setup()(), name
+
+
+def test_compare_threshold():
+
+    baseline = {'a': {'items_per_s': 1000}, 'b': {'items_per_s': 1000}}
+    results = {'a': {'items_per_s': 850}, 'b': {'items_per_s': 750}, 'c': {'items_per_s': 1}}
+
+    assert benchmark.compare(results, baseline, 0.2) == ['b']
@@ -0,0 +1,58 @@
+import datetime
+from decimal import Decimal
+
+from betfair_detail import BetfairDetailSpider
+
+
+def _item(minute, turnover, proportion, price=1.5):
+    return {
+        'turnover': turnover,
+        'status': '主胜买入',
+        'price': price,
+        'transaction_time': f'2019-06-16 10:{minute:02d}',
+        'proportion': proportion,
+        'betfair_id': '20190616001',
+    }
+
+
+def _row(minute, turnover, proportion, price='1.50'):
+    # 数据库读出的类型与解析出的不同
+    return {
+        'transaction_time': datetime.datetime(2019, 6, 16, 10, minute),
+        'status': '主胜买入',
+        'price': Decimal(price),
+        'turnover': turnover,
+        'proportion': Decimal(proportion),
+    }
+
+
+def test_diff():
+
+    rows = [
+        _row(1, 100, '1.00'),
+        _row(2, 200, '2.00'),
+        _row(2, 200, '2.00'),  # 两笔相同的交易
+        _row(3, 300, '3.00'),  # 消失了
+    ]
+    items = [
+        _item(1, 100, 1.0),
+        _item(2, 200, 1.5),  # 总交易额变化，占比变了
+        _item(4, 400, 4.0),  # 新交易
+    ]
+
+    inserts, updates, deletes = BetfairDetailSpider.diff(rows, items)
+
+    assert inserts == [items[2]]
+    assert updates == [{
+        'transaction_time': rows[1]['transaction_time'], 'status': '主胜买入',
+        'price': Decimal('1.50'), 'turnover': 200, 'proportion': 1.5,
+    }]
+    assert sorted((d['turnover'], d['limit']) for d in deletes) == [(200, 1), (300, 1)]
+
+
+def test_diff_unchanged():
+
+    rows = [_row(1, 100, '1.00'), _row(2, 200, '2.00')]
+    items = [_item(1, 100, 1.0), _item(2, 200, 2.0)]
+
+    assert BetfairDetailSpider.diff(rows, items) == ([], [], [])
@@ -0,0 +1,85 @@
+import time
+import threading
+
+from crash.cache import TTLCache, SqliteStore
+
+
+def test_ttl_and_maxsize():
+
+    c = TTLCache(ttl=0.05, maxsize=2)
+    c.set(1, 'a')
+    c.set(2, 'b')
+    assert c.get(1) == 'a'
+
+    c.set(3, 'c')  # 淘汰最久未用的 2
+    assert c.get(2) is None
+    assert c.get(1) == 'a'
+    assert c.get(3) == 'c'
+
+    time.sleep(0.06)
+    assert c.get(1) is None
+
+
+def test_get_or_set_calls_once_across_threads():
+
+    c = TTLCache(ttl=10, maxsize=10)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'win_odds': '1.5'}
+
+    thread_list = [threading.Thread(target=c.get_or_set, args=(42, fetch)) for _ in range(5)]
+    for t in thread_list:
+        t.start()
+    for t in thread_list:
+        t.join()
+
+    assert len(calls) == 1
+    assert c.get(42) == {'win_odds': '1.5'}
+
+
+def test_sqlite_store_shared(tmp_path):
+
+    path = str(tmp_path / 'cache.sqlite')
+    c1 = TTLCache(ttl=10, maxsize=10, store=SqliteStore(path))
+    c2 = TTLCache(ttl=10, maxsize=10, store=SqliteStore(path))
+
+    c1.set(42, {'win_odds': '1.5'})
+    assert c2.get(42) == {'win_odds': '1.5'}
+    assert c2.get(43) is None
+
+
+def test_store_hit_keeps_expiry(tmp_path):
+
+    path = str(tmp_path / 'cache.sqlite')
+    c1 = TTLCache(ttl=0.2, maxsize=10, store=SqliteStore(path))
+    c2 = TTLCache(ttl=0.2, maxsize=10, store=SqliteStore(path))
+
+    c1.set(42, {'win_odds': '1.5'})
+    time.sleep(0.15)
+    # 从 store 读到内存后，仍按 c1 写入的时间过期
+    assert c2.get(42) == {'win_odds': '1.5'}
+    time.sleep(0.1)
+    assert c2.get(42) is None
+
+
+def test_store_expired_and_oldest_removed(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(TTLCache, 'STORE_EXPIRE_EVERY', 3)
+    store = SqliteStore(str(tmp_path / 'cache.sqlite'), maxsize=4)
+    c = TTLCache(ttl=0.1, maxsize=10, store=store)
+
+    c.set(1, 'a')
+    c.set(2, 'b')
+    time.sleep(0.12)
+    # 第 3 次写入时清理，过期的 1、2 被删除
+    c.set(3, 'c')
+    assert len(store) == 1
+
+    # 超过 `maxsize` 时删除最早写入的
+    for key in range(4, 10):
+        c.set(key, str(key))
+    assert len(store) == 4
+    assert store.get('5', 10) is None and store.get('6', 10) == '6'
@@ -0,0 +1,167 @@
+import pymysql
+import pytest
+from pymysql.cursors import RE_INSERT_VALUES
+
+from crash import db
+
+
+def test_insert_or_update_many_sql_is_batched_by_pymysql():
+
+    sql = db.build_insert_or_update_many_sql(
+        'football_match', ('id', 'home_score', 'visitor_score'), {'home_score', 'visitor_score'}
+    )
+
+    assert sql == (
+        'INSERT INTO football_match (id, home_score, visitor_score) '
+        'VALUES (%(id)s, %(home_score)s, %(visitor_score)s) '
+        'ON DUPLICATE KEY UPDATE home_score = VALUES(home_score), visitor_score = VALUES(visitor_score)'
+    )
+
+    # 匹配上才会被 executemany 合并成一条多行语句
+    m = RE_INSERT_VALUES.match(sql)
+    assert m is not None
+    assert m.group(3).strip().startswith('ON DUPLICATE KEY UPDATE')
+
+
+class FakeConnection:
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.open = True
+        self.pings = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+def test_pool_reuse_and_limit(monkeypatch):
+
+    monkeypatch.setattr(db.pymysql, 'connect', FakeConnection)
+
+    pool = db.Pool({}, minsize=1, maxsize=2, ping_interval=0, timeout=0.05)
+
+    c1 = pool.acquire()
+    c2 = pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+
+    pings = c1.pings
+    pool.release(c1)
+    c3 = pool.acquire()
+    assert c3 is c1
+    # 空闲超过 ping_interval，借出前检查连接
+    assert c3.pings == pings + 1
+
+    # 已关闭的连接不放回池中，腾出位置
+    c2.close()
+    pool.release(c2)
+    c4 = pool.acquire()
+    assert c4 is not c2 and c4.open
+
+
+def test_pool_rollback_on_error(monkeypatch):
+
+    monkeypatch.setattr(db.pymysql, 'connect', FakeConnection)
+    pool = db.Pool({}, minsize=0, maxsize=1, timeout=0.05)
+
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError
+
+    # 连接已归还
+    with pool.connection() as conn:
+        assert conn.open
+
+
+def test_pool_pings_on_checkout(monkeypatch):
+
+    monkeypatch.setattr(db.pymysql, 'connect', FakeConnection)
+    pool = db.Pool({}, minsize=1, maxsize=1)
+
+    # 默认每次取出都 ping，已被服务端断开的连接重连后再借出
+    for i in range(1, 4):
+        with pool.connection() as conn:
+            assert conn.pings == i
+
+
+def test_tsv_value():
+
+    assert db.tsv_value(None) == '\\N'
+    assert db.tsv_value(1.5) == '1.5'
+    assert db.tsv_value('a\tb\nc\\d') == 'a\\tb\\nc\\\\d'
+
+
+class LoadDataConnection(FakeConnection):
+    """`LOAD DATA` 时抛出 `error`，其他语句记录到 `executed`"""
+
+    error = None
+    executed = []
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def cursor(self):
+        return LoadDataCursor(self)
+
+
+class LoadDataCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        self.conn.executed.append(('LOAD DATA', self.conn.kwargs['local_infile']))
+        raise self.conn.error
+
+    def executemany(self, sql, items):
+        self.conn.executed.append((sql, items))
+        return len(items)
+
+
+@pytest.mark.parametrize('error', [
+    pymysql.err.OperationalError(3948, 'Loading local data is disabled'),
+    pymysql.err.OperationalError(1148, 'The used command is not allowed with this MySQL version'),
+    pymysql.err.Warning('Data truncated'),
+    pymysql.err.DataError(1406, 'Data too long'),
+])
+def test_load_columns_falls_back_to_insert(monkeypatch, error):
+
+    monkeypatch.setattr(db.pymysql, 'connect', LoadDataConnection)
+    monkeypatch.setattr(LoadDataConnection, 'error', error)
+    monkeypatch.setattr(LoadDataConnection, 'executed', [])
+    monkeypatch.setattr(db, '_pools', {})
+
+    columns = {'id': ['1', '2'], 'turnover': [100, None]}
+    assert db.load_columns({}, 't', columns) == 2
+
+    # `LOAD DATA` 用开启了 local_infile 的连接，失败后用普通连接写入
+    [load, (sql, items)] = LoadDataConnection.executed
+    assert load == ('LOAD DATA', True)
+    assert sql == 'INSERT INTO t (id, turnover) VALUES (%(id)s, %(turnover)s)'
+    assert items == [{'id': '1', 'turnover': 100}, {'id': '2', 'turnover': None}]
+
+
+def test_load_columns_other_errors_raise(monkeypatch):
+
+    monkeypatch.setattr(db.pymysql, 'connect', LoadDataConnection)
+    monkeypatch.setattr(LoadDataConnection, 'error', pymysql.err.OperationalError(2013, 'Lost connection'))
+    monkeypatch.setattr(LoadDataConnection, 'executed', [])
+    monkeypatch.setattr(db, '_pools', {})
+
+    with pytest.raises(pymysql.err.OperationalError):
+        db.load_columns({}, 't', {'id': ['1']})
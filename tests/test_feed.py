@@ -0,0 +1,91 @@
+import os
+import threading
+
+from crash import feed
+from crash.spider import MultiThreadSpider
+
+
+def _entries(n, start=0):
+    return [{'table': 't', 'op': 'upsert', 'id': str(i), 'changes': {'v': i}} for i in range(start, start + n)]
+
+
+def test_append_and_read(tmp_path):
+
+    directory = str(tmp_path / 'feed')
+    writer = feed.FeedWriter(directory, segment_bytes=300)
+    assert writer.append(_entries(3)) == 0
+    assert writer.append(_entries(3, 3)) == 3
+    assert writer.append(_entries(3, 6)) == 6
+
+    # 超过 segment_bytes 后新开一段，文件名是第一条的偏移量
+    assert feed.list_segments(directory) == [0, 3, 6]
+
+    reader = feed.FeedReader(directory)
+    assert [e['offset'] for e in reader.read()] == list(range(9))
+    assert [e['id'] for e in reader.read(4)] == ['4', '5', '6', '7', '8']
+
+    # 另一个写入者接着已有的偏移量写
+    assert feed.FeedWriter(directory).append(_entries(1)) == 9
+
+
+def test_retention(tmp_path):
+
+    directory = str(tmp_path)
+    writer = feed.FeedWriter(directory, segment_bytes=1, max_segments=2)
+    for i in range(5):
+        writer.append(_entries(1, i))
+
+    assert feed.list_segments(directory) == [3, 4]
+    # 要读的已被删除时从最早的一段开始
+    assert [e['offset'] for e in feed.FeedReader(directory).read(0)] == [3, 4]
+
+
+def test_partial_line_is_truncated(tmp_path):
+
+    directory = str(tmp_path)
+    feed.FeedWriter(directory).append(_entries(2))
+    with open(os.path.join(directory, feed.segment_name(0)), 'ab') as f:
+        f.write(b'{"offset": 2, "tab')  # 写到一半中断
+
+    # 读者不读不完整的行，写入者截掉后接着写
+    assert [e['offset'] for e in feed.FeedReader(directory).read()] == [0, 1]
+    assert feed.FeedWriter(directory).append(_entries(1)) == 2
+    assert [e['offset'] for e in feed.FeedReader(directory).read()] == [0, 1, 2]
+
+
+def test_tail_follows_new_segments(tmp_path):
+
+    directory = str(tmp_path)
+    writer = feed.FeedWriter(directory, segment_bytes=200)
+    writer.append(_entries(2))
+
+    got = []
+
+    def consume():
+        for entry in feed.FeedReader(directory).tail(1, interval=0.01):
+            got.append(entry['offset'])
+            if entry['offset'] == 7:
+                break
+
+    t = threading.Thread(target=consume)
+    t.start()
+    for i in range(2, 8):
+        writer.append(_entries(1, i))
+    t.join(5)
+
+    assert got == list(range(1, 8))
+    assert len(feed.list_segments(directory)) > 1
+
+
+def test_spider_change():
+
+    s = MultiThreadSpider.__new__(MultiThreadSpider)
+    table = 'test_feed_change'
+    item = {'id': '1', 'score': 0, 'odds': '1.5'}
+
+    # 未知的行为全部字段
+    assert s._change(table, item, {'score', 'odds'})['changes'] == item
+
+    s._remember(table, item, {'score', 'odds'})
+    change = s._change(table, {'id': '1', 'score': 1, 'odds': 1.5}, {'score', 'odds'})
+    assert change == {'table': table, 'op': 'upsert', 'id': '1', 'changes': {'score': 1}}
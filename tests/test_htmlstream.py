@@ -0,0 +1,31 @@
+from crash import htmlstream
+
+
+def test_iter_elements_frees_consumed():
+
+    html = '<html><body><div class="all">{}</div></body></html>'.format(
+        ''.join(f'<table id="t{i}"><tr><td>{i}</td></tr></table>' for i in range(200))
+    )
+
+    seen = []
+    for table in htmlstream.iter_elements(html, 'table', chunk_size=64):
+        seen.append(table.get('id'))
+        # 之前处理过的表格已被删除，最多还留着上一个清空了的
+        before = list(table.itersiblings(preceding=True))
+        assert len(before) <= 1 and all(len(e) == 0 for e in before)
+        assert table.xpath('./tr/td/text()') == [seen[-1][1:]]
+
+    assert seen == [f't{i}' for i in range(200)]
+
+
+def test_iter_elements_match_and_encoding():
+
+    html = '<div class="box">主队</div><div class="other"><div class="box">客队</div></div>'
+    data = html.encode('gbk')
+
+    def is_box(element):
+        return element.get('class') == 'box'
+
+    names = [e.text for e in htmlstream.iter_elements(data, 'div', is_box, encoding='gbk')]
+
+    assert names == ['主队', '客队']
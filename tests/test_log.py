@@ -0,0 +1,71 @@
+import gzip
+import logging
+
+from crash import log
+
+
+def _record(msg, site=None):
+    record = logging.LogRecord('test', log.DEBUG, __file__, 1, msg, None, None)
+    if site is not None:
+        record.site = site
+    return record
+
+
+def test_debug_limit_filter_sample():
+
+    f = log.DebugLimitFilter(sample=3)
+    kept = [i for i in range(7) if f.filter(_record(f'item {i}', ('a.py', 1)))]
+    assert kept == [0, 3, 6]
+
+    # 不同位置分别计数，没有位置的记录不受限制
+    assert f.filter(_record('other', ('a.py', 2)))
+    assert all(f.filter(_record('no site')) for _ in range(5))
+
+
+def test_debug_limit_filter_rate():
+
+    f = log.DebugLimitFilter(rate=(0.001, 2))
+    records = [_record(f'item {i}', ('a.py', 1)) for i in range(5)]
+    assert [f.filter(r) for r in records] == [True, True, False, False, False]
+
+    # 补充令牌后放行，注明之前丢弃的条数
+    f._sites[('a.py', 1)][1]._tokens = 1
+    record = _record({'id': 1}, ('a.py', 1))
+    assert f.filter(record)
+    assert record.getMessage() == "{'id': 1} （此处省略 3 条）"
+
+
+def test_gzip_rotating_file_handler(tmp_path):
+
+    path = str(tmp_path / 'spider.log')
+    handler = log.GzipRotatingFileHandler(path, maxBytes=100, backupCount=2)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for i in range(10):
+        handler.emit(_record(f'{i:02d}' * 20))
+    handler.close()
+
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names == ['spider.log', 'spider.log.1.gz', 'spider.log.2.gz']
+    # 每个文件两行，最新的两行在 spider.log 中，之前的两行在 .1.gz 中
+    with gzip.open(str(tmp_path / 'spider.log.1.gz'), 'rt') as f:
+        assert f.read() == '06' * 20 + '\n' + '07' * 20 + '\n'
+
+
+def test_set_output_queue(tmp_path):
+
+    path = str(tmp_path / 'log' / 'spider.log')
+    try:
+        log.logger.set_log_level(log.DEBUG)
+        log.logger.set_output(path, use_queue=True)
+        item = {'id': 1}
+        log.logger.info('start')
+        log.logger.debug(item)
+        item['id'] = 2  # 入队后修改不影响日志
+        log.logger.stop_queue()
+
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines[0].endswith('[INFO] start')
+        assert lines[1].endswith("[DEBUG] {'id': 1}")
+    finally:
+        log.logger.set_output()
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from crash import metrics
+
+
+def test_registry_export(tmp_path):
+
+    r = metrics.Registry()
+    r.inc('spider_rows_written_total', 3, spider='BetfairSpider', table='betfair')
+    r.inc('spider_rows_written_total', 2, spider='BetfairSpider', table='betfair')
+    r.inc('spider_phase_seconds_total', 0.5, spider='BetfairSpider', phase='parse')
+    r.set('spider_last_run_seconds', 1.25, spider='BetfairSpider')
+
+    assert r.get('spider_rows_written_total', spider='BetfairSpider', table='betfair') == 5
+
+    text = r.to_text()
+    assert '# TYPE spider_rows_written_total counter' in text
+    assert 'spider_rows_written_total{spider="BetfairSpider",table="betfair"} 5' in text
+    assert 'spider_phase_seconds_total{phase="parse",spider="BetfairSpider"} 0.5' in text
+    assert '# TYPE spider_last_run_seconds gauge' in text
+
+    path = str(tmp_path / 'metrics.json')
+    r.export(path)
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    assert {'name': 'spider_last_run_seconds', 'labels': {'spider': 'BetfairSpider'}, 'value': 1.25} in data
+
+
+def test_undefined_metric():
+
+    with pytest.raises(KeyError):
+        metrics.Registry().inc('no_such_metric')
@@ -0,0 +1,83 @@
+import os
+import json
+
+from betfair import BetfairSpider
+from betfair_detail import BetfairDetailSpider
+from basketball_bet import BasketballBetSpider
+from basketball_match_schedule import BasketballMatchScheduleSpider
+from crash import htmlstream
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_betfair_parse():
+
+    html = load_fixture('betfair.json')['result']['bf_page']
+    expected = load_fixture('betfair_expected.json')
+
+    items = list(BetfairSpider.parse(html, '20190616'))
+
+    assert items == expected
+    # 字段顺序与入库一致
+    assert [list(item) for item in items] == [list(item) for item in expected]
+
+
+def test_basketball_parse():
+
+    with open(os.path.join(FIXTURES, 'basketball.html'), encoding='utf-8') as f:
+        html = f.read()
+    expected = load_fixture('basketball_expected.json')
+
+    items = list(BasketballBetSpider.parse(html, '20190616'))
+    assert items == expected['bet']
+    assert [list(item) for item in items] == [list(item) for item in expected['bet']]
+
+    assert list(BasketballMatchScheduleSpider.parse(html)) == expected['schedule']
+    assert list(BasketballMatchScheduleSpider.parse(html.encode(), 'utf-8')) == expected['schedule']
+
+
+def test_basketball_schedule_date_after_tables():
+
+    # 当前日期的链接在比赛表格之后，与链接在前时解析出的相同
+    with open(os.path.join(FIXTURES, 'basketball_date_after.html'), encoding='utf-8') as f:
+        html = f.read()
+    expected = load_fixture('basketball_expected.json')['schedule']
+
+    items = list(BasketballMatchScheduleSpider.parse(html))
+    assert items and items == expected[:len(items)]
+
+
+def test_betfair_detail_parse():
+
+    jd = load_fixture('betfair_detail.json')
+    expected = load_fixture('betfair_detail_expected.json')
+
+    assert list(BetfairDetailSpider.parse(jd, 2019)) == expected
+
+    columns = BetfairDetailSpider.parse_columns(jd, 2019)
+    assert list(columns) == list(expected[0])
+    assert columns['proportion'] == [item['proportion'] for item in expected]
+
+    jd['result']['bigTradeList']['bigList']['all'] = []
+    assert list(BetfairDetailSpider.parse(jd, 2019)) == []
+
+
+def test_basketball_league_prefilter():
+
+    with open(os.path.join(FIXTURES, 'basketball.html'), 'rb') as f:
+        html = f.read()
+
+    spider = BasketballMatchScheduleSpider
+    tables = htmlstream.iter_elements(html, 'table', spider._is_league_table, 'utf-8', discard=spider._is_table)
+
+    # 只产出 NBA、CBA 的表格，其余的在流式解析时就过滤掉并释放
+    leagues = []
+    for table in tables:
+        leagues.append((spider.XPATH_LEAGUE(table) or spider.XPATH_LEAGUE_TEXT(table))[0].strip())
+        assert all(len(e) == 0 for e in table.itersiblings(preceding=True))
+    assert len(leagues) == 24 and set(leagues) == spider.LEAGUE_FILTER
@@ -0,0 +1,63 @@
+import os
+import json
+import datetime
+from collections import Counter
+
+from crash.polling import PollPlanner
+from football_bet import FootballBetSpider
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def test_poll_planner_slot():
+
+    # 进程中没有记录时，间隔 3 个槽的对象每 3 个槽到期一次
+    due = [PollPlanner(slot=60).due('a', 180, now=t * 60) for t in range(9)]
+    assert due.count(True) == 3
+    assert due[:3] == due[3:6] == due[6:]
+
+    p = PollPlanner(slot=60)
+    assert all(p.due('a', 0, now=t * 60) for t in range(3))
+    assert not p.due('a', None)
+
+
+def test_poll_planner_memory():
+
+    p = PollPlanner(slot=60)
+    p.due('a', 0, now=1000)
+    # 有记录后按上次处理的时间判断，允许半个槽的抖动
+    assert not p.due('a', 300, now=1200)
+    assert p.due('a', 300, now=1275)
+    assert not p.due('a', 300, now=1335)
+
+
+def test_football_poll_state():
+
+    with open(os.path.join(FIXTURES, 'football_matches.json'), encoding='utf-8') as f:
+        jd = json.load(f)
+    items = list(FootballBetSpider.parse(jd, '20190616'))
+
+    now = datetime.datetime(2019, 6, 16, 18)
+    soon = 3600
+
+    def state(item, last):
+        return FootballBetSpider.poll_state(item, last, now, soon)
+
+    # 库中没有的都要请求
+    assert {state(item, None) for item in items} == {'new'}
+
+    # 库中与本次相同时，完场、取消的不再请求
+    states = Counter(state(item, {k: str(v) for k, v in item.items()}) for item in items)
+    assert states['finished'] and states['cancelled'] and states['live']
+    assert set(states) <= set(FootballBetSpider.POLL_INTERVAL)
+
+    item = {'compete_time': '完', 'start_time': '2019-06-16 17:00:00'}
+    assert state(item, {'compete_time': '90+'}) == 'new'
+    assert state(item, {'compete_time': '完'}) == 'finished'
+
+    item = {'compete_time': '未', 'start_time': '2019-06-16 18:30:00'}
+    assert state(item, {}) == 'soon'
+    item['start_time'] = '2019-06-16 21:00:00'
+    assert state(item, {}) == 'upcoming'
+    item['start_time'] = '2019-06-16 17:30:00'  # 已过开赛时间还未开始
+    assert state(item, {}) == 'soon'
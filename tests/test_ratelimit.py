@@ -0,0 +1,45 @@
+import time
+
+from crash.ratelimit import TokenBucket, FileTokenBucket
+
+
+def test_token_bucket():
+
+    b = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    for _ in range(4):
+        b.acquire()
+    # 突发 2 个不等待，后 2 个各等 1/20 秒
+    assert 0.08 <= time.monotonic() - start < 0.3
+
+
+def test_file_token_bucket_shared(tmp_path):
+
+    path = str(tmp_path / 'host.bucket')
+    b1 = FileTokenBucket(rate=20, burst=2, path=path)
+    b2 = FileTokenBucket(rate=20, burst=2, path=path)
+
+    assert b1.acquire() == 0
+    assert b2.acquire() == 0
+    # 两个桶共享状态，令牌已用完
+    assert b1.acquire() > 0
+
+
+def test_token_bucket_timeout():
+
+    b = TokenBucket(rate=1, burst=1)
+    assert b.acquire() == 0
+    # 下一个令牌要等 1 秒，超过 timeout 时立即返回
+    start = time.monotonic()
+    assert b.acquire(timeout=0.1) is None
+    assert time.monotonic() - start < 0.05
+
+
+def test_try_acquire():
+
+    b = TokenBucket(rate=10, burst=1)
+    assert b.try_acquire()
+    # 不等待，没有令牌时立即返回 False
+    assert not b.try_acquire()
+    time.sleep(0.11)
+    assert b.try_acquire()
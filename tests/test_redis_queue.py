@@ -0,0 +1,188 @@
+"""连本地 redis-server 测试，可用 REDIS_URL 指定，如 redis://localhost:6379/15。
+连不上时改用 fakeredis，脚本由其内嵌的 Lua 执行（`pip install fakeredis[lua]`），都没有时跳过。"""
+
+import os
+import time
+import queue
+import functools
+import threading
+
+import pytest
+import redis
+
+from crash import redis_queue, spider
+from crash.redis_queue import RedisTaskQueue
+from betfair_detail import BetfairDetailSpider
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/15')
+
+
+@pytest.fixture
+def redis_config(monkeypatch):
+    client = redis.Redis.from_url(REDIS_URL)
+    try:
+        client.ping()
+    except redis.exceptions.ConnectionError:
+        fakeredis = pytest.importorskip('fakeredis', reason=f'没有可用的 redis-server: {REDIS_URL}')
+        pytest.importorskip('lupa', reason='fakeredis 执行脚本需要 lupa')
+        # 同一用例中的各个连接共享一个内存中的服务端
+        server = fakeredis.FakeServer()
+        monkeypatch.setattr(redis_queue.redis, 'Redis', functools.partial(fakeredis.FakeRedis, server=server))
+        return {}
+
+    kwargs = client.connection_pool.connection_kwargs
+    return {'host': kwargs['host'], 'port': kwargs['port'], 'db': kwargs['db']}
+
+
+@pytest.fixture
+def make_queue(redis_config):
+    queues = []
+
+    def make(**kwargs):
+        q = RedisTaskQueue(redis_config, 'test_redis_queue', key=lambda row: str(row[1]), **kwargs)
+        queues.append(q)
+        return q
+
+    yield make
+    queues[0].clear()
+
+
+def test_put_get_dedup(make_queue):
+
+    q = make_queue()
+    assert q.put((1, 'bf1'))
+    assert q.put((2, 'bf2'))
+    assert not q.put((3, 'bf1'))  # 同一 match_bf_id 已在队列中
+    assert q.qsize() == 2
+
+    assert q.get_nowait() == [1, 'bf1']  # 先进先出
+    assert not q.put((1, 'bf1'))  # 处理中也不重复入队
+    assert q.inflight() == 1
+
+    q.task_done()
+    assert q.inflight() == 0
+    assert q.put((1, 'bf1'))  # 确认后可再入队
+
+    assert q.get_nowait() == [2, 'bf2']
+    assert q.get_nowait() == [1, 'bf1']
+    with pytest.raises(queue.Empty):
+        q.get_nowait()
+
+
+def test_done_ttl(make_queue):
+
+    q = make_queue(done_ttl=60)
+    q.put((1, 'bf1'))
+    q.get_nowait()
+    q.task_done()
+    assert not q.put((1, 'bf1'))
+
+
+def test_visibility_timeout(make_queue):
+
+    q1 = make_queue(visibility_timeout=0.2, worker='w1')
+    q2 = make_queue(visibility_timeout=0.2, worker='w2')
+    q1.put((1, 'bf1'))
+
+    q1.get_nowait()  # w1 取出后没有确认
+    with pytest.raises(queue.Empty):
+        q2.get_nowait()
+
+    time.sleep(0.3)
+    assert q2.get_nowait() == [1, 'bf1']  # 超时后重新入队
+    q2.task_done()
+    assert q1.expired() == 1
+
+    stats = q1.stats()
+    assert stats['w2']['done'] == 1 and 'w1' not in stats
+
+
+def test_task_done_is_per_thread(make_queue):
+
+    q = make_queue()
+    for i in range(20):
+        q.put((i, f'bf{i}'))
+
+    done = []
+
+    def work():
+        while True:
+            try:
+                row = q.get_nowait()
+            except queue.Empty:
+                break
+            done.append(row[0])
+            q.task_done()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(done) == list(range(20))
+    assert q.inflight() == 0
+    assert q.stats()[q.worker]['done'] == 20
+
+
+def unexpired(q):
+    """处理中且未超时的任务数，按 Redis 的时间"""
+
+    t = q.redis.time()
+    return len(q.redis.zrangebyscore(q.inflight_key, t[0] + t[1] / 1e6, '+inf'))
+
+
+def test_expired_task_is_requeued(make_queue):
+
+    q1 = make_queue(visibility_timeout=0.5, worker='w1')
+    q2 = make_queue(visibility_timeout=0.5, worker='w2')
+    q1.put(('1', 'bf1'))
+    q1.get_nowait()
+
+    # 处理中延长了超时，原来的超时时间过了也不重新入队
+    time.sleep(0.3)
+    q1.extend()
+    time.sleep(0.3)
+    with pytest.raises(queue.Empty):
+        q2.get_nowait()
+    assert q1.inflight() == 1
+
+    time.sleep(0.3)
+    assert q2.get_nowait() == ['1', 'bf1']
+    assert q1.expired() == 1
+
+    q2.task_done()
+    assert q2.inflight() == 0 and q2.empty()
+    q1.task_done()  # 超时后才确认
+    assert q1.inflight() == 0
+
+
+def test_spider_extends_and_acks_task(make_queue, monkeypatch):
+
+    monkeypatch.setattr(spider.db, 'get_pool', lambda mysql_config: None)
+    monkeypatch.setattr(BetfairDetailSpider, 'REDIS_CONFIG', {})
+    monkeypatch.setattr(BetfairDetailSpider, 'TASK_VISIBILITY_TIMEOUT', 0.2)
+    monkeypatch.setattr(BetfairDetailSpider, 'q', make_queue(visibility_timeout=0.2))
+    q = BetfairDetailSpider.q
+    q.put(('1', 'bf1'))
+    q.put(('2', 'bf2'))
+
+    s = BetfairDetailSpider('test', {})
+    s.before_run()
+
+    def get(url):
+        # 请求和重试用了 0.45 秒，超过任务的超时时间，每次发出请求前延长
+        for remaining in (0.45, 0.3, 0.15):
+            s.session.before_attempt(remaining)
+            time.sleep(0.15)
+            assert unexpired(q) == 1
+        if url.endswith('bf1'):
+            return None
+        raise ValueError('bad response')
+
+    monkeypatch.setattr(s.session, 'get', get)
+    with pytest.raises(ValueError):
+        s.run()
+
+    # 请求失败、出现异常的任务都已确认
+    assert q.inflight() == 0 and q.empty()
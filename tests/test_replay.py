@@ -0,0 +1,114 @@
+import threading
+
+from requests.models import Response
+
+from crash import sessions, replay
+
+
+def _response(content, etag=None):
+    r = Response()
+    r.status_code = 200
+    r._content = content
+    r.headers['Content-Type'] = 'application/json'
+    if etag:
+        r.headers['ETag'] = etag
+    return r
+
+
+def _start(archive, **kwargs):
+    server = replay.StubServer(archive, ('127.0.0.1', 0), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_record_and_replay(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(sessions, '_breakers', {})
+
+    path = str(tmp_path / 'record.jsonl')
+    recorder = replay.Recorder(path)
+    recorder.record('GET', 'https://live.aicai.com/a?b=1', None, _response(b'{"v": 1}', '"v1"'))
+    recorder.record('POST', 'https://live.13322.com/odds', 'matchId=1', _response(b'[1]'))
+    recorder.record('POST', 'https://live.13322.com/odds', 'matchId=2', _response(b'[2]'))
+
+    server = _start(replay.load_archive(path))
+    try:
+        monkeypatch.setattr(sessions, '_base_url', server.base_url)
+        # 经桩服务器再录制一遍，录下的是原地址
+        path2 = str(tmp_path / 'record2.jsonl')
+        monkeypatch.setattr(sessions, '_recorder', replay.Recorder(path2))
+
+        s = sessions.Session()
+        assert s.get_if_changed('https://live.aicai.com/a?b=1').json() == {'v': 1}
+        s.commit_digest('https://live.aicai.com/a?b=1')
+        assert s.get_if_changed('https://live.aicai.com/a?b=1') is None  # 304
+        assert s.post('https://live.13322.com/odds', data={'matchId': 2}).json() == [2]
+        assert s.get('https://live.aicai.com/missing').status_code == 404
+
+        assert server.stats['not_modified'] == 1
+        assert server.stats['not_found'] == 1
+
+        archive = replay.load_archive(path2)
+        assert archive[('POST', 'live.13322.com/odds', 'matchId=2')][0]['content'] == b'[2]'
+        assert ('GET', 'live.aicai.com/a?b=1', '') in archive
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_reset_injection_retries(monkeypatch):
+
+    monkeypatch.setattr(sessions, '_breakers', {})
+
+    archive = {('GET', 'live.aicai.com/a', ''): [{
+        'status': 200, 'headers': {}, 'content': b'ok'
+    }]}
+    server = _start(archive, reset_rate=1)
+    try:
+        monkeypatch.setattr(sessions, '_base_url', server.base_url)
+
+        s = sessions.Session(sessions.RetryPolicy(max_retries=2, backoff_base=0.01, deadline=5))
+        assert s.get('https://live.aicai.com/a') is None
+        assert s.stats['retries'] == 2
+        assert server.stats['resets'] == 3
+        # 熔断按原主机计算
+        assert 'live.aicai.com' in sessions.breaker_stats()
+
+        server.reset_rate = 0
+        assert s.get('https://live.aicai.com/a').content == b'ok'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_error_injection_retries_and_trips(monkeypatch):
+
+    monkeypatch.setattr(sessions, '_breakers', {})
+    breaker = sessions.get_breaker('live.aicai.com')
+    breaker.threshold = 4
+
+    archive = {('GET', 'live.aicai.com/a', ''): [{
+        'status': 200, 'headers': {}, 'content': b'ok'
+    }]}
+    server = _start(archive, error_rate=1, error_status=503)
+    try:
+        monkeypatch.setattr(sessions, '_base_url', server.base_url)
+
+        s = sessions.Session(sessions.RetryPolicy(max_retries=2, backoff_base=0.01, deadline=5))
+        # 注入的 503 被重试
+        assert s.get('https://live.aicai.com/a') is None
+        assert s.stats['retries'] == 2 and s.stats['failures'] == 1
+        assert server.stats['errors'] == 3
+
+        # 连续失败达到阈值后熔断，之后的重试、请求不再发出
+        assert s.get('https://live.aicai.com/a') is None
+        assert s.stats['trips'] == 1 and s.stats['short_circuits'] == 1
+        assert sessions.breaker_stats()['live.aicai.com']['open']
+        assert server.stats['errors'] == 4
+
+        assert s.get('https://live.aicai.com/a') is None
+        assert s.stats['short_circuits'] == 2
+        assert server.stats['requests'] == 4
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+from crash.scheduler import Scheduler
+
+
+def test_run_once_concurrent_with_dependency(fake_spider):
+
+    class A(fake_spider):
+        pass
+
+    class B(fake_spider):
+        pass
+
+    class C(fake_spider):
+        pass
+
+    s = Scheduler({})
+    a = s.add(A)
+    s.add(B)
+    s.add(C, after=(a,))
+
+    start = time.monotonic()
+    s.run_once()
+    elapsed = time.monotonic() - start
+
+    records = fake_spider.records
+    # A、B 并发，C 等 A 结束后才开始
+    assert abs(records['A'][0] - records['B'][0]) < fake_spider.cost / 2
+    assert records['C'][0] >= records['A'][1]
+    assert elapsed < fake_spider.cost * 3
+
+    path, _ = s.critical_path()
+    assert [job.name for job in path] == ['A', 'C']
+
+
+def test_dependency_must_be_registered_first(fake_spider):
+
+    s = Scheduler({})
+    other = Scheduler({}).add(fake_spider)
+    with pytest.raises(ValueError):
+        s.add(fake_spider, after=(other,))
@@ -0,0 +1,194 @@
+import socket
+import time
+
+import pytest
+from requests.exceptions import InvalidURL
+from requests.models import Response
+
+from crash import sessions
+
+
+def test_circuit_breaker():
+
+    b = sessions.CircuitBreaker(threshold=2, reset_timeout=0.05)
+    assert b.allow()
+    assert not b.record_failure()
+    assert b.record_failure()  # 第二次失败熔断
+    assert not b.allow()
+
+    time.sleep(0.06)
+    assert b.allow()  # 放行一个试探请求
+    assert not b.allow()
+    assert b.record_failure()  # 试探失败，重新熔断
+    assert not b.allow()
+
+    time.sleep(0.06)
+    assert b.allow()
+    b.record_success()
+    assert b.allow() and not b.is_open
+
+
+def _unused_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def test_retry_stats_and_breaker(monkeypatch):
+
+    # 不影响其他用例中的熔断器
+    monkeypatch.setattr(sessions, '_breakers', {})
+
+    s = sessions.Session(sessions.RetryPolicy(max_retries=2, backoff_base=0.01, deadline=5))
+    url = f'http://127.0.0.1:{_unused_port()}/'
+    host_breaker = sessions.get_breaker('127.0.0.1')
+    host_breaker.threshold = 3
+
+    assert s.get(url) is None
+    assert s.stats['requests'] == 1
+    assert s.stats['retries'] == 2
+    assert s.stats['failures'] == 1
+    assert s.stats['trips'] == 1
+
+    # 熔断后直接失败
+    start = time.monotonic()
+    assert s.get(url) is None
+    assert time.monotonic() - start < 0.5
+    assert s.stats['short_circuits'] == 1
+    assert sessions.breaker_stats()['127.0.0.1']['open']
+
+
+def test_run_deadline():
+
+    s = sessions.Session()
+    s.set_run_deadline(0)
+    assert s.get('http://127.0.0.1:1/') is None
+    assert s.stats['short_circuits'] == 1
+
+
+def test_breaker_probe_released_on_exception(monkeypatch):
+
+    monkeypatch.setattr(sessions, '_breakers', {})
+    breaker = sessions.get_breaker('127.0.0.1')
+    breaker.reset_timeout = 0.05
+    breaker.opened_at = time.monotonic() - 1  # 已过熔断时间，下一个请求是试探请求
+
+    s = sessions.Session()
+
+    def send(*args, **kwargs):
+        raise InvalidURL('bad url')
+
+    monkeypatch.setattr(s, 'send', send)
+    with pytest.raises(InvalidURL):
+        s.get('http://127.0.0.1:1/')
+
+    # 试探请求异常结束后，仍可再试探
+    assert breaker.allow()
+
+
+def test_breaker_probe_released_on_deadline(monkeypatch):
+
+    monkeypatch.setattr(sessions, '_breakers', {})
+    breaker = sessions.get_breaker('127.0.0.1')
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+
+    s = sessions.Session(sessions.RetryPolicy(deadline=0.05))
+    # 限速等待超过截止时间，请求没有发出
+    monkeypatch.setattr(sessions.limiter, 'acquire', lambda host, *args: time.sleep(0.1) or 0.1)
+
+    assert s.get('http://127.0.0.1:1/') is None
+    assert s.stats['short_circuits'] == 1
+    assert breaker.allow()
+
+
+def test_throttle_respects_deadline(monkeypatch):
+
+    limiter = sessions.limiter
+    monkeypatch.setattr(limiter, '_buckets', {})
+    limiter.configure('127.0.0.1', rate=0.5, burst=1)
+    limiter.acquire('127.0.0.1')  # 用掉唯一的令牌，下一个要等 2 秒
+
+    s = sessions.Session(sessions.RetryPolicy(deadline=0.2))
+    start = time.monotonic()
+    assert s.get('http://127.0.0.1:1/') is None
+    assert time.monotonic() - start < 0.2
+    assert s.stats['short_circuits'] == 1
+
+
+def test_digest_committed_after_save():
+
+    s = sessions.Session()
+    assert s.changed('a', '<html>1</html>')
+    # 入库失败没有提交，下次同样的内容仍要处理
+    assert s.changed('a', '<html>1</html>')
+
+    s.commit_digest('a')
+    assert not s.changed('a', '<html>1</html>')
+    assert s.changed('a', '<html>2</html>')
+
+
+def _status_response(status, **headers):
+    r = Response()
+    r.status_code = status
+    r._content = b''
+    r.headers.update(headers)
+    return r
+
+
+def test_server_errors_retried_and_trip_breaker(monkeypatch):
+
+    monkeypatch.setattr(sessions, '_breakers', {})
+    breaker = sessions.get_breaker('127.0.0.1')
+    breaker.threshold = 3
+
+    s = sessions.Session(sessions.RetryPolicy(max_retries=3, backoff_base=0.01, deadline=5))
+    statuses = [503, 502, 200]
+    monkeypatch.setattr(s, 'send', lambda *args, **kwargs: _status_response(statuses.pop(0)))
+
+    # 5xx 重试，成功后熔断器的失败计数清零
+    assert s.get('http://127.0.0.1:1/').status_code == 200
+    assert s.stats['retries'] == 2
+    assert breaker.failures == 0
+
+    # 一直返回 5xx 的主机会熔断
+    monkeypatch.setattr(s, 'send', lambda *args, **kwargs: _status_response(503))
+    assert s.get('http://127.0.0.1:1/') is None
+    assert s.stats['trips'] == 1 and s.stats['failures'] == 1
+    assert sessions.breaker_stats()['127.0.0.1']['open']
+
+    # 4xx 不重试，原样返回
+    monkeypatch.setattr(sessions, '_breakers', {})
+    monkeypatch.setattr(s, 'send', lambda *args, **kwargs: _status_response(404))
+    assert s.get('http://127.0.0.1:1/').status_code == 404
+
+
+def test_retry_after_on_429(monkeypatch):
+
+    monkeypatch.setattr(sessions, '_breakers', {})
+
+    s = sessions.Session(sessions.RetryPolicy(max_retries=2, backoff_base=0.01, deadline=60))
+    statuses = [_status_response(429, **{'Retry-After': '2'}), _status_response(200)]
+    monkeypatch.setattr(s, 'send', lambda *args, **kwargs: statuses.pop(0))
+
+    delays = []
+    monkeypatch.setattr(sessions.time, 'sleep', delays.append)
+
+    assert s.get('http://127.0.0.1:1/').status_code == 200
+    assert delays == [2.0]
+
+    # Retry-After 超过截止时间时不再等待
+    s.retry_policy = sessions.RetryPolicy(max_retries=2, deadline=1)
+    statuses = [_status_response(429, **{'Retry-After': '30'})]
+    monkeypatch.setattr(s, 'send', lambda *args, **kwargs: statuses.pop(0))
+    assert s.get('http://127.0.0.1:1/') is None
+    assert delays == [2.0]
+
+
+def test_parse_retry_after():
+
+    assert sessions.parse_retry_after('5') == 5
+    assert sessions.parse_retry_after(None) is None
+    assert sessions.parse_retry_after('soon') is None
+    assert sessions.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
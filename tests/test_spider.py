@@ -0,0 +1,209 @@
+from contextlib import contextmanager
+
+import pymysql
+import pytest
+
+from crash import spider
+
+
+class FakeCursor:
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _maybe_fail(self, items):
+        for item in items:
+            error = self.pool.fail.get(item['id'])
+            if error is not None:
+                raise error
+
+    def execute(self, sql, args=None):
+        self._maybe_fail([args])
+        self.pool.written.append(args['id'])
+        return 1
+
+    def executemany(self, sql, items):
+        if self.pool.fail_many is not None:
+            error, self.pool.fail_many = self.pool.fail_many, None
+            raise error
+        self._maybe_fail(items)
+        self.pool.pending.extend(item['id'] for item in items)
+        return len(items)
+
+
+class FakeConnection:
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def begin(self):
+        self.pool.pending = []
+
+    def commit(self):
+        self.pool.written.extend(self.pool.pending)
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+
+class FakePool:
+    """记录写入的 id，`fail` 中的 id 写入时抛出对应的异常，`fail_many` 让下一次批量写入失败"""
+
+    def __init__(self):
+        self.written = []
+        self.pending = []
+        self.fail = {}
+        self.fail_many = None
+
+    @contextmanager
+    def cursor(self, cursor_class=None):
+        yield FakeCursor(self)
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+
+class WriteSpider(spider.MultiThreadSpider):
+
+    def run(self):
+        pass
+
+
+@pytest.fixture
+def make_spider(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(spider.db, 'get_pool', lambda mysql_config: pool)
+    # 不影响其他用例
+    monkeypatch.setattr(spider.MultiThreadSpider, '_last_written', spider.LastWritten())
+
+    def make(batch_size=0):
+        s = WriteSpider('test', {})
+        s.BATCH_SIZE = batch_size
+        s.BATCH_INTERVAL = 3600
+        return s
+
+    return make, pool
+
+
+def test_failed_row_is_not_remembered(make_spider):
+
+    make, pool = make_spider
+    s = make()
+    pool.fail['1'] = pymysql.err.Warning('bad value')
+
+    s.insert_or_update('t', {'id': '1', 'v': 1}, {'v'})
+    assert pool.written == []
+
+    # 写入失败的行没有记下，下次相同的数据仍会写入
+    del pool.fail['1']
+    s.insert_or_update('t', {'id': '1', 'v': 1}, {'v'})
+    assert pool.written == ['1']
+
+    s.insert_or_update('t', {'id': '1', 'v': 1}, {'v'})
+    assert pool.written == ['1']
+
+
+def test_batch_fallback_remembers_only_written_rows(make_spider):
+
+    make, pool = make_spider
+    s = make(batch_size=10)
+    pool.fail_many = pymysql.err.Warning('bad value')
+    pool.fail['2'] = pymysql.err.Warning('bad value')
+
+    s.insert_or_update('t', {'id': '1', 'v': 1}, {'v'})
+    s.insert_or_update('t', {'id': '2', 'v': 1}, {'v'})
+    s.flush()
+    assert pool.written == ['1']
+
+    del pool.fail['2']
+    s.insert_or_update('t', {'id': '1', 'v': 1}, {'v'})
+    s.insert_or_update('t', {'id': '2', 'v': 1}, {'v'})
+    s.flush()
+    assert pool.written == ['1', '2']
+
+
+def test_flush_keeps_rows_on_operational_error(make_spider):
+
+    make, pool = make_spider
+    s = make(batch_size=10)
+    pool.fail_many = pymysql.err.OperationalError(2013, 'Lost connection')
+
+    s.insert_or_update('t', {'id': '1', 'v': 1}, {'v'})
+    s.insert_or_update('t', {'id': '2', 'v': 1}, {'v'})
+    with pytest.raises(pymysql.err.OperationalError):
+        s.flush()
+    assert pool.written == []
+
+    # 数据放回了缓冲区，没有记为已写入，下次 flush 时写入
+    s.insert_or_update('t', {'id': '2', 'v': 1}, {'v'})
+    s.insert_or_update('t', {'id': '3', 'v': 1}, {'v'})
+    s.flush()
+    assert sorted(pool.written) == ['1', '2', '2', '3']
+
+
+def test_fallback_keeps_unwritten_rows_on_operational_error(make_spider):
+
+    make, pool = make_spider
+    s = make(batch_size=10)
+    pool.fail_many = pymysql.err.Warning('bad value')
+    pool.fail['2'] = pymysql.err.OperationalError(2013, 'Lost connection')
+
+    for i in range(1, 4):
+        s.insert_or_update('t', {'id': str(i), 'v': 1}, {'v'})
+    with pytest.raises(pymysql.err.OperationalError):
+        s.flush()
+    assert pool.written == ['1']
+
+    # 已写入的不再重复写，未写入的下次写入
+    del pool.fail['2']
+    s.flush()
+    assert pool.written == ['1', '2', '3']
+
+
+def test_last_written_is_bounded():
+
+    cache = spider.LastWritten(maxsize=2, warmed_maxsize=1)
+    cache.set('t', 1, {'v': '1'})
+    cache.set('t', 2, {'v': '2'})
+    assert cache.get('t', '1') == {'v': '1'}  # 1 最近用过
+    cache.set('t', 3, {'v': '3'})
+
+    assert len(cache) == 2
+    assert cache.get('t', 2) is None
+    assert cache.get('t', 1) is not None and cache.get('t', 3) is not None
+
+    cache.mark_warmed('t', "id LIKE '20190616%'")
+    cache.mark_warmed('t', "id LIKE '20190617%'")
+    assert not cache.is_warmed('t', "id LIKE '20190616%'")
+    assert cache.is_warmed('t', "id LIKE '20190617%'")
+
+
+@pytest.mark.parametrize('error', [
+    pymysql.err.DataError(1406, 'Data too long'),
+    pymysql.IntegrityError(1048, "Column 'id' cannot be null"),
+])
+def test_bad_row_does_not_block_buffer(make_spider, error):
+
+    make, pool = make_spider
+    s = make(batch_size=10)
+    pool.fail_many = error
+    pool.fail['2'] = error
+
+    for i in range(1, 4):
+        s.insert_or_update('t', {'id': str(i), 'v': 1}, {'v'})
+    s.flush()
+
+    # 不合法的一行被过滤，其余的写入，不留在缓冲区中
+    assert pool.written == ['1', '3']
+    assert s._buffer == {} and s._buffer_size == 0
+
+    s.insert_or_update('t', {'id': '4', 'v': 1}, {'v'})
+    s.flush()
+    assert pool.written == ['1', '3', '4']
@@ -0,0 +1,231 @@
+"""解析函数基准测试，用 tests/fixtures 中的数据离线衡量各爬虫解析的吞吐量和内存分配。
+
+在项目根目录下运行：
+
+    python tools/benchmark.py                          # 运行所有用例
+    python tools/benchmark.py betfair football_bet     # 只运行指定用例
+    python tools/benchmark.py --save benchmark.json    # 保存结果，作为之后比较的基准
+    python tools/benchmark.py --baseline benchmark.json --threshold 0.2
+
+最后一种与基准比较，任一用例的 items/s 下降超过 20% 时以状态码 1 退出。
+基准与机器有关，须在同一台机器上保存和比较。
+
+内存分配由 tracemalloc 统计，只包括 Python 对象，不包括 lxml 在 C 中分配的树。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lxml import etree
+
+from betfair import BetfairSpider
+from betfair_detail import BetfairDetailSpider
+from basketball_bet import BasketballBetSpider
+from basketball_match_schedule import BasketballMatchScheduleSpider
+from football_match_schedule import FootballMatchScheduleSpider
+from football_bet import FootballBetSpider
+from football_match import FootballMatchSpider
+
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+DATE_FORMAT = '20190616'
+
+
+def load_json(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_bytes(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+def case_betfair():
+    html = load_json('betfair.json')['result']['bf_page']
+    return lambda: list(BetfairSpider.parse(html, DATE_FORMAT))
+
+
+def case_betfair_detail():
+    jd = load_json('betfair_detail.json')
+    return lambda: list(BetfairDetailSpider.parse(jd, 2019))
+
+
+def case_betfair_detail_columns():
+    jd = load_json('betfair_detail.json')
+    # 各列等长，取一列的长度作为 item 数
+    return lambda: BetfairDetailSpider.parse_columns(jd, 2019)['turnover']
+
+
+def case_basketball_bet():
+    content = load_bytes('basketball.html')
+    return lambda: list(BasketballBetSpider.parse(content, DATE_FORMAT, 'utf-8'))
+
+
+def case_basketball_match_schedule():
+    html = load_bytes('basketball.html').decode('utf-8')
+    return lambda: list(BasketballMatchScheduleSpider.parse(html))
+
+
+def case_basketball_match_schedule_parse():
+    """只有表格解析，不含建树"""
+
+    selector = etree.HTML(load_bytes('basketball.html'))
+    tables = selector.xpath('//div[@class="table-all"]/table')
+
+    def run():
+        return list(BasketballMatchScheduleSpider._parse(tables, DATE_FORMAT))
+
+    return run
+
+
+def case_football_match_schedule():
+    jd = load_json('football_matches.json')
+    return lambda: list(FootballMatchScheduleSpider.parse(jd, DATE_FORMAT))
+
+
+def case_football_bet():
+    jd = load_json('football_matches.json')
+    return lambda: list(FootballBetSpider.parse(jd, DATE_FORMAT))
+
+
+def case_football_match():
+    jd = load_json('football_matches.json')
+    return lambda: list(FootballMatchSpider.parse(jd, DATE_FORMAT))
+
+
+def case_compute_current_odds():
+    jd = load_json('football_current_odds.json')
+    # 每次请求返回一场比赛的赔率，算作一个 item
+    return lambda: [FootballMatchScheduleSpider._compute_current_odds(jd)]
+
+
+# 用例名 -> 准备函数，准备函数读取数据，返回被测函数，被测函数返回解析出的 items
+CASES = {
+    'betfair': case_betfair,
+    'betfair_detail': case_betfair_detail,
+    'betfair_detail.parse_columns': case_betfair_detail_columns,
+    'basketball_bet': case_basketball_bet,
+    'basketball_match_schedule': case_basketball_match_schedule,
+    'basketball_match_schedule._parse': case_basketball_match_schedule_parse,
+    'football_match_schedule': case_football_match_schedule,
+    'football_bet': case_football_bet,
+    'football_match': case_football_match,
+    'compute_current_odds': case_compute_current_odds,
+}
+
+
+def measure(func, min_time: float = 0.2, repeat: int = 5) -> dict:
+    """重复运行 `func`，每轮至少 `min_time` 秒，取最快一轮计算吞吐量。"""
+
+    item_num = len(func())  # 预热，同时得到每次的 item 数
+
+    # 估算每轮的调用次数
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+
+    per_call = best / number
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'items': item_num,
+        'ms_per_call': per_call * 1000,
+        'items_per_s': item_num / per_call,
+        'peak_kib': peak / 1024,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """返回 items/s 比基准下降超过 `threshold` 的用例名"""
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['items_per_s']
+        if result['items_per_s'] < old * (1 - threshold):
+            regressions.append(name)
+
+    return regressions
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='解析函数基准测试')
+    parser.add_argument('cases', nargs='*', help=f'要运行的用例，默认全部：{", ".join(CASES)}')
+    parser.add_argument('--min-time', type=float, default=0.2, help='每轮最少运行秒数')
+    parser.add_argument('--repeat', type=int, default=5, help='轮数，取最快一轮')
+    parser.add_argument('--save', help='把结果保存到这个 json 文件')
+    parser.add_argument('--baseline', help='与这个 json 文件中的结果比较')
+    parser.add_argument('--threshold', type=float, default=0.2, help='items/s 下降超过这个比例视为退化')
+    args = parser.parse_args()
+
+    names = args.cases or list(CASES)
+    for name in names:
+        if name not in CASES:
+            parser.error(f'没有用例 {name}')
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    print(f'{"case":<36}{"items":>8}{"ms/call":>12}{"items/s":>14}{"peak KiB":>12}{"vs base":>10}')
+
+    results = {}
+    for name in names:
+        result = measure(CASES[name](), args.min_time, args.repeat)
+        results[name] = result
+
+        change = ''
+        if name in baseline:
+            change = f'{result["items_per_s"] / baseline[name]["items_per_s"] - 1:+.1%}'
+        print(
+            f'{name:<36}{result["items"]:>8}{result["ms_per_call"]:>12.3f}'
+            f'{result["items_per_s"]:>14.0f}{result["peak_kib"]:>12.1f}{change:>10}'
+        )
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'python': sys.version.split()[0],
+                'results': results,
+            }, f, indent=2)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'吞吐量下降超过 {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
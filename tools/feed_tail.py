@@ -0,0 +1,43 @@
+"""读取变更流，每条输出一行 json，供下游调试或用管道接入其他程序。
+
+    python tools/feed_tail.py log/feed                   # 从头读到末尾后继续等待新的变更
+    python tools/feed_tail.py log/feed --offset 1000 --no-follow
+    python tools/feed_tail.py log/feed --table football_match
+
+下游程序应保存处理完的最后一个偏移量，重启后用 `FeedReader.tail(offset + 1)` 继续。
+"""
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crash.feed import FeedReader
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='读取变更流')
+    parser.add_argument('directory', help='变更流目录，即 config.FEED_PATH')
+    parser.add_argument('--offset', type=int, default=0, help='从这个偏移量开始')
+    parser.add_argument('--table', action='append', help='只输出这些表的变更，可多次指定')
+    parser.add_argument('--interval', type=float, default=0.2, help='读到末尾后检查新变更的间隔秒数')
+    parser.add_argument('--no-follow', action='store_true', help='读到末尾即退出')
+    args = parser.parse_args()
+
+    reader = FeedReader(args.directory)
+    interval = None if args.no_follow else args.interval
+
+    try:
+        for entry in reader.tail(args.offset, interval):
+            if args.table and entry['table'] not in args.table:
+                continue
+            print(json.dumps(entry, ensure_ascii=False), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
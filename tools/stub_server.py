@@ -0,0 +1,55 @@
+"""启动本地桩服务器，回放录制的 HTTP 响应。
+
+先在 config.py 中设置 HTTP_RECORD_PATH，正常运行爬虫录制；之后：
+
+    python tools/stub_server.py log/http_record.jsonl --port 8000 --latency 0.2 --reset-rate 0.05
+
+再把 config.py 中的 HTTP_BASE_URL 设为 'http://127.0.0.1:8000'，爬虫的请求都发到桩服务器。
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crash import log
+from crash.replay import StubServer, load_archive
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='回放录制的 HTTP 响应')
+    parser.add_argument('archive', help='录制的 json lines 文件')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help='每个响应的延迟秒数')
+    parser.add_argument('--jitter', type=float, default=0, help='延迟的随机浮动秒数')
+    parser.add_argument('--error-rate', type=float, default=0, help='返回错误状态码的比例')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--reset-rate', type=float, default=0, help='不响应直接断开连接的比例')
+    args = parser.parse_args()
+
+    archive = load_archive(args.archive)
+    server = StubServer(
+        archive,
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        reset_rate=args.reset_rate,
+        error_status=args.error_status,
+    )
+    log.logger.info(f'回放 {sum(len(v) for v in archive.values())} 个响应，地址 {server.base_url}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log.logger.info(f'请求统计 {server.stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""查看 Redis 任务队列的长度和各消费者的统计，或清空队列。
+
+    python tools/task_queue.py BetfairDetailSpider
+    python tools/task_queue.py BetfairDetailSpider --clear
+
+队列名为爬虫类名，Redis 地址取 config.REDIS_CONFIG。
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crash.redis_queue import RedisTaskQueue
+
+from config import REDIS_CONFIG
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='查看 Redis 任务队列')
+    parser.add_argument('name', help='队列名，即爬虫类名，如 BetfairDetailSpider')
+    parser.add_argument('--clear', action='store_true', help='删除队列的所有键')
+    args = parser.parse_args()
+
+    if REDIS_CONFIG is None:
+        parser.error('config.REDIS_CONFIG 未设置')
+
+    q = RedisTaskQueue(REDIS_CONFIG, args.name)
+    if args.clear:
+        q.clear()
+        return
+
+    print(f'待处理 {q.qsize()}，处理中 {q.inflight()}，超时重新入队 {q.expired()} 次')
+    print(f'{"worker":<32}{"done":>8}{"late":>6}{"busy s":>10}{"tasks/s":>10}')
+    for worker, s in q.stats().items():
+        print(
+            f'{worker:<32}{s.get("done", 0):>8.0f}{s.get("late", 0):>6.0f}'
+            f'{s.get("busy_seconds", 0):>10.1f}{s["tasks_per_s"]:>10.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()